@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qsl
+
+# Geometry type of the synthetic features per endpoint
+_GEOMETRY_TYPES = {'/sites': 'Point',
+                   '/locations': 'Point',
+                   '/regions': 'Polygon'}
+
+_DEFAULT_BBOX = (16.0, 47.8, 16.8, 48.4)
+
+
+class MockApi(object):
+    """
+    Local stand-in for the myfiber API, serving synthetic FeatureCollections.
+
+    Features are generated deterministically from the requested bbox, so
+    overlapping requests return the same features with the same ids.
+    """
+
+    def __init__(self,
+                 features=1000,
+                 latency=0.0,
+                 error_rate=0.0,
+                 paging=False,
+                 port=0):
+        """
+        :param features: Number of features per response, or in total when paging.
+        :type features: int
+
+        :param latency: Delay before every response, in seconds.
+        :type latency: float
+
+        :param error_rate: Share of requests answered with 503.
+        :type error_rate: float
+
+        :param paging: Honour limit/offset parameters.
+        :type paging: bool
+
+        :param port: Port to listen on, 0 for any free port.
+        :type port: int
+        """
+        self.features = features
+        self.latency = latency
+        self.error_rate = error_rate
+        self.paging = paging
+        self.requests = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+        self.server = _ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.api = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """
+        :rtype: str
+        """
+        return 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def start(self):
+        """Serves requests in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Shuts the server down."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def fail(self):
+        """
+        Decides whether the next request fails.
+
+        :rtype: bool
+        """
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.error_rate
+
+    def collection(self, path, params):
+        """
+        Builds the FeatureCollection of a request.
+
+        :param path: The endpoint, e.g. '/sites'.
+        :type path: str
+
+        :param params: Query parameters.
+        :type params: dict
+
+        :rtype: dict
+        """
+        bbox = _DEFAULT_BBOX
+        if params.get('bbox'):
+            bbox = tuple(float(coord) for coord in params['bbox'].split(','))
+
+        start, stop = 0, self.features
+        if self.paging and 'limit' in params:
+            start = int(params.get('offset', 0))
+            stop = min(self.features, start + int(params['limit']))
+
+        geometry_type = _GEOMETRY_TYPES.get(path, 'Point')
+        features = [synthetic_feature(index, bbox, geometry_type) for index in range(start, stop)]
+
+        return {'type': 'FeatureCollection',
+                'title': path.strip('/'),
+                'features': features}
+
+
+def synthetic_feature(index, bbox, geometry_type='Point'):
+    """
+    Creates the feature number index inside a bbox.
+
+    :param index: Number of the feature.
+    :type index: int
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: tuple of float
+
+    :param geometry_type: 'Point' or 'Polygon'.
+    :type geometry_type: str
+
+    :rtype: dict
+    """
+    rnd = random.Random(hash((index,) + tuple(bbox)))
+    x = bbox[0] + rnd.random() * (bbox[2] - bbox[0])
+    y = bbox[1] + rnd.random() * (bbox[3] - bbox[1])
+
+    if geometry_type == 'Polygon':
+        size = (bbox[2] - bbox[0]) / 100.0
+        ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+        geometry = {'type': 'Polygon', 'coordinates': [ring]}
+    else:
+        geometry = {'type': 'Point', 'coordinates': [x, y]}
+
+    return {'type': 'Feature',
+            'id': '{:.6f},{:.6f}'.format(x, y),
+            'geometry': geometry,
+            'properties': {'name': 'feature {}'.format(index),
+                           'status': rnd.choice(['planned', 'built', 'active']),
+                           'capacity': rnd.randint(1, 1000),
+                           'utilization': round(rnd.random(), 3),
+                           'active': rnd.random() < 0.5}}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        api = self.server.api
+        parts = urlsplit(self.path)
+
+        if api.latency:
+            time.sleep(api.latency)
+
+        if api.fail():
+            self._send(503, b'{"msg": "Service unavailable"}', {'Retry-After': '0'})
+            return
+
+        body = json.dumps(api.collection(parts.path, dict(parse_qsl(parts.query)))).encode('utf-8')
+        headers = {'Content-Type': 'application/geo+json'}
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+
+        self._send(200, body, headers)
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
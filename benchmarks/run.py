@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.mockserver import MockApi
+
+_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+_BBOX = (16.0, 47.8, 16.8, 48.4)
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile.
+
+    :param values: The samples.
+    :type values: list of float
+
+    :param fraction: e.g. 0.9 for the 90th percentile.
+    :type fraction: float
+
+    :rtype: float
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+
+    return ordered[index]
+
+
+def measure(func, repeat, warmup=1):
+    """
+    Times a function.
+
+    :param func: Called without arguments, returns the number of processed features.
+    :type func: callable
+
+    :param repeat: Number of timed runs.
+    :type repeat: int
+
+    :param warmup: Number of untimed runs before.
+    :type warmup: int
+
+    :returns: latency percentiles in seconds and throughput in features/s
+    :rtype: dict
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    features = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        features = func()
+        samples.append(time.perf_counter() - started)
+
+    return {'n': repeat,
+            'min': min(samples),
+            'p50': percentile(samples, 0.5),
+            'p90': percentile(samples, 0.9),
+            'p99': percentile(samples, 0.99),
+            'max': max(samples),
+            'mean': sum(samples) / len(samples),
+            'features': features,
+            'features_per_s': features / percentile(samples, 0.5) if features else None}
+
+
+def write_config(base_url, paging, columnar=False):
+    """
+    Writes a copy of the plugin config pointing at the mock API, without
+    the caches and the store, and activates it via MYFIBER_CONFIG.
+
+    :param base_url: URL of the mock API.
+    :type base_url: str
+
+    :param paging: Enable paging.
+    :type paging: bool
+
+    :param columnar: Enable the columnar table.
+    :type columnar: bool
+
+    :returns: path of the config
+    :rtype: str
+    """
+    from myfiber import CONFIG
+
+    with open(CONFIG) as f:
+        config = yaml.safe_load(f)
+
+    config['base_url'] = base_url
+    config['api_key'] = 'benchmark'
+    for section in ('cache', 'spatial_cache', 'store', 'tiling', 'instrumentation'):
+        config.setdefault(section, {})['enabled'] = False
+    config.setdefault('paging', {})['enabled'] = paging
+    config.setdefault('columnar', {})['enabled'] = columnar
+
+    handle, path = tempfile.mkstemp(prefix='myfiber-benchmark-', suffix='.yml')
+    with os.fdopen(handle, 'w') as f:
+        yaml.safe_dump(config, f)
+    os.environ['MYFIBER_CONFIG'] = path
+
+    return path
+
+
+def start_qgis():
+    """
+    Initializes QGIS without a display.
+
+    :rtype: QgsApplication
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    return app
+
+
+def run_benchmarks(repeat):
+    """
+    Runs all benchmarks against the configured API.
+
+    The lazy parser and the columnar table need NumPy, their benchmarks
+    are skipped without it. The columnar ones also need columnar to be
+    enabled in the config.
+
+    :param repeat: Number of timed runs per benchmark.
+    :type repeat: int
+
+    :rtype: dict
+    """
+    from qgis.core import QgsFeatureRequest
+
+    from myfiber.core import configmanager, geojson, layers
+    from myfiber.core.client import Client
+    from myfiber.core.request import RequestBuilder
+
+    has_numpy = geojson.np is not None
+    columnar = has_numpy and (configmanager.read().get('columnar') or {}).get('enabled')
+    if not has_numpy:
+        print("NumPy is not installed, skipping lazy_parse and the columnar benchmarks")
+
+    clnt = Client()
+    bbox = ','.join(str(coord) for coord in _BBOX)
+
+    def client_request():
+        return len(clnt.request('/sites', {'bbox': bbox})['features'])
+
+    def client_request_all():
+        return len(clnt.request_all('/sites', {'bbox': bbox})['features'])
+
+    def request_builder():
+        return len(RequestBuilder('/sites', _BBOX).build_request()['features'])
+
+    body = json.dumps(clnt.request_all('/sites', {'bbox': bbox})).encode('utf-8')
+    collection = json.loads(body)
+
+    def json_parse():
+        return len(json.loads(body)['features'])
+
+    def stream_parse():
+        chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)]
+        return sum(1 for _ in geojson.FeatureCollectionReader(chunks).features())
+
+    def lazy_parse():
+        chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)]
+        return sum(1 for _ in geojson.FeatureCollectionReader(chunks, lazy_geometry=True).features())
+
+    def layer_build():
+        return layers.build_memory_layer(geojson.StaticCollection(collection)).featureCount()
+
+    memory_layer = layers.build_memory_layer(geojson.StaticCollection(collection))
+    expression = '"status" = \'active\' AND "capacity" > 500'
+
+    def memory_filter():
+        return sum(1 for _ in memory_layer.getFeatures(QgsFeatureRequest().setFilterExpression(expression)))
+
+    benchmarks = [('client_request', client_request),
+                  ('client_request_all', client_request_all),
+                  ('request_builder', request_builder),
+                  ('json_parse', json_parse),
+                  ('stream_parse', stream_parse)]
+    if has_numpy:
+        benchmarks.append(('lazy_parse', lazy_parse))
+    benchmarks.extend([('layer_build', layer_build),
+                       ('memory_filter', memory_filter)])
+
+    if columnar:
+        from myfiber.core import columnarprovider
+
+        columnar_layer = columnarprovider.build_layer(geojson.StaticCollection(collection))
+
+        def columnar_build():
+            return columnarprovider.build_layer(geojson.StaticCollection(collection)).featureCount()
+
+        def columnar_filter():
+            return sum(1 for _ in columnar_layer.getFeatures(QgsFeatureRequest().setFilterExpression(expression)))
+
+        benchmarks.extend([('columnar_build', columnar_build),
+                           ('columnar_filter', columnar_filter)])
+
+    results = {}
+    for name, func in benchmarks:
+        results[name] = measure(func, repeat)
+        print("{:<20} p50 {:8.4f} s  p90 {:8.4f} s  p99 {:8.4f} s".format(name,
+                                                                       results[name]['p50'],
+                                                                       results[name]['p90'],
+                                                                       results[name]['p99']))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Finds the benchmarks whose median got slower than the baseline.
+
+    :param results: Results of this run.
+    :type results: dict
+
+    :param baseline: Saved results.
+    :type baseline: dict
+
+    :param tolerance: Allowed slowdown, e.g. 0.2 for 20 %.
+    :type tolerance: float
+
+    :returns: name, baseline and current median per regression
+    :rtype: list of (str, float, float)
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result['p50'] > baseline[name]['p50'] * (1 + tolerance):
+            regressions.append((name, baseline[name]['p50'], result['p50']))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the plugin against a local mock API.")
+    parser.add_argument('--features', type=int, default=5000, help="features per response")
+    parser.add_argument('--latency', type=float, default=0.0, help="server delay per request in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument('--paging', action='store_true', help="serve and request pages")
+    parser.add_argument('--columnar', action='store_true', help="benchmark the columnar table, needs NumPy")
+    parser.add_argument('--repeat', type=int, default=10, help="timed runs per benchmark")
+    parser.add_argument('--baseline', default=_BASELINE, help="baseline results file")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown of the medians")
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    app = start_qgis()
+
+    with MockApi(features=args.features,
+                 latency=args.latency,
+                 error_rate=args.error_rate,
+                 paging=args.paging) as api:
+        config_path = write_config(api.base_url, args.paging, args.columnar)
+        try:
+            results = run_benchmarks(args.repeat)
+        finally:
+            os.remove(config_path)
+
+    run = {'settings': {'features': args.features,
+                        'latency': args.latency,
+                        'error_rate': args.error_rate,
+                        'paging': args.paging,
+                        'columnar': args.columnar,
+                        'repeat': args.repeat},
+           'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != run['settings']:
+            # Medians of other settings tell nothing about a regression
+            print("Baseline was recorded with other settings, skipping the comparison: {}"
+                  .format(baseline['settings']))
+        else:
+            for name, before, after in compare(results, baseline['results'], args.tolerance):
+                print("REGRESSION {}: median {:.4f} s -> {:.4f} s".format(name, before, after))
+                status = 1
+
+    app.exitQgis()
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
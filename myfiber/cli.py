@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import os
+import sys
+
+from qgis.core import QgsApplication, QgsVectorLayer
+
+from myfiber.core import configmanager, exceptions, export
+
+
+def start_qgis():
+    """
+    Initializes QGIS without a display.
+
+    :rtype: QgsApplication
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    return app
+
+
+def resolve_endpoint(name, config):
+    """
+    Returns the URL of an endpoint given by its path or its key in the
+    apis section of the config, e.g. '/sites' or 'sites_radio'.
+
+    :param name: Path or key of the endpoint.
+    :type name: str
+
+    :param config: The plugin config.
+    :type config: dict
+
+    :rtype: str
+    """
+    apis = config.get('apis') or {}
+    if name in apis:
+        return apis[name]
+    if name.startswith('/'):
+        return name
+
+    raise ValueError("Unknown endpoint '{}', expected a path or one of {}".format(name, ', '.join(apis)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m myfiber.cli',
+                                     description="Downloads myfiber endpoints for several extents to files.")
+    parser.add_argument('endpoints', nargs='+', help="endpoint paths, e.g. /sites, or keys of the apis config")
+    parser.add_argument('--extent', action='append', default=[],
+                        help="xmin,ymin,xmax,ymax, repeatable or separated by semicolons")
+    parser.add_argument('--crs', default='EPSG:4326', help="CRS of the extents")
+    parser.add_argument('--regions', help="polygon layer, e.g. a GeoPackage, whose features' extents are downloaded")
+    parser.add_argument('--format', default=export.GEOJSON, choices=export.FORMATS,
+                        help="output format")
+    parser.add_argument('--parallel', type=int, default=4, help="concurrent downloads per endpoint")
+    parser.add_argument('--output', default='.', help="output directory, one file per endpoint")
+    parser.add_argument('--config', help="config file, overrides MYFIBER_CONFIG")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        os.environ['MYFIBER_CONFIG'] = os.path.abspath(args.config)
+
+    app = start_qgis()
+    try:
+        return _export(parser, args)
+    finally:
+        app.exitQgis()
+
+
+def _export(parser, args):
+    """Exports the endpoints of the parsed arguments, returns the exit status."""
+    extents = export.parse_extents(';'.join(args.extent), args.crs)
+    if args.regions:
+        regions = QgsVectorLayer(args.regions, 'regions', 'ogr')
+        if not regions.isValid():
+            parser.error("Can't open {}".format(args.regions))
+        extents.extend(export.region_extents(regions.getFeatures(), regions.crs()))
+    if not extents:
+        parser.error("No extents, pass --extent or --regions")
+
+    config = configmanager.read()
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    status = 0
+    for name in args.endpoints:
+        url = resolve_endpoint(name, config)
+        path = export.output_path(args.output, url, args.format)
+        try:
+            count = export.export(url, extents, path, args.format, args.parallel)
+        except (exceptions.ApiError, exceptions.Timeout, exceptions.StoreError) as e:
+            print("{}: {}".format(url, e), file=sys.stderr)
+            status = 1
+            continue
+        print("{}: {} features from {} extents written to {}".format(url, count, len(extents), path))
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
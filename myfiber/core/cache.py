@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os.path
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from qgis.core import QgsApplication
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'last_modified', 'stored_at', 'content_type'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def default_path():
+    """
+    Returns the cache location in the active QGIS profile.
+
+    :rtype: str
+    """
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'myfiber', 'cache.sqlite')
+
+
+class ResponseCache(object):
+    """
+    SQLite backed cache of raw response bodies, keyed by the full request URL.
+
+    Entries expire after a per-endpoint TTL, but are kept with their ETag and
+    Last-Modified validators so stale entries can be revalidated. When the
+    total size exceeds the cap, least recently used entries are evicted.
+    """
+
+    def __init__(self, path=None, max_size_mb=200, default_ttl=300, ttl=None):
+        """
+        :param path: Path to the SQLite file. Defaults to the QGIS profile dir.
+        :type path: str
+
+        :param max_size_mb: Size cap of all cached bodies in MB.
+        :type max_size_mb: int
+
+        :param default_ttl: Seconds an entry is fresh, if the endpoint has no TTL.
+        :type default_ttl: int
+
+        :param ttl: Seconds an entry is fresh, per endpoint, e.g. {'/sites': 600}.
+        :type ttl: dict
+        """
+        self.path = path or default_path()
+        self.max_size = max_size_mb * 1024 * 1024
+        self.default_ttl = default_ttl
+        self.ttl = ttl or {}
+        self._lock = threading.Lock()
+
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(responses)")]
+            if 'content_type' not in columns:
+                # Caches created before formats were negotiated
+                conn.execute("ALTER TABLE responses ADD COLUMN content_type TEXT")
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call, so the cache can be used from worker threads
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, url):
+        """
+        Looks up a cached response and marks it as recently used.
+
+        :param url: Full request URL, with a hash of the API key.
+        :type url: str
+
+        :rtype: CacheEntry or None
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT body, etag, last_modified, stored_at, content_type "
+                               "FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?",
+                         (time.time(), url))
+
+        return CacheEntry(*row)
+
+    def is_fresh(self, entry, path):
+        """
+        Checks whether an entry is younger than its endpoint's TTL.
+
+        :param entry: Cached entry.
+        :type entry: CacheEntry
+
+        :param path: The endpoint path, e.g. '/sites'.
+        :type path: str
+
+        :rtype: bool
+        """
+        ttl = self.ttl.get(path, self.default_ttl)
+
+        return time.time() - entry.stored_at < ttl
+
+    def put(self, url, body, etag=None, last_modified=None, content_type=None):
+        """
+        Stores a response body and evicts old entries if the size cap is hit.
+
+        :param url: Full request URL, with a hash of the API key.
+        :type url: str
+
+        :param body: Raw response body.
+        :type body: bytes
+
+        :param etag: ETag response header.
+        :type etag: str
+
+        :param last_modified: Last-Modified response header.
+        :type last_modified: str
+
+        :param content_type: Content-Type response header.
+        :type content_type: str
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses "
+                         "(url, body, etag, last_modified, content_type, stored_at, accessed_at, size) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (url, sqlite3.Binary(body), etag, last_modified, content_type,
+                          now, now, len(body)))
+            self._evict(conn)
+
+    def touch(self, url):
+        """
+        Marks an entry as fresh again, after the server answered 304.
+
+        :param url: Full request URL, with a hash of the API key.
+        :type url: str
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE url = ?",
+                         (now, now, url))
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def _evict(self, conn):
+        """Deletes least recently used entries until the size cap is met."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        rows = conn.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for url, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((url,))
+            total -= size
+
+        conn.executemany("DELETE FROM responses WHERE url = ?", evicted)
@@ -20,17 +20,56 @@ Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
  ***************************************************************************/
 """
 
+import copy
+import hashlib
 import requests
-from urllib.parse import urlencode
-from datetime import datetime, timedelta
+import json
+from urllib.parse import urlencode, urlsplit
+import threading
 import time
-import random
 
 from myfiber import __version__
-from . import configmanager, exceptions
+from . import cache, configmanager, exceptions, formats, instrumentation, paging, retry, tiling, transport
+
+try:
+    # The encodings urllib3 can decode here, e.g. br and zstd if brotli and
+    # zstandard are installed
+    from urllib3.util.request import ACCEPT_ENCODING as _ACCEPT_ENCODING
+except ImportError:
+    _ACCEPT_ENCODING = 'gzip,deflate'
 
 _USER_AGENT = "QGISClientv{}".format(__version__)
-_RETRIABLE_STATUSES = [503]
+_CHUNK_SIZE = 64 * 1024
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process wide client, creating it on first use.
+
+    The client and its connection pool are reused across dialog runs and
+    parallel fetches. It's only replaced when the API key or the base URL
+    change; other config changes are applied to the existing client.
+
+    :rtype: Client
+    """
+    global _client
+    base_params = configmanager.read()
+
+    with _client_lock:
+        if (_client is None
+                or _client.key != base_params['api_key']
+                or _client.base_url != base_params['base_url']):
+            if _client is not None:
+                _client.session.close()
+            _client = Client()
+        elif _client.base_params != base_params:
+            _client.configure(base_params)
+
+    return _client
 
 
 class Client(object):
@@ -43,7 +82,8 @@ class Client(object):
         :type iface: QgisInterface
 
         :param retry_timeout: Timeout across multiple retriable requests, in
-            seconds.
+            seconds. A timeout in the retry section of the config takes
+            precedence.
         :type retry_timeout: int
         """
 
@@ -51,94 +91,330 @@ class Client(object):
 
         self.key = base_params['api_key']
         self.base_url = base_params['base_url']
+        self.retry_timeout = retry_timeout
 
         self.session = requests.Session()
 
-        self.retry_timeout = timedelta(seconds=retry_timeout)
+        # Connections are kept alive and reused, the pool has to be large
+        # enough for all parallel tile and page requests.
+        pool_params = base_params.get('pool') or {}
+        adapter = instrumentation.TimedHTTPAdapter(pool_connections=pool_params.get('connections', 4),
+                                                   pool_maxsize=pool_params.get('maxsize', 16),
+                                                   pool_block=pool_params.get('block', True),
+                                                   max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
         self.requests_kwargs = dict()
         self.requests_kwargs.update({
             "headers": {"User-Agent": _USER_AGENT,
-                        'Accept': 'application/geo+json',
+                        'Accept': formats.GEOJSON,
+                        'Accept-Encoding': _ACCEPT_ENCODING,
                         'X-API-KEY': self.key}
         })
 
+        self.configure(base_params)
+
+    def configure(self, base_params):
+        """
+        Applies the settings besides API key and base URL.
+
+        :param base_params: The plugin config.
+        :type base_params: dict
+        """
+        self.base_params = base_params
+
+        self.paging = base_params.get('paging') or {}
+        self.transport = base_params.get('transport') or {}
+        self.formats = base_params.get('formats') or [formats.GEOJSON]
+
+        cache_params = base_params.get('cache') or {}
+        self.cache = None
+        if cache_params.get('enabled'):
+            self.cache = cache.ResponseCache(path=cache_params.get('path'),
+                                             max_size_mb=cache_params.get('max_size_mb', 200),
+                                             default_ttl=cache_params.get('default_ttl', 300),
+                                             ttl=cache_params.get('ttl'))
+
+        self.retry_policy = retry.RetryPolicy.from_config(base_params.get('retry') or {},
+                                                          timeout=self.retry_timeout)
+
+    def uncached(self):
+        """
+        Returns a client sharing this one's session and settings, but
+        without the response cache. Its responses reflect the current state
+        of the server.
+
+        :rtype: Client
+        """
+        clnt = copy.copy(self)
+        clnt.cache = None
+
+        return clnt
+
     def request(self,
                 url,
                 params=None,
-                first_request_time=None,
-                retry_counter=0):
+                feedback=None,
+                stream=False):
         """Performs HTTP GET, returning the body
         JSON.
 
+        Failed attempts are retried in a loop as the client's retry policy
+        allows, see :class:`myfiber.core.retry.RetryPolicy`. This includes
+        errors while the body downloads, except for streamed bodies, whose
+        chunks are handed out as they arrive. The request is
+        reported to the hooks and the active trace of
+        :mod:`myfiber.core.instrumentation`.
+
         :param url: URL extension for request. Should begin with a slash.
         :type url: string
 
         :param params: HTTP GET parameters.
         :type params: dict or list of key/value tuples
 
-        :param first_request_time: The time of the first request (None if no
-            retries have occurred).
-        :type first_request_time: datetime.datetime
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
 
-        :param retry_counter: The number of this retry, or zero for first attempt.
-        :type retry_counter: int
+        :param stream: Return the raw body as chunks while it downloads,
+            instead of the parsed JSON. Streamed requests negotiate the
+            formats of the config, e.g. GeoJSON text sequences.
+        :type stream: bool
 
         :raises ApiError: when the API returns an error.
         :raises Timeout: if the request timed out.
+        :raises Canceled: if the feedback was canceled.
 
-        :rtype: dict from JSON response.
+        :rtype: dict from JSON response, or StreamedBody when streaming.
         """
 
-        if not first_request_time:
-            first_request_time = datetime.now()
-
-        elapsed = datetime.now() - first_request_time
-        if elapsed > self.retry_timeout:
-            raise exceptions.Timeout()
-
-        if retry_counter > 0:
-            # 0.5 * (1.5 ^ i) is an increased sleep time of 1.5x per iteration,
-            # starting at 0.5s when retry_counter=1. The first retry will occur
-            # at 1, so subtract that first.
-            delay_seconds = 1.5 ** (retry_counter - 1)
-
-            # Jitter this value by 50% and pause.
-            time.sleep(delay_seconds * (random.random() + 0.5))
+        _check_canceled(feedback)
+        instrumentation.before_request(url, params)
+        started = time.time()
 
         authed_url = self._generate_auth_url(url,
                                              params,
                                              )
 
+        # Serve fresh entries from the cache, revalidate stale ones
+        cache_key = self._cache_key(authed_url)
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None and self.cache.is_fresh(cached, url):
+                _report(authed_url, started, 200, cached=True, size=len(cached.body))
+                return self._from_cache(cached, stream)
+
         final_requests_kwargs = dict(self.requests_kwargs)
+        if cached is not None:
+            final_requests_kwargs['headers'] = self._conditional_headers(cached)
+        else:
+            final_requests_kwargs['headers'] = dict(self.requests_kwargs['headers'])
+        if stream:
+            final_requests_kwargs['headers']['Accept'] = formats.accept_header(self.formats)
+        # The body is read separately, so download and time to first byte
+        # can be told apart
+        final_requests_kwargs['stream'] = True
 
         requests_method = self.session.get
 
-        print("url:\n{}\nParameters:\n{}".format(self.base_url + authed_url,
-                                                 final_requests_kwargs))
+        attempts = self.retry_policy.start(urlsplit(self.base_url).netloc)
+        while True:
+            _check_canceled(feedback)
+
+            try:
+                with instrumentation.phase('ttfb'):
+                    response = requests_method(self.base_url + authed_url,
+                                               **final_requests_kwargs)
+                delay = attempts.next_delay(response) if attempts.retry_status(response.status_code) else None
+                if delay is None and not (stream and response.status_code == 200):
+                    # Read within the attempt, so a connection dropping while
+                    # the body downloads is retried as well
+                    with instrumentation.phase('download'):
+                        response.content
+            except Exception as e:
+                if not attempts.retry_exception(e):
+                    if isinstance(e, requests.exceptions.Timeout):
+                        raise exceptions.Timeout()
+                    raise
+                delay = attempts.next_delay()
+                if delay is None:
+                    raise
+                instrumentation.log('Connection failed: {}. Retrying for the {}th time.'.format(e, attempts.retries))
+                _sleep(delay, feedback)
+                continue
+
+            if delay is None:
+                # Done, or the retries are used up and the last error is reported
+                break
+            instrumentation.log('Server responded {}. Retrying for the {}th time.'.format(response.status_code,
+                                                                                        attempts.retries))
+            response.close()
+            _sleep(delay, feedback)
+
+        _check_canceled(feedback)
+
+        if response.status_code == 304 and cached is not None:
+            response.close()
+            self.cache.touch(cache_key)
+            _report(authed_url, started, 304, attempts.retries, cached=True, size=len(cached.body))
+            return self._from_cache(cached, stream)
+
+        if stream and response.status_code == 200:
+            _report(authed_url, started, 200, attempts.retries)
+            return StreamedBody(self._iter_body(response, cache_key, feedback),
+                                response.headers.get('Content-Type'))
+
+        content = response.content
+        instrumentation.count('bytes_wire', response.raw.tell())
+        instrumentation.count('bytes_decoded', len(content))
+        _report(authed_url, started, response.status_code, attempts.retries, size=len(content))
+
+        result = self._get_body(response)
+        if self.cache is not None:
+            self.cache.put(cache_key,
+                           response.content,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'),
+                           content_type=response.headers.get('Content-Type'))
+        return result
+
+    def head(self, url, params=None, feedback=None):
+        """Performs HTTP HEAD, returning the response headers.
+
+        HEAD requests aren't cached or retried.
 
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: string
+
+        :param params: HTTP GET parameters.
+        :type params: dict
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :raises Timeout: if the request timed out.
+        :raises Canceled: if the feedback was canceled.
+
+        :returns: the headers, None if the API doesn't answer HEAD requests
+        :rtype: requests.structures.CaseInsensitiveDict
+        """
+        _check_canceled(feedback)
+        instrumentation.before_request(url, params)
+        started = time.time()
+
+        authed_url = self._generate_auth_url(url, params)
         try:
-            response = requests_method(self.base_url + authed_url,
-                                       **final_requests_kwargs)
+            response = self.session.head(self.base_url + authed_url, **self.requests_kwargs)
         except requests.exceptions.Timeout:
             raise exceptions.Timeout()
-        except Exception:
-            raise
 
-        if response.status_code in _RETRIABLE_STATUSES:
-            # Retry request.
-            print('Server down.\nRetrying for the {}th time.'.format(retry_counter + 1))
+        _report(authed_url, started, response.status_code)
+        if response.status_code != 200:
+            return None
 
-            return self.request(url, params, first_request_time,
-                                retry_counter + 1)
+        return response.headers
 
-        try:
-            result = self._get_body(response)
-            return result
-        except exceptions.RetriableRequest as e:
-            return self.request(url, params, first_request_time,
-                                retry_counter + 1)
-        except Exception:
-            raise
+    def paginate(self, url, params=None, feedback=None, metadata=None):
+        """Yields the features of all pages of a paged endpoint, in order.
+
+        The next pages are prefetched concurrently, see
+        :func:`myfiber.core.paging.iter_pages`. Features repeated on
+        several pages are only yielded once.
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: string
+
+        :param params: HTTP GET parameters.
+        :type params: dict
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :param metadata: Filled with the members of the first page besides
+            the features, e.g. 'title'.
+        :type metadata: dict
+
+        :rtype: generator of dict
+        """
+        merger = tiling.FeatureMerger()
+
+        for page_number, page in enumerate(paging.iter_pages(self, url, params, self.paging, feedback)):
+            if page_number == 0 and metadata is not None:
+                metadata.update({key: value for key, value in page.items()
+                                 if key not in ('features', 'links', 'next')})
+            for feature in merger.merge(page.get('features', [])):
+                yield feature
+
+    def request_all(self, url, params=None, feedback=None):
+        """Performs HTTP GET, returning the body JSON with the features of
+        all pages if paging is enabled in the config.
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: string
+
+        :param params: HTTP GET parameters.
+        :type params: dict
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :rtype: dict from JSON response.
+        """
+        if not self.paging.get('enabled'):
+            return self.request(url, params, feedback=feedback)
+
+        collection = {}
+        collection['features'] = list(self.paginate(url, params, feedback, collection))
+
+        return collection
+
+    def iter_many(self, jobs, max_concurrency=None, feedback=None):
+        """Performs several HTTP GETs concurrently, yielding the responses
+        as they complete.
+
+        See :func:`myfiber.core.transport.fetch_many`.
+
+        :param jobs: URL extension and HTTP GET parameters per request.
+        :type jobs: list of (str, dict)
+
+        :param max_concurrency: Number of concurrent requests. Defaults to
+            the transport section of the config.
+        :type max_concurrency: int
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :returns: index of the job and its response
+        :rtype: generator of (int, dict)
+        """
+        return transport.fetch_many(self,
+                                    jobs,
+                                    max_concurrency or self.transport.get('max_concurrency', 4),
+                                    feedback=feedback,
+                                    use_async=self.transport.get('asyncio', True))
+
+    def request_many(self, jobs, max_concurrency=None, feedback=None):
+        """Performs several HTTP GETs concurrently.
+
+        :param jobs: URL extension and HTTP GET parameters per request.
+        :type jobs: list of (str, dict)
+
+        :param max_concurrency: Number of concurrent requests. Defaults to
+            the transport section of the config.
+        :type max_concurrency: int
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :returns: the responses in the order of the jobs
+        :rtype: list of dict
+        """
+        responses = [None] * len(jobs)
+        for index, response in self.iter_many(jobs, max_concurrency, feedback):
+            responses[index] = response
+
+        return responses
 
     @staticmethod
     def _get_body(response):
@@ -148,16 +424,134 @@ class Client(object):
         :param response: The HTTP response of the request.
         :type response: JSON object
 
+        :raises ApiError: if the status isn't 200.
+
         :rtype: dict from JSON
         """
-        body = response.json()
         status_code = response.status_code
 
         if status_code != 200:
-            raise exceptions.ApiError(status_code,
-                                      body['msg'])
+            try:
+                message = response.json()['msg']
+            except (ValueError, KeyError, TypeError):
+                # e.g. an HTML error page of a gateway
+                message = response.text[:200]
+            raise exceptions.ApiError(status_code, message)
+
+        with instrumentation.phase('parse'):
+            return response.json()
+
+    def _iter_body(self, response, cache_url, feedback=None):
+        """
+        Yields the body of a streamed response and reports the download
+        progress. The complete body is stored in the cache at the end,
+        unless it's larger than the cache can hold.
+
+        :param response: The streamed HTTP response.
+        :type response: requests.Response
+
+        :param cache_url: The cache key, see _cache_key().
+        :type cache_url: string
+
+        :param feedback: Optional feedback object for progress and cancellation.
+        :type feedback: QgsFeedback
+
+        :rtype: generator of bytes
+        """
+        total = int(response.headers.get('Content-Length') or 0)
+        cache_chunks = [] if self.cache is not None else None
+        cache_bytes = 0
+        chunks = response.iter_content(chunk_size=_CHUNK_SIZE)
+
+        try:
+            while True:
+                # Only the wait for the next chunk counts as download, not
+                # the consumer's parsing in between
+                with instrumentation.phase('download'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                _check_canceled(feedback)
+                instrumentation.count('bytes_decoded', len(chunk))
+                if cache_chunks is not None:
+                    cache_bytes += len(chunk)
+                    if cache_bytes > self.cache.max_size:
+                        # It would evict itself right away
+                        cache_chunks = None
+                    else:
+                        cache_chunks.append(chunk)
+                if total and feedback is not None:
+                    # Content-Length counts the bytes on the wire
+                    feedback.setProgress(min(100.0, 100.0 * response.raw.tell() / total))
+                yield chunk
+            instrumentation.count('bytes_wire', response.raw.tell())
+        finally:
+            response.close()
+
+        if cache_chunks is not None:
+            self.cache.put(cache_url,
+                           b''.join(cache_chunks),
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'),
+                           content_type=response.headers.get('Content-Type'))
+
+    @staticmethod
+    def _from_cache(cached, stream=False):
+        """
+        Returns a cached body like a fresh response.
+
+        :param cached: Cache entry.
+        :type cached: myfiber.core.cache.CacheEntry
+
+        :param stream: Return the body as chunks instead of the parsed JSON.
+        :type stream: bool
+
+        :rtype: dict from JSON, or StreamedBody when streaming.
+        """
+        body = bytes(cached.body)
+        chunks = StreamedBody((body[i:i + _CHUNK_SIZE] for i in range(0, len(body), _CHUNK_SIZE)),
+                              cached.content_type)
+        if stream:
+            return chunks
+
+        with instrumentation.phase('parse'):
+            if formats.media_type(cached.content_type) in (formats.GEOJSON_SEQ, formats.FLATGEOBUF):
+                # Stored by a streamed request, which negotiated another format
+                return formats.to_dict(chunks)
+
+            return json.loads(body)
+
+    def _conditional_headers(self, cached):
+        """
+        Adds the validators of a stale cache entry to the request headers.
 
-        return body
+        :param cached: Stale cache entry.
+        :type cached: myfiber.core.cache.CacheEntry
+
+        :rtype: dict
+        """
+        headers = dict(self.requests_kwargs['headers'])
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+        return headers
+
+    def _cache_key(self, authed_url):
+        """
+        Returns the key a response is cached under: the full URL and a hash
+        of the API key. The API key is sent as header, so the URL alone would
+        serve responses of another key.
+
+        :param authed_url: Path and query string of the request.
+        :type authed_url: str
+
+        :rtype: str
+        """
+        key_hash = hashlib.sha256((self.key or '').encode('utf-8')).hexdigest()[:16]
+
+        return '{}{}#key={}'.format(self.base_url, authed_url, key_hash)
 
     def _generate_auth_url(self, path, params):
         """Returns the path and query string portion of the request URL, first
@@ -181,6 +575,81 @@ class Client(object):
             return path
 
 
+class StreamedBody(object):
+    """The chunks of a streamed response body, with its Content-Type."""
+
+    def __init__(self, chunks, content_type=None):
+        """
+        :param chunks: The raw body.
+        :type chunks: iterable of bytes
+
+        :param content_type: Content-Type header of the response.
+        :type content_type: str
+        """
+        self.chunks = chunks
+        self.content_type = content_type
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def _report(authed_url, started, status, retries=0, cached=False, size=None):
+    """Hands a finished request to the instrumentation.
+
+    :param authed_url: Path and query string of the request.
+    :type authed_url: str
+
+    :param started: When the request started, as returned by time.time().
+    :type started: float
+
+    :param status: HTTP status code.
+    :type status: int
+
+    :param retries: Number of retries.
+    :type retries: int
+
+    :param cached: Whether the body came from the response cache.
+    :type cached: bool
+
+    :param size: Body size in bytes, None for streamed bodies.
+    :type size: int
+    """
+    instrumentation.after_request({'url': authed_url,
+                                   'status': status,
+                                   'seconds': time.time() - started,
+                                   'retries': retries,
+                                   'cached': cached,
+                                   'bytes': size})
+
+
+def _check_canceled(feedback):
+    """Raises Canceled if the feedback object was canceled.
+
+    :param feedback: Feedback object or None.
+    :type feedback: QgsFeedback
+    """
+    if feedback is not None and feedback.isCanceled():
+        raise exceptions.Canceled()
+
+
+def _sleep(seconds, feedback=None):
+    """Sleeps in small steps, so a canceled feedback interrupts the pause.
+
+    :param seconds: Total time to sleep.
+    :type seconds: float
+
+    :param feedback: Feedback object or None.
+    :type feedback: QgsFeedback
+    """
+    deadline = time.time() + seconds
+    while True:
+        _check_canceled(feedback)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 0.1))
+
+
 def _urlencode_params(params):
     """URL encodes the parameters.
 
@@ -0,0 +1,628 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import operator
+import struct
+from array import array
+
+import numpy as np
+
+from qgis.core import (QgsExpression,
+                       QgsExpressionContext,
+                       QgsExpressionNode,
+                       QgsExpressionNodeBinaryOperator,
+                       QgsFeature,
+                       QgsFields,
+                       QgsGeometry
+                       )
+
+from . import exceptions, layers
+from .geojson import RawGeometry
+from .tiling import feature_key
+
+# WKB geometry types
+_POINT = 1
+_LINESTRING = 2
+_POLYGON = 3
+_MULTIPOINT = 4
+_MULTILINESTRING = 5
+_MULTIPOLYGON = 6
+
+_GEOMETRY_TYPES = {'Point': _POINT,
+                   'LineString': _LINESTRING,
+                   'Polygon': _POLYGON,
+                   'MultiPoint': _MULTIPOINT,
+                   'MultiLineString': _MULTILINESTRING,
+                   'MultiPolygon': _MULTIPOLYGON}
+
+_TYPE_NAMES = {code: name for name, code in _GEOMETRY_TYPES.items()}
+
+_SINGLE_TYPES = {_MULTIPOINT: _POINT,
+                 _MULTILINESTRING: _LINESTRING,
+                 _MULTIPOLYGON: _POLYGON}
+
+# Work on scalars and element-wise on arrays alike
+_COMPARISONS = {QgsExpressionNodeBinaryOperator.boEQ: operator.eq,
+                QgsExpressionNodeBinaryOperator.boNE: operator.ne,
+                QgsExpressionNodeBinaryOperator.boGT: operator.gt,
+                QgsExpressionNodeBinaryOperator.boGE: operator.ge,
+                QgsExpressionNodeBinaryOperator.boLT: operator.lt,
+                QgsExpressionNodeBinaryOperator.boLE: operator.le}
+
+
+class Column(object):
+    """
+    Values of one property for all features.
+
+    Numbers and booleans are NumPy arrays with a validity mask for nulls.
+    Strings are dictionary encoded: an int32 code per feature, -1 for null,
+    indexing the distinct values in categories.
+    """
+
+    def __init__(self, name, kind, values, valid, categories=None):
+        """
+        :param name: The property name.
+        :type name: str
+
+        :param kind: 'bool', 'int', 'float' or 'str'.
+        :type kind: str
+
+        :param values: Values, or codes for strings.
+        :type values: numpy.ndarray
+
+        :param valid: False for null values.
+        :type valid: numpy.ndarray
+
+        :param categories: Distinct values of a string column.
+        :type categories: list of str
+        """
+        self.name = name
+        self.kind = kind
+        self.values = values
+        self.valid = valid
+        self.categories = categories
+
+    def value(self, index):
+        """
+        Returns the value of a feature as Python object.
+
+        :param index: Index of the feature.
+        :type index: int
+
+        :rtype: bool or int or float or str or None
+        """
+        if not self.valid[index]:
+            return None
+        if self.kind == 'str':
+            return self.categories[self.values[index]]
+
+        return self.values[index].item()
+
+    def unique(self):
+        """
+        Returns the distinct non-null values.
+
+        :rtype: list
+        """
+        if self.kind == 'str':
+            return [self.categories[code] for code in np.unique(self.values[self.valid])]
+
+        return np.unique(self.values[self.valid]).tolist()
+
+
+class ColumnarTable(object):
+    """
+    Features of a FeatureCollection in columnar form.
+
+    Properties are stored as :class:`Column`. Geometries are packed into one
+    coordinate buffer with offsets, like GeoArrow: every geometry is a list
+    of parts, every part a list of rings, every ring a range of coordinates.
+    Points and lines have a single ring per part. Features are only turned
+    into QgsGeometry or Python values when they are read.
+    """
+
+    def __init__(self, keys, columns, geometry_types, feature_offsets, part_offsets, ring_offsets, coords,
+                 metadata=None):
+        self.keys = keys
+        self.columns = columns
+        self.geometry_types = geometry_types
+        self.feature_offsets = feature_offsets
+        self.part_offsets = part_offsets
+        self.ring_offsets = ring_offsets
+        self.coords = coords
+        self.metadata = metadata or {}
+        self.bboxes = self._bboxes()
+
+    def __len__(self):
+        return len(self.geometry_types)
+
+    @classmethod
+    def from_features(cls, features, batch_size=1000, feedback=None, metadata=None):
+        """
+        Builds the table from GeoJSON features.
+
+        :param features: GeoJSON features, e.g. collection.features().
+        :type features: iterable of dict
+
+        :param batch_size: Features between two cancellation checks.
+        :type batch_size: int
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :param metadata: Members of the collection other than the features.
+        :type metadata: dict
+
+        :rtype: ColumnarTable
+        """
+        builder = _TableBuilder()
+        for count, feature in enumerate(features, 1):
+            builder.add(feature)
+            if count % batch_size == 0 and feedback is not None and feedback.isCanceled():
+                raise exceptions.Canceled()
+
+        return builder.build(metadata)
+
+    def layer_type(self):
+        """
+        Returns the layer geometry type, see :func:`myfiber.core.layers.layer_type`.
+
+        :returns: WKB type name, e.g. 'MultiPolygon', or 'None'
+        :rtype: str
+        """
+        present = self.geometry_types[self.geometry_types > 0]
+        if not len(present):
+            return 'None'
+
+        return layers.layer_type([{'geometry': {'type': _TYPE_NAMES[int(present[0])]}}])
+
+    def column(self, name):
+        """
+        :param name: The property name.
+        :type name: str
+
+        :rtype: Column
+        """
+        return self.columns[name]
+
+    def select(self, expression):
+        """
+        Returns the indices of the features matching a QGIS expression.
+
+        Comparisons, IN, IS NULL, AND, OR and NOT over properties and
+        literals are evaluated on whole columns. Other expressions are
+        evaluated feature by feature.
+
+        :param expression: e.g. "status" = 'active' AND "provider" IN ('a', 'b')
+        :type expression: str or QgsExpression
+
+        :raises ValueError: if the expression is invalid.
+
+        :rtype: numpy.ndarray
+        """
+        mask = self.mask(expression)
+        if mask is None:
+            mask = self._evaluate(expression)
+
+        return np.flatnonzero(mask)
+
+    def mask(self, expression):
+        """
+        Evaluates a QGIS expression on whole columns.
+
+        :param expression: The filter.
+        :type expression: str or QgsExpression
+
+        :raises ValueError: if the expression is invalid.
+
+        :returns: True per matching feature, None if the expression can't
+            be evaluated on columns
+        :rtype: numpy.ndarray
+        """
+        if not isinstance(expression, QgsExpression):
+            expression = QgsExpression(expression)
+        if expression.hasParserError():
+            raise ValueError(expression.parserErrorString())
+
+        result = self._compile(expression.rootNode())
+        if result is None:
+            return None
+
+        values, valid = result
+        return values & valid
+
+    def intersecting(self, rect):
+        """
+        Returns the indices of the features whose bbox intersects a rectangle.
+
+        :param rect: The rectangle, in EPSG:4326.
+        :type rect: QgsRectangle
+
+        :rtype: numpy.ndarray
+        """
+        bboxes = self.bboxes
+        return np.flatnonzero((bboxes[:, 0] <= rect.xMaximum()) & (bboxes[:, 2] >= rect.xMinimum()) &
+                              (bboxes[:, 1] <= rect.yMaximum()) & (bboxes[:, 3] >= rect.yMinimum()))
+
+    def attributes(self, index, names):
+        """
+        Returns the values of a feature.
+
+        :param index: Index of the feature.
+        :type index: int
+
+        :param names: The properties, in order.
+        :type names: list of str
+
+        :rtype: list
+        """
+        return [self.columns[name].value(index) for name in names]
+
+    def geometry(self, index):
+        """
+        Decodes the geometry of a feature.
+
+        :param index: Index of the feature.
+        :type index: int
+
+        :returns: the geometry, empty for features without one
+        :rtype: QgsGeometry
+        """
+        if not self.geometry_types[index]:
+            return QgsGeometry()
+
+        geometry = QgsGeometry()
+        geometry.fromWkb(self.wkb(index))
+
+        return geometry
+
+    def wkb(self, index):
+        """
+        Encodes the geometry of a feature as WKB, straight from the buffer.
+
+        :param index: Index of the feature.
+        :type index: int
+
+        :rtype: bytes
+        """
+        geometry_type = int(self.geometry_types[index])
+        parts = range(self.feature_offsets[index], self.feature_offsets[index + 1])
+
+        if geometry_type in _SINGLE_TYPES:
+            single_type = _SINGLE_TYPES[geometry_type]
+            return b''.join([struct.pack('<BII', 1, geometry_type, len(parts))] +
+                            [self._part_wkb(single_type, part) for part in parts])
+
+        return self._part_wkb(geometry_type, parts[0])
+
+    def _part_wkb(self, geometry_type, part):
+        rings = range(self.part_offsets[part], self.part_offsets[part + 1])
+        if geometry_type == _POINT:
+            start = self.ring_offsets[rings[0]]
+            return struct.pack('<BI', 1, _POINT) + self.coords[start:start + 1].tobytes()
+
+        chunks = [struct.pack('<BI', 1, geometry_type)]
+        if geometry_type == _POLYGON:
+            chunks.append(struct.pack('<I', len(rings)))
+        for ring in rings:
+            start, end = self.ring_offsets[ring], self.ring_offsets[ring + 1]
+            chunks.append(struct.pack('<I', end - start))
+            chunks.append(self.coords[start:end].tobytes())
+
+        return b''.join(chunks)
+
+    def _bboxes(self):
+        """Computes the bbox of every feature at once, NaN for features without geometry."""
+        bboxes = np.full((len(self), 4), np.nan)
+        if not len(self.coords):
+            return bboxes
+
+        # First coordinate of every feature
+        starts = self.ring_offsets[self.part_offsets[self.feature_offsets]]
+        has_coords = starts[1:] > starts[:-1]
+        first = starts[:-1][has_coords]
+
+        x = self.coords[:, 0]
+        y = self.coords[:, 1]
+        bboxes[has_coords, 0] = np.minimum.reduceat(x, first)
+        bboxes[has_coords, 1] = np.minimum.reduceat(y, first)
+        bboxes[has_coords, 2] = np.maximum.reduceat(x, first)
+        bboxes[has_coords, 3] = np.maximum.reduceat(y, first)
+
+        return bboxes
+
+    def _evaluate(self, expression):
+        """Evaluates an expression feature by feature."""
+        if not isinstance(expression, QgsExpression):
+            expression = QgsExpression(expression)
+        fields = QgsFields()
+        for name, column in self.columns.items():
+            fields.append(layers.make_field(name, column.kind))
+        names = list(self.columns)
+        context = QgsExpressionContext()
+        context.setFields(fields)
+        expression.prepare(context)
+
+        mask = np.zeros(len(self), dtype=bool)
+        feature = QgsFeature(fields)
+        for index in range(len(self)):
+            feature.setAttributes(self.attributes(index, names))
+            if expression.needsGeometry():
+                feature.setGeometry(self.geometry(index))
+            context.setFeature(feature)
+            mask[index] = bool(expression.evaluate(context))
+
+        return mask
+
+    def _compile(self, node):
+        """
+        Evaluates an expression node on whole columns.
+
+        Nulls follow SQL: comparisons with null are unknown, so the result
+        is a pair of values and a validity mask.
+
+        :returns: (values, valid) boolean arrays, None if unsupported
+        :rtype: tuple
+        """
+        node_type = node.nodeType()
+
+        if node_type == QgsExpressionNode.ntUnaryOperator:
+            operand = self._compile(node.operand())
+            if operand is None or node.op() != node.uoNot:
+                return None
+            return ~operand[0], operand[1]
+
+        if node_type == QgsExpressionNode.ntInOperator:
+            column = self._column_ref(node.node())
+            literals = [self._literal(item) for item in node.list().list()]
+            if column is None or any(literal is _UNSUPPORTED for literal in literals):
+                return None
+            values = self._isin(column, [literal for literal in literals if literal is not None])
+            if values is None:
+                return None
+            if node.isNotIn():
+                values = ~values
+            return values, column.valid.copy()
+
+        if node_type != QgsExpressionNode.ntBinaryOperator:
+            return None
+
+        op = node.op()
+        if op in (node.boAnd, node.boOr):
+            left = self._compile(node.opLeft())
+            right = self._compile(node.opRight())
+            if left is None or right is None:
+                return None
+            (left_values, left_valid), (right_values, right_valid) = left, right
+            if op == node.boAnd:
+                values = left_values & right_values
+                # False AND unknown is false
+                valid = ((left_valid & right_valid) |
+                         (left_valid & ~left_values) |
+                         (right_valid & ~right_values))
+            else:
+                values = left_values | right_values
+                # True OR unknown is true
+                valid = ((left_valid & right_valid) |
+                         (left_valid & left_values) |
+                         (right_valid & right_values))
+            return values & valid, valid
+
+        column = self._column_ref(node.opLeft())
+        literal = self._literal(node.opRight())
+        if column is None or literal is _UNSUPPORTED:
+            return None
+
+        if op in (node.boIs, node.boIsNot) and literal is None:
+            everything = np.ones(len(self), dtype=bool)
+            return (~column.valid if op == node.boIs else column.valid.copy()), everything
+
+        if op not in _COMPARISONS or literal is None:
+            return None
+
+        values = self._compare(column, _COMPARISONS[op], literal)
+        if values is None:
+            return None
+
+        return values, column.valid.copy()
+
+    def _column_ref(self, node):
+        if node.nodeType() == QgsExpressionNode.ntColumnRef:
+            return self.columns.get(node.name())
+
+        return None
+
+    def _literal(self, node):
+        if node.nodeType() != QgsExpressionNode.ntLiteral:
+            return _UNSUPPORTED
+
+        value = node.value()
+        # NULL literals come back as None or as null QVariant
+        if value is None or (hasattr(value, 'isNull') and value.isNull()):
+            return None
+
+        return value
+
+    def _compare(self, column, comparison, literal):
+        """Compares a column with a literal, None if their types don't match."""
+        if column.kind == 'str':
+            if not isinstance(literal, str):
+                return None
+            # Compare the few distinct values, then look up every feature's result
+            matches = np.array([comparison(category, literal) for category in column.categories] + [False],
+                               dtype=bool)
+            return matches[column.values]
+
+        if isinstance(literal, bool) or not isinstance(literal, (int, float)):
+            return None
+
+        return comparison(column.values, literal)
+
+    def _isin(self, column, literals):
+        if column.kind == 'str':
+            if not all(isinstance(literal, str) for literal in literals):
+                return None
+            wanted = set(literals)
+            matches = np.array([category in wanted for category in column.categories] + [False], dtype=bool)
+            return matches[column.values]
+
+        if not all(isinstance(literal, (int, float)) and not isinstance(literal, bool) for literal in literals):
+            return None
+
+        return np.isin(column.values, literals)
+
+
+_UNSUPPORTED = object()
+
+
+class _TableBuilder(object):
+    """Appends GeoJSON features to growing buffers."""
+
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+        self.types = {}
+        self.count = 0
+
+        self.geometry_types = array('B')
+        self.feature_offsets = array('q', [0])
+        self.part_offsets = array('q', [0])
+        self.ring_offsets = array('q', [0])
+        self.coords = array('d')
+
+    def add(self, feature):
+        """
+        Appends a feature.
+
+        :param feature: GeoJSON feature.
+        :type feature: dict
+        """
+        self.keys.append(feature_key(feature))
+        for name, value in (feature.get('properties') or {}).items():
+            if name not in self.values:
+                # Earlier features lack the property
+                self.values[name] = [None] * self.count
+                self.types[name] = set()
+            if value is not None:
+                self.types[name].add(type(value))
+            self.values[name].append(value)
+        self.count += 1
+        for column in self.values.values():
+            if len(column) < self.count:
+                column.append(None)
+
+        self._add_geometry(feature.get('geometry'))
+
+    def _add_geometry(self, geometry):
+        geometry_type = _GEOMETRY_TYPES.get((geometry or {}).get('type'))
+        if geometry_type is not None and isinstance(geometry, RawGeometry):
+            self._add_raw_geometry(geometry_type, geometry)
+            return
+        if geometry_type is None or not geometry.get('coordinates'):
+            self.geometry_types.append(0)
+            self.feature_offsets.append(len(self.part_offsets) - 1)
+            return
+
+        coordinates = geometry['coordinates']
+        if geometry_type == _POINT:
+            parts = [[[coordinates]]]
+        elif geometry_type == _LINESTRING:
+            parts = [[coordinates]]
+        elif geometry_type == _POLYGON:
+            parts = [coordinates]
+        elif geometry_type == _MULTIPOINT:
+            parts = [[[point]] for point in coordinates]
+        elif geometry_type == _MULTILINESTRING:
+            parts = [[line] for line in coordinates]
+        else:
+            parts = coordinates
+
+        for rings in parts:
+            for ring in rings:
+                for coordinate in ring:
+                    # Only x and y are kept
+                    self.coords.append(coordinate[0])
+                    self.coords.append(coordinate[1])
+                self.ring_offsets.append(len(self.coords) // 2)
+            self.part_offsets.append(len(self.ring_offsets) - 1)
+
+        self.geometry_types.append(geometry_type)
+        self.feature_offsets.append(len(self.part_offsets) - 1)
+
+    def _add_raw_geometry(self, geometry_type, geometry):
+        """Appends an undecoded geometry, whose rings are parsed in bulk."""
+        parts = geometry.parts()
+        for rings in parts:
+            for ring in rings:
+                self.coords.frombytes(np.ascontiguousarray(ring, dtype=np.float64).tobytes())
+                self.ring_offsets.append(len(self.coords) // 2)
+            self.part_offsets.append(len(self.ring_offsets) - 1)
+
+        self.geometry_types.append(geometry_type if parts else 0)
+        self.feature_offsets.append(len(self.part_offsets) - 1)
+
+    def build(self, metadata=None):
+        """
+        Converts the buffers to NumPy arrays.
+
+        :param metadata: Members of the collection other than the features.
+        :type metadata: dict
+
+        :rtype: ColumnarTable
+        """
+        columns = {name: _column(name, values, self.types[name]) for name, values in self.values.items()}
+
+        return ColumnarTable(self.keys,
+                             columns,
+                             np.frombuffer(self.geometry_types, dtype=np.uint8),
+                             np.frombuffer(self.feature_offsets, dtype=np.int64),
+                             np.frombuffer(self.part_offsets, dtype=np.int64),
+                             np.frombuffer(self.ring_offsets, dtype=np.int64),
+                             np.frombuffer(self.coords, dtype='<f8').reshape(-1, 2),
+                             metadata)
+
+
+def _column(name, values, value_types):
+    """Converts the values of a property to a Column."""
+    kind = layers.property_type(value_types) if value_types else 'str'
+    valid = np.array([value is not None for value in values], dtype=bool)
+
+    if kind == 'str':
+        codes = {}
+        encoded = np.empty(len(values), dtype=np.int32)
+        for index, value in enumerate(values):
+            if value is None:
+                encoded[index] = -1
+                continue
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            elif not isinstance(value, str):
+                value = str(value)
+            encoded[index] = codes.setdefault(value, len(codes))
+        return Column(name, kind, encoded, valid, list(codes))
+
+    dtype = {'bool': bool, 'int': np.int64, 'float': np.float64}[kind]
+    fill = np.nan if kind == 'float' else 0
+    array_values = np.array([fill if value is None else value for value in values], dtype=dtype)
+
+    return Column(name, kind, array_values, valid)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import uuid
+import weakref
+
+import numpy as np
+
+from qgis.core import (QgsAbstractFeatureIterator,
+                       QgsAbstractFeatureSource,
+                       QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsCsException,
+                       QgsDataProvider,
+                       QgsExpressionContext,
+                       QgsFeature,
+                       QgsFeatureIterator,
+                       QgsFeatureRequest,
+                       QgsFields,
+                       QgsProviderMetadata,
+                       QgsProviderRegistry,
+                       QgsRectangle,
+                       QgsVectorDataProvider,
+                       QgsVectorLayer,
+                       QgsWkbTypes
+                       )
+
+from . import crs, instrumentation, layers
+from .columnar import ColumnarTable
+
+PROVIDER_KEY = 'myfiber_columnar'
+
+# Tables by URI, alive as long as a provider uses them
+_tables = weakref.WeakValueDictionary()
+
+
+def register():
+    """Registers the provider with QGIS, once."""
+    registry = QgsProviderRegistry.instance()
+    if PROVIDER_KEY not in registry.providerList():
+        registry.registerProvider(QgsProviderMetadata(PROVIDER_KEY,
+                                                      ColumnarProvider.description(),
+                                                      ColumnarProvider.createProvider))
+
+
+def build_layer(collection, title=None, feedback=None):
+    """
+    Loads a FeatureCollection into a columnar table and creates a layer
+    of the columnar provider on top of it.
+
+    :param collection: The features to load.
+    :type collection: myfiber.core.geojson.FeatureCollectionReader or StaticCollection
+
+    :param title: Layer name. Defaults to the collection's title.
+    :type title: str
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :rtype: QgsVectorLayer
+    """
+    register()
+
+    with instrumentation.phase('parse'):
+        table = ColumnarTable.from_features(collection.features(), feedback=feedback)
+    instrumentation.count('features', len(table))
+
+    with instrumentation.phase('layer_build'):
+        uri = 'myfiber-columnar://{}'.format(uuid.uuid4().hex)
+        _tables[uri] = table
+        layer = QgsVectorLayer(uri, title or collection.metadata.get('title', ''), PROVIDER_KEY)
+
+    return layer
+
+
+class ColumnarProvider(QgsVectorDataProvider):
+    """
+    Read-only vector data provider over a :class:`myfiber.core.columnar.ColumnarTable`.
+
+    Attribute filters, i.e. subset strings and filter expressions of
+    feature requests, and rectangle filters are evaluated on whole columns.
+    Unique values and ranges for styling come straight from the arrays.
+    """
+
+    @classmethod
+    def providerKey(cls):
+        return PROVIDER_KEY
+
+    @classmethod
+    def description(cls):
+        return 'myfiber columnar provider'
+
+    @classmethod
+    def createProvider(cls, uri, providerOptions, flags=QgsDataProvider.ReadFlags()):
+        return ColumnarProvider(uri, providerOptions, flags)
+
+    def __init__(self, uri='', providerOptions=QgsDataProvider.ProviderOptions(), flags=QgsDataProvider.ReadFlags()):
+        QgsVectorDataProvider.__init__(self, uri)
+        self._uri = uri
+        self.table = _tables.get(uri)
+        self._subset_string = ''
+        self._subset = None
+
+        self._fields = QgsFields()
+        self._wkb_type = QgsWkbTypes.NoGeometry
+        if self.table is not None:
+            for name, column in self.table.columns.items():
+                self._fields.append(layers.make_field(name, column.kind))
+            self._wkb_type = QgsWkbTypes.parseType(self.table.layer_type())
+
+    def featureSource(self):
+        return _FeatureSource(self)
+
+    def getFeatures(self, request=QgsFeatureRequest()):
+        return QgsFeatureIterator(_FeatureIterator(_FeatureSource(self), request))
+
+    def indices(self):
+        """
+        Returns the indices of the features within the subset string.
+
+        :rtype: numpy.ndarray
+        """
+        if self._subset is None:
+            return np.arange(len(self.table))
+
+        return self._subset
+
+    def dataSourceUri(self, expandAuthConfig=True):
+        return self._uri
+
+    def storageType(self):
+        return 'Columnar in-memory table'
+
+    def name(self):
+        return PROVIDER_KEY
+
+    def description(self):
+        return ColumnarProvider.description()
+
+    def isValid(self):
+        return self.table is not None
+
+    def crs(self):
+        return QgsCoordinateReferenceSystem(crs.WGS84)
+
+    def wkbType(self):
+        return self._wkb_type
+
+    def fields(self):
+        return QgsFields(self._fields)
+
+    def featureCount(self):
+        return len(self.indices())
+
+    def extent(self):
+        bboxes = self.table.bboxes[self.indices()]
+        if not len(bboxes) or np.isnan(bboxes).all():
+            return QgsRectangle()
+
+        return QgsRectangle(np.nanmin(bboxes[:, 0]), np.nanmin(bboxes[:, 1]),
+                            np.nanmax(bboxes[:, 2]), np.nanmax(bboxes[:, 3]))
+
+    def updateExtents(self):
+        pass
+
+    def capabilities(self):
+        return QgsVectorDataProvider.SelectAtId
+
+    def uniqueValues(self, fieldIndex, limit=-1):
+        column = self.table.column(self._fields.at(fieldIndex).name())
+        if self._subset is not None:
+            values = set(column.value(index) for index in self._subset) - {None}
+        else:
+            values = set(column.unique())
+        if limit >= 0:
+            values = set(list(values)[:limit])
+
+        return values
+
+    def minimumValue(self, fieldIndex):
+        return self._extreme(fieldIndex, min)
+
+    def maximumValue(self, fieldIndex):
+        return self._extreme(fieldIndex, max)
+
+    def _extreme(self, fieldIndex, function):
+        column = self.table.column(self._fields.at(fieldIndex).name())
+        valid = column.valid[self.indices()]
+        if not valid.any():
+            return None
+        if column.kind == 'str':
+            return function(self.uniqueValues(fieldIndex))
+
+        values = column.values[self.indices()][valid]
+        return (values.min() if function is min else values.max()).item()
+
+    def supportsSubsetString(self):
+        return True
+
+    def subsetString(self):
+        return self._subset_string
+
+    def setSubsetString(self, subsetString, updateFeatureCount=True):
+        if not subsetString:
+            self._subset = None
+        else:
+            try:
+                self._subset = self.table.select(subsetString)
+            except ValueError:
+                return False
+        self._subset_string = subsetString or ''
+        self.dataChanged.emit()
+
+        return True
+
+
+class _FeatureSource(QgsAbstractFeatureSource):
+    """Snapshot of the provider's table and subset for an iterator."""
+
+    def __init__(self, provider):
+        QgsAbstractFeatureSource.__init__(self)
+        self.table = provider.table
+        self.fields = provider.fields()
+        self.crs = provider.crs()
+        self.multi = QgsWkbTypes.isMultiType(provider.wkbType())
+        self.indices = provider.indices()
+
+    def getFeatures(self, request):
+        return QgsFeatureIterator(_FeatureIterator(self, request))
+
+
+class _FeatureIterator(QgsAbstractFeatureIterator):
+    """Walks the indices matching a request, filtered on whole columns where possible."""
+
+    def __init__(self, source, request):
+        QgsAbstractFeatureIterator.__init__(self, request)
+        self._source = source
+        self._request = request
+        self._position = 0
+        self._expression = None
+
+        self._transform = QgsCoordinateTransform()
+        if request.destinationCrs().isValid() and request.destinationCrs() != source.crs:
+            self._transform = QgsCoordinateTransform(source.crs, request.destinationCrs(), request.transformContext())
+
+        try:
+            filter_rect = self.filterRectToSourceCrs(self._transform)
+        except QgsCsException:
+            self._indices = np.empty(0, dtype=np.int64)
+            return
+
+        self._indices = self._select(filter_rect)
+
+        names = source.fields.names()
+        if request.flags() & QgsFeatureRequest.SubsetOfAttributes:
+            wanted = set(request.subsetOfAttributes())
+            self._names = [name if index in wanted else None for index, name in enumerate(names)]
+        else:
+            self._names = names
+
+    def _select(self, filter_rect):
+        """Returns the indices of the features which may match the request."""
+        source = self._source
+        request = self._request
+        indices = source.indices
+
+        if request.filterType() == QgsFeatureRequest.FilterFid:
+            indices = np.intersect1d(indices, [request.filterFid()])
+        elif request.filterType() == QgsFeatureRequest.FilterFids:
+            indices = np.intersect1d(indices, list(request.filterFids()))
+        elif request.filterType() == QgsFeatureRequest.FilterExpression:
+            mask = source.table.mask(request.filterExpression())
+            if mask is None:
+                # Evaluated per feature in fetchFeature()
+                self._expression = request.filterExpression()
+                self._context = QgsExpressionContext(request.expressionContext())
+                self._context.setFields(source.fields)
+                self._expression.prepare(self._context)
+            else:
+                indices = indices[mask[indices]]
+
+        if not filter_rect.isNull():
+            indices = np.intersect1d(indices, source.table.intersecting(filter_rect), assume_unique=True)
+
+        return indices
+
+    def fetchFeature(self, feature):
+        table = self._source.table
+        while 0 <= self._position < len(self._indices):
+            index = int(self._indices[self._position])
+            self._position += 1
+
+            feature.setFields(self._source.fields, True)
+            feature.setId(index)
+            feature.setValid(True)
+            feature.setAttributes([table.columns[name].value(index) if name is not None else None
+                                   for name in self._names])
+            if self._request.flags() & QgsFeatureRequest.NoGeometry and self._expression is None:
+                feature.clearGeometry()
+            else:
+                geometry = table.geometry(index)
+                if self._source.multi and not geometry.isNull() and not geometry.isMultipart():
+                    geometry.convertToMultiType()
+                feature.setGeometry(geometry)
+                self.geometryToDestinationCrs(feature, self._transform)
+
+            if self._expression is not None:
+                self._context.setFeature(feature)
+                if not self._expression.evaluate(self._context):
+                    continue
+
+            return True
+
+        return False
+
+    def __iter__(self):
+        self._position = 0
+        return self
+
+    def __next__(self):
+        feature = QgsFeature()
+        if not self.nextFeature(feature):
+            raise StopIteration
+        return feature
+
+    def rewind(self):
+        self._position = 0
+        return True
+
+    def close(self):
+        self._position = -1
+        return True
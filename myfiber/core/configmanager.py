@@ -19,22 +19,51 @@ Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
  *                                                                         *
  ***************************************************************************/
 """
+import copy
 import os.path
+import threading
 import yaml
 
 from myfiber import BASE_DIR, CONFIG
 
+# Parsed config and the path and modification time it was read at
+_cached = (None, None)
+_lock = threading.Lock()
+
+
+def path():
+    """
+    Returns the location of the config. The MYFIBER_CONFIG environment
+    variable overrides the plugin's config.yml, e.g. for headless runs.
+
+    :rtype: str
+    """
+    return os.environ.get('MYFIBER_CONFIG') or os.path.join(BASE_DIR, CONFIG)
+
 
 def read():
-    with open(os.path.join(BASE_DIR, CONFIG)) as f:
-        doc = yaml.safe_load(f)
+    """
+    Reads the config, parsing the file only when it changed since the last read.
+
+    :returns: a copy of the config, callers may modify it
+    :rtype: dict
+    """
+    global _cached
+    config_path = path()
+    version = (config_path, os.path.getmtime(config_path))
+
+    with _lock:
+        if _cached[0] != version:
+            with open(config_path) as f:
+                _cached = (version, yaml.safe_load(f))
+        doc = _cached[1]
 
-    return doc
+    return copy.deepcopy(doc)
 
 
 def write(key, value):
 
     doc = read()
     doc[key] = value
-    with open(os.path.join(BASE_DIR, CONFIG), 'w') as f:
+    with open(path(), 'w') as f:
         yaml.safe_dump(doc, f)
\ No newline at end of file
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+
+from qgis.core import (QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsProject,
+                       QgsRectangle
+                       )
+
+WGS84 = 'EPSG:4326'
+
+# Transforms aren't safe to share between threads, so each thread keeps its own
+_local = threading.local()
+
+
+def transform(source, destination=WGS84):
+    """
+    Returns the transform between two CRS, creating it on first use.
+
+    :param source: authid of the source CRS, e.g. 'EPSG:31287'.
+    :type source: str
+
+    :param destination: authid of the destination CRS.
+    :type destination: str
+
+    :rtype: QgsCoordinateTransform
+    """
+    transforms = getattr(_local, 'transforms', None)
+    if transforms is None:
+        transforms = _local.transforms = {}
+
+    key = (source, destination)
+    if key not in transforms:
+        transforms[key] = QgsCoordinateTransform(QgsCoordinateReferenceSystem(source),
+                                                 QgsCoordinateReferenceSystem(destination),
+                                                 QgsProject.instance())
+
+    return transforms[key]
+
+
+def transform_bbox(bbox, source, destination=WGS84):
+    """
+    Transforms a bbox to the bbox of its transformed area.
+
+    The edges are densified before transforming, so the result also
+    encloses extents whose edges curve in the destination CRS, unlike
+    the transformed corners.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param source: authid of the bbox's CRS.
+    :type source: str
+
+    :param destination: authid of the destination CRS.
+    :type destination: str
+
+    :returns: bbox in format of [minx, miny, maxx, maxy]
+    :rtype: list of float
+    """
+    if source == destination:
+        return list(bbox)
+
+    rect = transform(source, destination).transformBoundingBox(QgsRectangle(*bbox))
+
+    return [rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()]
@@ -62,3 +62,13 @@ class Timeout(Exception):
 class RetriableRequest(Exception):
     """Signifies that the request can be retried."""
     pass
+
+
+class Canceled(Exception):
+    """The request was canceled by the user."""
+    pass
+
+
+class StoreError(Exception):
+    """Writing to the local GeoPackage store failed."""
+    pass
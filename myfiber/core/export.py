@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from qgis.core import QgsFeedback
+
+from . import configmanager, crs, exceptions, geojson, instrumentation, planner
+from .extent import Extent
+from .request import RequestBuilder
+from .spatialcache import geometry_bbox
+from .store import GeoPackageStore
+from .tiling import FeatureMerger
+
+GEOJSON = 'geojson'
+GEOJSON_SEQ = 'geojsonseq'
+GPKG = 'gpkg'
+
+FORMATS = (GEOJSON, GEOJSON_SEQ, GPKG)
+
+_EXTENSIONS = {GEOJSON: 'geojson',
+               GEOJSON_SEQ: 'geojsons',
+               GPKG: 'gpkg'}
+
+_BATCH_SIZE = 1000
+
+_DONE = object()
+
+
+def export(url, extents, path, output_format=GEOJSON, parallelism=4, feedback=None):
+    """
+    Downloads an endpoint for several extents and streams the features to
+    a file.
+
+    Nearby extents share requests, see :func:`myfiber.core.planner.plan`,
+    and features outside all of a request's extents are dropped. Up to
+    parallelism requests download at once. Their features are handed to
+    the writer in batches through a bounded queue, so neither a download
+    nor the export has to fit into memory. Features of overlapping extents
+    are written once.
+
+    :param url: The URL of the endpoint.
+    :type url: str
+
+    :param extents: The extents to download, see RequestBuilder.
+    :type extents: list of Extent or tuple
+
+    :param path: The output file, overwritten if it exists.
+    :type path: str
+
+    :param output_format: One of FORMATS.
+    :type output_format: str
+
+    :param parallelism: Number of concurrent downloads.
+    :type parallelism: int
+
+    :param feedback: Optional feedback object for progress and cancellation.
+    :type feedback: QgsFeedback
+
+    :raises Canceled: if the feedback was canceled.
+
+    :returns: number of written features
+    :rtype: int
+    """
+    bboxes = [Extent.from_value(extent).to_wgs84().bbox() for extent in extents]
+    planner_config = configmanager.read().get('planner') or {}
+    groups = planner.plan(bboxes,
+                          planner_config.get('request_cost_km2', 25.0),
+                          planner_config.get('max_request_km2', 0))
+
+    batches = queue.Queue(maxsize=parallelism * 2)
+    # Stops the downloads when the export fails or is canceled
+    stop = QgsFeedback()
+    download = instrumentation.bind(_download)
+    merger = FeatureMerger()
+    count = 0
+    finished = 0
+
+    with open_writer(path, output_format, url) as writer:
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = [executor.submit(download, url, request_bbox, [bboxes[index] for index in members], batches, stop)
+                       for request_bbox, members in groups]
+
+            try:
+                while finished < len(groups):
+                    if feedback is not None and feedback.isCanceled():
+                        raise exceptions.Canceled()
+                    try:
+                        item = batches.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is _DONE:
+                        finished += 1
+                        if feedback is not None:
+                            feedback.setProgress(100.0 * finished / len(groups))
+                        continue
+
+                    features = list(merger.merge(item))
+                    writer.write(features)
+                    count += len(features)
+            finally:
+                stop.cancel()
+                for future in futures:
+                    future.cancel()
+
+    return count
+
+
+def _download(url, request_bbox, bboxes, batches, stop):
+    """
+    Streams the features of one request which intersect any of its
+    extents into the queue, batch by batch.
+    """
+    try:
+        collection = RequestBuilder(url, request_bbox).build_request(stop, stream=True)
+        features = (feature for feature in collection.features()
+                    if _covered(feature, bboxes))
+        batch = list(islice(features, _BATCH_SIZE))
+        while batch:
+            _put(batches, batch, stop)
+            batch = list(islice(features, _BATCH_SIZE))
+        _put(batches, _DONE, stop)
+    except Exception as e:
+        _put(batches, e, stop)
+
+
+def _covered(feature, bboxes):
+    """Checks whether a feature intersects any of the bboxes. Features without geometry always do."""
+    feature_bbox = geometry_bbox(feature.get('geometry'))
+
+    return feature_bbox is None or any(planner.intersects(feature_bbox, bbox) for bbox in bboxes)
+
+
+def _put(batches, item, stop):
+    """Waits for space in the queue, unless the export stopped meanwhile."""
+    while not stop.isCanceled():
+        try:
+            batches.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def output_path(directory, url, output_format):
+    """
+    Returns the file an endpoint is exported to, e.g. '/sites' -> sites.geojson.
+
+    :param directory: The output directory.
+    :type directory: str
+
+    :param url: The URL of the endpoint.
+    :type url: str
+
+    :param output_format: One of FORMATS.
+    :type output_format: str
+
+    :rtype: str
+    """
+    return os.path.join(directory, "{}.{}".format(_table(url), _EXTENSIONS[output_format]))
+
+
+def parse_extents(text, extent_crs=crs.WGS84):
+    """
+    Parses a list of extents, e.g. '16.1,47.9,16.2,48.0;16.5,48.1,16.6,48.2'.
+
+    :param text: Extents in format of xmin,ymin,xmax,ymax separated by
+        semicolons or line breaks.
+    :type text: str
+
+    :param extent_crs: CRS of the extents, as authid.
+    :type extent_crs: str
+
+    :rtype: list of Extent
+    """
+    extents = []
+    for value in text.replace('\n', ';').split(';'):
+        if not value.strip():
+            continue
+        coords = value.split(',')
+        if len(coords) != 4:
+            raise ValueError("Invalid extent '{}', expected xmin,ymin,xmax,ymax".format(value.strip()))
+        extents.append(Extent.from_value(coords, extent_crs))
+
+    return extents
+
+
+def region_extents(features, source_crs):
+    """
+    Returns the extents of the regions' geometries.
+
+    :param features: The regions, e.g. layer.getFeatures().
+    :type features: iterable of QgsFeature
+
+    :param source_crs: CRS of the regions.
+    :type source_crs: QgsCoordinateReferenceSystem
+
+    :rtype: list of Extent
+    """
+    return [Extent.from_value(feature.geometry().boundingBox(), source_crs)
+            for feature in features
+            if feature.hasGeometry()]
+
+
+def open_writer(path, output_format, url):
+    """
+    Creates the writer of an output format.
+
+    :param path: The output file, overwritten if it exists.
+    :type path: str
+
+    :param output_format: One of FORMATS.
+    :type output_format: str
+
+    :param url: The URL of the endpoint, names the GeoPackage table.
+    :type url: str
+
+    :rtype: GeoJSONWriter or GeoJSONSeqWriter or GeoPackageWriter
+    """
+    if output_format == GEOJSON:
+        return GeoJSONWriter(path)
+    elif output_format == GEOJSON_SEQ:
+        return GeoJSONSeqWriter(path)
+    elif output_format == GPKG:
+        return GeoPackageWriter(path, _table(url))
+
+    raise ValueError("Unknown output format '{}', expected one of {}".format(output_format, ', '.join(FORMATS)))
+
+
+def _table(url):
+    return url.strip('/').replace('/', '_')
+
+
+class _Writer(object):
+    """
+    Writes to a temporary file next to the output, which replaces the
+    output once the writer is closed. Used as context manager, an exception
+    discards the temporary file instead, so a failed or canceled export
+    leaves no truncated file behind.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The output file.
+        :type path: str
+        """
+        self.path = path
+        root, extension = os.path.splitext(path)
+        self.temp_path = root + '.part' + extension
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def close(self):
+        """Completes the output file, which is valid even without features."""
+        self._finish()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        """Deletes the temporary file, the output file is left untouched."""
+        self._release()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def _finish(self):
+        self._release()
+
+    def _release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class GeoJSONWriter(_Writer):
+    """Writes a FeatureCollection feature by feature."""
+
+    def __init__(self, path):
+        """
+        :param path: The output file.
+        :type path: str
+        """
+        _Writer.__init__(self, path)
+        self._file = open(self.temp_path, 'w', encoding='utf-8')
+        self._file.write('{"type": "FeatureCollection", "features": [\n')
+        self._first = True
+
+    def write(self, features):
+        """
+        Appends features to the file.
+
+        :param features: GeoJSON features.
+        :type features: list of dict
+        """
+        for feature in features:
+            if not self._first:
+                self._file.write(',\n')
+            self._file.write(geojson.dumps(feature))
+            self._first = False
+
+    def _finish(self):
+        """Closes the collection and the file."""
+        self._file.write('\n]}\n')
+        self._file.close()
+
+    def _release(self):
+        self._file.close()
+
+
+class GeoJSONSeqWriter(_Writer):
+    """Writes a GeoJSON text sequence (RFC 8142), one feature per line."""
+
+    def __init__(self, path):
+        """
+        :param path: The output file.
+        :type path: str
+        """
+        _Writer.__init__(self, path)
+        self._file = open(self.temp_path, 'w', encoding='utf-8')
+
+    def write(self, features):
+        """
+        Appends features to the file.
+
+        :param features: GeoJSON features.
+        :type features: list of dict
+        """
+        for feature in features:
+            self._file.write('\x1e')
+            # Raw geometries keep the line breaks of the response
+            self._file.write(geojson.dumps(feature).replace('\n', ' '))
+            self._file.write('\n')
+
+    def _release(self):
+        self._file.close()
+
+
+class GeoPackageWriter(_Writer):
+    """Writes the features to a GeoPackage table, one transaction per batch."""
+
+    def __init__(self, path, table):
+        """
+        :param path: The output file.
+        :type path: str
+
+        :param table: The table name.
+        :type table: str
+        """
+        _Writer.__init__(self, path)
+        self._store = GeoPackageStore(self.temp_path, table)
+
+    def write(self, features):
+        """
+        Appends features to the table.
+
+        :param features: GeoJSON features.
+        :type features: list of dict
+        """
+        if features:
+            # Every batch opens and closes the GeoPackage
+            self._store.upsert(geojson.StaticCollection({'features': features}))
+
+    def _finish(self):
+        """Creates the empty table if no features were written."""
+        self._store.create_table()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+from collections import namedtuple
+
+from . import crs
+
+# Decimals of the bbox URL parameter, ~0.1 m
+PRECISION = 6
+
+# Coordinates this close to a grid line, in grid units, are snapped onto it
+_GRID_TOLERANCE = 1e-3
+
+
+class Extent(namedtuple('Extent', ['xmin', 'ymin', 'xmax', 'ymax', 'crs'])):
+    """
+    Immutable map extent with the authid of its CRS.
+
+    Extents are hashable and compare by value, so they can be used as
+    cache keys.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, value, map_crs=None):
+        """
+        Creates an extent from any of the supported representations.
+
+        :param value: An Extent, a QgsRectangle, a (xmin, ymin, xmax, ymax)
+            tuple or the output of QgsRectangle.toString().
+        :type value: Extent or QgsRectangle or tuple or str
+
+        :param map_crs: CRS of the value, as authid or CRS object. Ignored
+            for extents, defaults to WGS84 otherwise.
+        :type map_crs: str or QgsCoordinateReferenceSystem
+
+        :rtype: Extent
+        """
+        if isinstance(value, Extent):
+            return value
+
+        authid = crs.WGS84
+        if map_crs:
+            authid = map_crs if isinstance(map_crs, str) else map_crs.authid()
+
+        if isinstance(value, str):
+            # 'xmin,ymin : xmax,ymax'
+            corners = [[float(coord) for coord in point.split(',')] for point in value.split(':')]
+            coords = corners[0] + corners[1]
+        elif hasattr(value, 'xMinimum'):
+            coords = [value.xMinimum(), value.yMinimum(), value.xMaximum(), value.yMaximum()]
+        else:
+            coords = [float(coord) for coord in value]
+
+        return cls(*(coords + [authid]))
+
+    def bbox(self):
+        """
+        :returns: bbox in format of [minx, miny, maxx, maxy]
+        :rtype: list of float
+        """
+        return [self.xmin, self.ymin, self.xmax, self.ymax]
+
+    def to_wgs84(self):
+        """
+        Transforms the extent to the WGS84 extent enclosing it.
+
+        :rtype: Extent
+        """
+        if self.crs == crs.WGS84:
+            return self
+
+        return Extent(*(crs.transform_bbox(self.bbox(), self.crs) + [crs.WGS84]))
+
+    def quantized(self, precision=PRECISION):
+        """
+        Rounds the extent outwards to a grid of the given decimals, so it
+        still encloses the original extent.
+
+        :param precision: Decimals of the grid.
+        :type precision: int
+
+        :rtype: Extent
+        """
+        return Extent(*(quantize_bbox(self.bbox(), precision) + [self.crs]))
+
+    def param(self):
+        """
+        Formats the extent as the bbox URL parameter.
+
+        :returns: Comma separated list in format of minx,miny,maxx,maxy
+        :rtype: str
+        """
+        return format_bbox(self.bbox())
+
+
+def quantize_bbox(bbox, precision=PRECISION):
+    """
+    Rounds a bbox outwards to a grid of the given decimals.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param precision: Decimals of the grid.
+    :type precision: int
+
+    :rtype: list of float
+    """
+    scale = 10 ** precision
+    minx, miny, maxx, maxy = [float(coord) * scale for coord in bbox]
+
+    return [math.floor(minx + _GRID_TOLERANCE) / scale,
+            math.floor(miny + _GRID_TOLERANCE) / scale,
+            math.ceil(maxx - _GRID_TOLERANCE) / scale,
+            math.ceil(maxy - _GRID_TOLERANCE) / scale]
+
+
+def format_bbox(bbox, precision=PRECISION):
+    """
+    Formats a bbox as the bbox URL parameter, quantized outwards.
+
+    Extents which quantize to the same grid cells give the same string,
+    e.g. both '16.1' for 16.1 and 16.099999999999998.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param precision: Decimals of the grid.
+    :type precision: int
+
+    :returns: Comma separated list in format of minx,miny,maxx,maxy
+    :rtype: str
+    """
+    return ','.join(_format_coord(coord, precision) for coord in quantize_bbox(bbox, precision))
+
+
+def _format_coord(coord, precision):
+    """Formats a coordinate with at most precision decimals."""
+    text = "{:.{}f}".format(coord, precision).rstrip('0').rstrip('.')
+
+    return '0' if text == '-0' else text
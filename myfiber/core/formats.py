@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import uuid
+
+from .geojson import FeatureCollectionReader
+
+GEOJSON = 'application/geo+json'
+GEOJSON_SEQ = 'application/geo+json-seq'
+FLATGEOBUF = 'application/flatgeobuf'
+
+_RECORD_SEPARATOR = '\x1e'
+
+
+def accept_header(formats):
+    """
+    Builds the Accept header from formats in order of preference.
+
+    :param formats: Media types, the preferred first.
+    :type formats: list of str
+
+    :returns: e.g. 'application/geo+json-seq, application/geo+json;q=0.9'
+    :rtype: str
+    """
+    accepted = []
+    for rank, media_type in enumerate(formats):
+        quality = max(0.1, 1 - rank / 10.0)
+        accepted.append(media_type if rank == 0 else "{};q={:.1f}".format(media_type, quality))
+
+    return ', '.join(accepted)
+
+
+def media_type(content_type):
+    """
+    Strips the parameters from a Content-Type header.
+
+    :param content_type: Content-Type header, e.g. 'application/geo+json; charset=utf-8'
+    :type content_type: str
+
+    :rtype: str
+    """
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def read_collection(body, lazy_geometry=False):
+    """
+    Returns the reader for the format of a streamed body.
+
+    :param body: The streamed response body.
+    :type body: myfiber.core.client.StreamedBody
+
+    :param lazy_geometry: Keep the geometries of a FeatureCollection
+        undecoded, see :class:`myfiber.core.geojson.RawGeometry`.
+    :type lazy_geometry: bool
+
+    :returns: collection with features() and metadata
+    :rtype: FeatureCollectionReader or GeoJSONSeqReader or FlatGeobufReader
+    """
+    body_type = media_type(body.content_type)
+
+    if body_type == GEOJSON_SEQ:
+        return GeoJSONSeqReader(body)
+    elif body_type == FLATGEOBUF:
+        return FlatGeobufReader(body)
+
+    return FeatureCollectionReader(body, lazy_geometry)
+
+
+def to_dict(body):
+    """
+    Parses a body of any supported format into a FeatureCollection.
+
+    :param body: The response body.
+    :type body: myfiber.core.client.StreamedBody
+
+    :rtype: dict
+    """
+    collection = read_collection(body)
+    features = list(collection.features())
+
+    return dict(collection.metadata, type='FeatureCollection', features=features)
+
+
+class GeoJSONSeqReader(object):
+    """
+    Parses a GeoJSON text sequence (RFC 8142) or newline delimited GeoJSON
+    incrementally from byte chunks.
+
+    Each text is a feature. Other objects in the sequence, e.g. a leading
+    collection header, are collected in metadata.
+    """
+
+    def __init__(self, chunks):
+        """
+        :param chunks: The raw response body.
+        :type chunks: iterable of bytes
+        """
+        self.metadata = {}
+        self._chunks = chunks
+
+    def features(self):
+        """
+        Yields the features of the sequence.
+
+        :rtype: generator of dict
+        """
+        pending = b''
+        for chunk in self._chunks:
+            pending += chunk
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                for feature in self._parse(line):
+                    yield feature
+
+        for feature in self._parse(pending):
+            yield feature
+
+    def _parse(self, line):
+        for text in line.decode('utf-8').split(_RECORD_SEPARATOR):
+            text = text.strip()
+            if not text:
+                continue
+            value = json.loads(text)
+            if value.get('type') == 'Feature':
+                yield value
+            else:
+                self.metadata.update({key: item for key, item in value.items() if key != 'features'})
+
+
+class FlatGeobufReader(object):
+    """
+    Decodes a FlatGeobuf body with OGR.
+
+    The body is buffered in GDAL's in-memory file system, the features are
+    then converted one by one.
+    """
+
+    def __init__(self, chunks):
+        """
+        :param chunks: The raw response body.
+        :type chunks: iterable of bytes
+        """
+        self.metadata = {}
+        self._chunks = chunks
+
+    def features(self):
+        """
+        Yields the features as GeoJSON dicts.
+
+        :rtype: generator of dict
+        """
+        from osgeo import gdal, ogr
+
+        path = '/vsimem/myfiber_{}.fgb'.format(uuid.uuid4().hex)
+        handle = gdal.VSIFOpenL(path, 'wb')
+        for chunk in self._chunks:
+            gdal.VSIFWriteL(chunk, 1, len(chunk), handle)
+        gdal.VSIFCloseL(handle)
+
+        try:
+            data_source = ogr.Open(path)
+            if data_source is None:
+                raise ValueError("Invalid FlatGeobuf body")
+            ogr_layer = data_source.GetLayer(0)
+            self.metadata['title'] = ogr_layer.GetName()
+            for ogr_feature in ogr_layer:
+                yield ogr_feature.ExportToJson(as_object=True)
+            data_source = None
+        finally:
+            gdal.Unlink(path)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import codecs
+import json
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_WHITESPACE = ' \t\n\r'
+
+# The next brace, complete or cut off string, or start of a geometry member.
+# Coordinates hold neither, so the scanner skips them in one go.
+_TOKENS = re.compile(r'[^"{}]*(?P<token>(?P<geometry>"geometry"\s*:\s*\{)'
+                     r'|"[^"\\]*(?:\\.[^"\\]*)*(?:(?P<closed>")|\\?\Z)|[{}])')
+# A geometry member name at the end of the buffer, before its value arrived
+_CUT_MEMBER = re.compile(r'\s*(?::\s*)?\Z')
+
+_GEOMETRY_TYPE = re.compile(r'"type"\s*:\s*"(\w+)"')
+# The coordinates array holds neither strings nor objects, it ends before the next member
+_COORDINATES = re.compile(r'"coordinates"\s*:\s*(\[[^"{}]*\])')
+_FIRST_COORDINATE = re.compile(r'\[([^\[\]]*)\]')
+
+# Numbers only, for bulk parsing
+_TO_SPACES = str.maketrans('[],', '   ')
+_NO_WHITESPACE = str.maketrans('', '', _WHITESPACE)
+
+_RAW_PLACEHOLDER = re.compile(r'"\\u0000raw-geometry-(\d+)\\u0000"')
+
+
+class FeatureCollectionReader(object):
+    """
+    Parses a GeoJSON FeatureCollection incrementally from byte chunks.
+
+    Features are decoded one by one while the body is still downloading, so
+    neither the raw body nor the full dict is ever held in memory. The other
+    members of the collection, e.g. 'title', are collected in metadata: the
+    ones before 'features' are available with the first feature, all of them
+    once features() is exhausted.
+    """
+
+    def __init__(self, chunks, lazy_geometry=False):
+        """
+        :param chunks: The raw response body.
+        :type chunks: iterable of bytes
+
+        :param lazy_geometry: Keep the geometries as :class:`RawGeometry`
+            instead of decoding their coordinates. Needs NumPy, it's
+            ignored without.
+        :type lazy_geometry: bool
+        """
+        self.metadata = {}
+        self.lazy_geometry = lazy_geometry and np is not None
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._exhausted = False
+
+    def features(self):
+        """
+        Yields the features of the collection.
+
+        :raises ValueError: if the body is not a valid JSON object.
+
+        :rtype: generator of dict
+        """
+        self._expect('{')
+        while True:
+            char = self._next_char(skip=',')
+            if char == '}':
+                # Run the body to its end, so a streamed response is
+                # completed, e.g. stored in the cache
+                for _ in self._chunks:
+                    pass
+                self._exhausted = True
+                return
+
+            key = self._decode_value()
+            self._expect(':')
+
+            if key != 'features':
+                self.metadata[key] = self._decode_value()
+                continue
+
+            self._expect('[')
+            while self._next_char(skip=',') != ']':
+                yield self._decode_feature() if self.lazy_geometry else self._decode_value()
+            self._pos += 1
+
+    def _fill(self):
+        """Appends the next chunk to the buffer. Returns False at the end."""
+        if self._exhausted:
+            return False
+
+        # Drop what was consumed, so the buffer only holds the current value
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._exhausted = True
+            self._buffer += self._decoder.decode(b'', final=True)
+        else:
+            self._buffer += self._decoder.decode(chunk)
+
+        return True
+
+    def _next_char(self, skip=''):
+        """Returns the next significant character without consuming it."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE + skip:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of GeoJSON body")
+
+    def _expect(self, char):
+        """Consumes the expected character."""
+        found = self._next_char()
+        if found != char:
+            raise ValueError("Expected '{}' in GeoJSON body, found '{}'".format(char, found))
+        self._pos += 1
+
+    def _decode_value(self):
+        """Decodes the next JSON value, reading more chunks until it's complete."""
+        self._next_char()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+                # A number at the end of the buffer might continue in the next chunk
+                if end < len(self._buffer) or self._exhausted:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._exhausted:
+                    raise
+            self._fill()
+
+    def _decode_feature(self):
+        """
+        Decodes the next feature, except for the coordinates of its geometry.
+
+        The feature is scanned for its end and its top level geometry member
+        first. Everything but the geometry is decoded, the geometry's text is
+        kept as RawGeometry. Geometries with nested objects, e.g.
+        GeometryCollections, are decoded as usual.
+        """
+        if self._next_char() != '{':
+            return self._decode_value()
+
+        # Offsets are relative to the feature start, which chunks don't move
+        offset = 0
+        depth = 0
+        geometry_start = None
+        geometry_end = None
+        nested = False
+
+        while True:
+            match = _TOKENS.match(self._buffer, self._pos + offset)
+            if match is None or (match.group('token')[0] == '"' and not match.group('geometry') and
+                                 match.group('closed') is None):
+                # The feature continues in the next chunk
+                if match is not None:
+                    offset = match.start('token') - self._pos
+                else:
+                    offset = len(self._buffer) - self._pos
+                if not self._fill():
+                    raise ValueError("Unexpected end of GeoJSON body")
+                continue
+
+            if (depth == 1 and match.group('token') == '"geometry"' and not self._exhausted
+                    and _CUT_MEMBER.match(self._buffer, match.end())):
+                # The start of the geometry could be cut off by the chunk
+                offset = match.start('token') - self._pos
+                self._fill()
+                continue
+
+            offset = match.end() - self._pos
+            char = match.group('token')[-1]
+            if char == '{':
+                depth += 1
+                if match.group('geometry') and depth == 2:
+                    geometry_start = match.end() - 1 - self._pos
+                elif geometry_start is not None and geometry_end is None:
+                    nested = True
+            elif char == '}':
+                depth -= 1
+                if depth == 1 and geometry_start is not None and geometry_end is None:
+                    geometry_end = offset
+                elif depth == 0:
+                    break
+
+        text = self._buffer[self._pos:self._pos + offset]
+        self._pos += offset
+
+        if geometry_start is None or nested:
+            return json.loads(text)
+
+        feature = json.loads(text[:geometry_start] + 'null' + text[geometry_end:])
+        feature['geometry'] = RawGeometry(text[geometry_start:geometry_end])
+
+        return feature
+
+
+class RawGeometry(object):
+    """
+    The undecoded text of a GeoJSON geometry.
+
+    Its type is read right away. The coordinates are only decoded when
+    asked for, either as nested lists like a parsed geometry or in bulk
+    into NumPy arrays. geojson.dumps() writes the text as it is.
+    """
+
+    __slots__ = ('text', 'type')
+
+    def __init__(self, text):
+        """
+        :param text: The geometry object as JSON.
+        :type text: str
+        """
+        self.text = text
+        match = _GEOMETRY_TYPE.search(text)
+        self.type = match.group(1) if match else None
+
+    def decode(self):
+        """
+        Decodes the geometry.
+
+        :rtype: dict
+        """
+        return json.loads(self.text)
+
+    def get(self, key, default=None):
+        """Reads a member like from the decoded geometry."""
+        if key == 'type':
+            return self.type
+
+        return self.decode().get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def parts(self):
+        """
+        Decodes the coordinates in bulk, without building a list per
+        coordinate.
+
+        :returns: rings of every part as arrays of (x, y), e.g. one part
+            with a single ring of one coordinate for a Point
+        :rtype: list of list of numpy.ndarray
+        """
+        match = _COORDINATES.search(self.text)
+        if match is None:
+            return []
+        text = match.group(1).translate(_NO_WHITESPACE)
+
+        if self.type in ('Point', 'LineString'):
+            parts = [[_ring(text)]]
+        elif self.type == 'MultiPoint':
+            parts = [[point.reshape(1, 2)] for point in _ring(text)]
+        elif self.type == 'Polygon':
+            parts = [[_ring(ring_text) for ring_text in text.split(']],[[')]]
+        elif self.type == 'MultiLineString':
+            parts = [[_ring(line_text)] for line_text in text.split(']],[[')]
+        elif self.type == 'MultiPolygon':
+            parts = [[_ring(ring_text) for ring_text in polygon_text.split(']],[[')]
+                     for polygon_text in text.split(']]],[[[')]
+        else:
+            return []
+
+        parts = [[ring for ring in part if len(ring)] for part in parts]
+
+        return [part for part in parts if part]
+
+    def bbox(self):
+        """
+        Computes the bbox from the coordinates, decoded in bulk.
+
+        :returns: bbox in format of (minx, miny, maxx, maxy), None for empty geometries
+        :rtype: tuple
+        """
+        rings = [ring for part in self.parts() for ring in part]
+        if not rings:
+            return None
+        coords = np.concatenate(rings)
+
+        return (coords[:, 0].min().item(), coords[:, 1].min().item(),
+                coords[:, 0].max().item(), coords[:, 1].max().item())
+
+
+_MISSING = object()
+
+
+def _ring(text):
+    """
+    Parses the coordinates of a ring, line or MultiPoint into an array of
+    (x, y), dropping further dimensions.
+    """
+    first = _FIRST_COORDINATE.search(text)
+    if first is None or not first.group(1):
+        return np.empty((0, 2))
+
+    numbers = _numbers(text)
+    dimensions = first.group(1).count(',') + 1
+    if len(numbers) != (text.count('],[') + 1) * dimensions:
+        # Positions of different dimensions, parsed one by one
+        return np.array([[float(value) for value in position.split(',')[:2]]
+                         for position in text.strip('[]').split('],[')])
+
+    return numbers.reshape(-1, dimensions)[:, :2]
+
+
+def _numbers(text):
+    """Parses all numbers of a coordinates text into a float array."""
+    text = text.translate(_TO_SPACES)
+    if not text.strip():
+        return np.empty(0)
+
+    return np.fromstring(text, sep=' ')
+
+
+def dumps(value, **kwargs):
+    """
+    Serializes to JSON like json.dumps(). RawGeometry is written as its
+    text, without decoding it.
+
+    :param value: e.g. a feature or a FeatureCollection.
+    :type value: dict or list
+
+    :param kwargs: Passed to json.dumps().
+
+    :rtype: str
+    """
+    raw_texts = []
+
+    def placeholder(obj):
+        if isinstance(obj, RawGeometry):
+            raw_texts.append(obj.text)
+            return '\x00raw-geometry-{}\x00'.format(len(raw_texts) - 1)
+        raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+    text = json.dumps(value, default=placeholder, **kwargs)
+    if not raw_texts:
+        return text
+
+    return _RAW_PLACEHOLDER.sub(lambda match: raw_texts[int(match.group(1))], text)
+
+
+class StaticCollection(object):
+    """
+    Wraps an already parsed FeatureCollection with the interface of
+    FeatureCollectionReader.
+    """
+
+    def __init__(self, collection):
+        """
+        :param collection: GeoJSON FeatureCollection.
+        :type collection: dict
+        """
+        self.metadata = {key: value for key, value in collection.items() if key != 'features'}
+        self._features = collection.get('features', [])
+
+    def features(self):
+        """
+        Yields the features of the collection.
+
+        :rtype: generator of dict
+        """
+        for feature in self._features:
+            yield feature
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from qgis.core import Qgis, QgsMessageLog
+
+# Phases in the order they happen during a load
+PHASES = ('config', 'crs_transform', 'connect', 'tls', 'ttfb', 'download',
+          'parse', 'layer_build', 'store_write', 'render')
+
+_LOG_TAG = 'myfiber'
+
+_local = threading.local()
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+class Trace(object):
+    """
+    Timings and counters of one load, e.g. an endpoint fetched by a task.
+
+    Phases are exclusive: a phase started while another one is running in
+    the same thread pauses the outer one, e.g. the download of a chunk
+    while the features are parsed. Phases running in several threads at
+    once are summed up, so their total may exceed the wall time.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: What is loaded, e.g. the endpoint.
+        :type name: str
+        """
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        self.phases = {}
+        self.counters = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times a phase.
+
+        :param name: The phase, one of PHASES.
+        :type name: str
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        now = time.perf_counter()
+        if stack:
+            self.add_time(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            _, started = stack.pop()
+            self.add_time(name, now - started)
+            if stack:
+                # Resume the outer phase
+                stack[-1][1] = now
+
+    def add_time(self, name, seconds):
+        """
+        Adds time to a phase.
+
+        :param name: The phase.
+        :type name: str
+
+        :param seconds: Time spent.
+        :type seconds: float
+        """
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        """
+        Increments a counter, e.g. 'features' or 'bytes_wire'.
+
+        :param name: The counter.
+        :type name: str
+
+        :param value: The increment.
+        :type value: int
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_request(self, record):
+        """
+        Records a finished request, see :func:`after_request`.
+
+        :param record: The request record.
+        :type record: dict
+        """
+        with self._lock:
+            self.requests.append(record)
+            self.counters['requests'] = self.counters.get('requests', 0) + 1
+            self.counters['retries'] = self.counters.get('retries', 0) + record.get('retries', 0)
+            if record.get('cached'):
+                self.counters['cache_hits'] = self.counters.get('cache_hits', 0) + 1
+
+    def finish(self):
+        """Stops the wall clock of the trace."""
+        if self.finished is None:
+            self.finished = time.time()
+
+    def as_dict(self):
+        """
+        :returns: name, wall time, phases, counters and requests
+        :rtype: dict
+        """
+        with self._lock:
+            return {'name': self.name,
+                    'started': self.started,
+                    'wall': (self.finished or time.time()) - self.started,
+                    'phases': dict(self.phases),
+                    'counters': dict(self.counters),
+                    'requests': list(self.requests)}
+
+    def to_json(self):
+        """
+        :rtype: str
+        """
+        return json.dumps(self.as_dict())
+
+    def summary(self):
+        """
+        Formats the timing breakdown as one line per phase.
+
+        :rtype: str
+        """
+        doc = self.as_dict()
+        names = [name for name in PHASES if name in doc['phases']]
+        names += sorted(set(doc['phases']) - set(PHASES))
+
+        lines = ["{}: {:.3f} s".format(doc['name'], doc['wall'])]
+        lines.extend("  {:<14}{:>9.3f} s".format(name, doc['phases'][name]) for name in names)
+        lines.extend("  {:<14}{:>9}".format(name, value) for name, value in sorted(doc['counters'].items()))
+
+        return '\n'.join(lines)
+
+
+def current():
+    """
+    Returns the trace active in this thread.
+
+    :rtype: Trace or None
+    """
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def activate(trace):
+    """
+    Makes a trace the active one in this thread.
+
+    :param trace: The trace, None to deactivate tracing.
+    :type trace: Trace
+    """
+    previous = current()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def bind(func):
+    """
+    Wraps a function to run with the caller's trace active, e.g. in a
+    worker thread.
+
+    :param func: The function to wrap.
+    :type func: callable
+
+    :rtype: callable
+    """
+    trace = current()
+
+    def bound(*args, **kwargs):
+        with activate(trace):
+            return func(*args, **kwargs)
+
+    return bound
+
+
+@contextmanager
+def phase(name):
+    """
+    Times a phase of the active trace, if any.
+
+    :param name: The phase, one of PHASES.
+    :type name: str
+    """
+    trace = current()
+    if trace is None:
+        yield
+    else:
+        with trace.phase(name):
+            yield
+
+
+def count(name, value=1):
+    """
+    Increments a counter of the active trace, if any.
+
+    :param name: The counter.
+    :type name: str
+
+    :param value: The increment.
+    :type value: int
+    """
+    trace = current()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def add_hook(pre=None, post=None):
+    """
+    Registers callbacks run around every request of the client.
+
+    :param pre: Called with the URL extension and the parameters before a
+        request is sent.
+    :type pre: callable
+
+    :param post: Called with the request record after a request finished,
+        see :func:`after_request`.
+    :type post: callable
+
+    :returns: handle for :func:`remove_hook`
+    :rtype: tuple
+    """
+    hook = (pre, post)
+    with _hooks_lock:
+        _hooks.append(hook)
+
+    return hook
+
+
+def remove_hook(hook):
+    """
+    Unregisters callbacks added with :func:`add_hook`.
+
+    :param hook: The handle returned by add_hook.
+    :type hook: tuple
+    """
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def before_request(url, params):
+    """
+    Runs the pre request hooks.
+
+    :param url: URL extension of the request.
+    :type url: str
+
+    :param params: HTTP GET parameters.
+    :type params: dict
+    """
+    with _hooks_lock:
+        hooks = list(_hooks)
+
+    for pre, _ in hooks:
+        if pre is not None:
+            pre(url, params)
+
+
+def after_request(record):
+    """
+    Adds a finished request to the active trace and runs the post request
+    hooks.
+
+    :param record: url, status, seconds until the body was available, retries,
+        cached (bool) and bytes (None for streamed bodies).
+    :type record: dict
+    """
+    trace = current()
+    if trace is not None:
+        trace.add_request(record)
+
+    with _hooks_lock:
+        hooks = list(_hooks)
+
+    for _, post in hooks:
+        if post is not None:
+            post(record)
+
+
+def report(trace, config):
+    """
+    Logs the timing breakdown to the myfiber tab of the log messages panel
+    and appends the trace as a JSON line to the export file, if configured.
+
+    :param trace: The finished trace.
+    :type trace: Trace
+
+    :param config: The instrumentation section of the config.
+    :type config: dict
+    """
+    if not config.get('enabled'):
+        return
+
+    QgsMessageLog.logMessage(trace.summary(), _LOG_TAG, Qgis.Info)
+
+    if config.get('export_path'):
+        with open(config['export_path'], 'a') as f:
+            f.write(trace.to_json() + '\n')
+
+
+def log(message):
+    """
+    Logs a message to the myfiber tab of the log messages panel.
+
+    :param message: The message.
+    :type message: str
+    """
+    QgsMessageLog.logMessage(message, _LOG_TAG, Qgis.Info)
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter timing how long new connections take to open, as
+    'connect' (DNS and TCP) and 'tls' phases of the active trace.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        with phase('connect'):
+            return HTTPConnection._new_conn(self)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        with phase('connect'):
+            return HTTPSConnection._new_conn(self)
+
+    def connect(self):
+        # The nested connect phase is excluded, what remains is the handshake
+        with phase('tls'):
+            HTTPSConnection.connect(self)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
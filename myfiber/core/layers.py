@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from itertools import islice
+
+from PyQt5.QtCore import QVariant, QTextCodec
+
+from qgis.core import (QgsField,
+                       QgsJsonUtils,
+                       QgsVectorLayer
+                       )
+
+from . import exceptions, geojson, instrumentation
+
+# Single part lines and polygons are often mixed with multi parts in one
+# response, so the layer is created as multi type.
+_LAYER_TYPES = {'Point': 'Point',
+                'MultiPoint': 'MultiPoint',
+                'LineString': 'MultiLineString',
+                'MultiLineString': 'MultiLineString',
+                'Polygon': 'MultiPolygon',
+                'MultiPolygon': 'MultiPolygon'}
+
+_FIELD_TYPES = {'bool': QVariant.Bool,
+                'int': QVariant.LongLong,
+                'float': QVariant.Double,
+                'str': QVariant.String}
+
+
+def build_memory_layer(collection, title=None, batch_size=1000, feedback=None):
+    """
+    Builds a memory layer from a FeatureCollection, batch by batch.
+
+    Fields are added as new properties show up in the features.
+
+    :param collection: The features to load.
+    :type collection: myfiber.core.geojson.FeatureCollectionReader or StaticCollection
+
+    :param title: Layer name. Defaults to the collection's title.
+    :type title: str
+
+    :param batch_size: Number of features added to the provider at once.
+    :type batch_size: int
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :rtype: QgsVectorLayer
+    """
+    features = collection.features()
+    with instrumentation.phase('parse'):
+        batch = list(islice(features, batch_size))
+
+    wkb_type = layer_type(batch)
+    layer = QgsVectorLayer("{}?crs=EPSG:4326&index=yes".format(wkb_type), title or '', 'memory')
+    provider = layer.dataProvider()
+    multi = wkb_type.startswith('Multi')
+
+    while batch:
+        with instrumentation.phase('layer_build'):
+            new_fields = infer_fields(batch, layer.fields().names())
+            if new_fields:
+                provider.addAttributes(new_fields)
+                layer.updateFields()
+
+            provider.addFeatures(to_qgs_features(batch, layer.fields(), multi))
+        instrumentation.count('features', len(batch))
+
+        if feedback is not None and feedback.isCanceled():
+            raise exceptions.Canceled()
+        with instrumentation.phase('parse'):
+            batch = list(islice(features, batch_size))
+
+    with instrumentation.phase('layer_build'):
+        layer.setName(title or collection.metadata.get('title', ''))
+        layer.updateExtents()
+
+    return layer
+
+
+def infer_fields(features, existing):
+    """
+    Derives fields for the properties which are not yet known.
+
+    :param features: GeoJSON features.
+    :type features: list of dict
+
+    :param existing: Names of the fields which already exist.
+    :type existing: list of str
+
+    :rtype: list of QgsField
+    """
+    return [make_field(name, property_type)
+            for name, property_type in infer_property_types(features, existing).items()]
+
+
+def make_field(name, property_type):
+    """
+    Creates the field of a property.
+
+    :param name: The property name.
+    :type name: str
+
+    :param property_type: 'bool', 'int', 'float' or 'str', see infer_property_types().
+    :type property_type: str
+
+    :rtype: QgsField
+    """
+    return QgsField(name, _FIELD_TYPES[property_type])
+
+
+def infer_property_types(features, existing):
+    """
+    Derives the types of the properties which are not yet known.
+
+    :param features: GeoJSON features.
+    :type features: list of dict
+
+    :param existing: Names of the properties which already exist.
+    :type existing: list of str
+
+    :returns: 'bool', 'int', 'float' or 'str' per property name
+    :rtype: dict
+    """
+    types = {}
+    for feature in features:
+        for name, value in (feature.get('properties') or {}).items():
+            if value is not None and name not in existing:
+                types.setdefault(name, set()).add(type(value))
+
+    return {name: property_type(value_types) for name, value_types in types.items()}
+
+
+def property_type(value_types):
+    """
+    Returns the type of a property from the Python types of its values.
+
+    :param value_types: Types of the non-null values.
+    :type value_types: set of type
+
+    :returns: 'bool', 'int', 'float' or 'str'
+    :rtype: str
+    """
+    if value_types == {bool}:
+        return 'bool'
+    elif value_types == {int}:
+        return 'int'
+    elif value_types <= {int, float}:
+        return 'float'
+
+    return 'str'
+
+
+def to_qgs_features(features, fields, multi=False):
+    """
+    Converts a batch of GeoJSON features.
+
+    :param features: GeoJSON features.
+    :type features: list of dict
+
+    :param fields: The layer's fields.
+    :type fields: QgsFields
+
+    :param multi: Whether geometries are converted to multi type.
+    :type multi: bool
+
+    :rtype: list of QgsFeature
+    """
+    batch = geojson.dumps({'type': 'FeatureCollection', 'features': features})
+    qgs_features = QgsJsonUtils.stringToFeatureList(batch, fields, QTextCodec.codecForName('UTF-8'))
+
+    if multi:
+        for qgs_feature in qgs_features:
+            geometry = qgs_feature.geometry()
+            if not geometry.isNull() and not geometry.isMultipart():
+                geometry.convertToMultiType()
+                qgs_feature.setGeometry(geometry)
+
+    return qgs_features
+
+
+def layer_type(features):
+    """
+    Returns the layer geometry type for a batch of features.
+
+    :param features: GeoJSON features.
+    :type features: list of dict
+
+    :returns: WKB type name, e.g. 'MultiPolygon', or 'None'
+    :rtype: str
+    """
+    for feature in features:
+        geometry = feature.get('geometry')
+        if geometry and geometry.get('type') in _LAYER_TYPES:
+            return _LAYER_TYPES[geometry['type']]
+
+    return 'None'
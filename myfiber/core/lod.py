@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+from qgis.core import QgsGeometry
+
+from . import exceptions
+
+# Size of a rendered pixel as standardized by OGC, in meters
+_PIXEL_SIZE = 0.00028
+
+_METERS_PER_DEGREE = 111320.0
+
+
+def tolerance(scale, pixels=1.0):
+    """
+    Returns the simplification tolerance in degrees for a map scale, i.e.
+    the ground size of a number of pixels.
+
+    :param scale: Scale denominator, e.g. mapCanvas().scale().
+    :type scale: float
+
+    :param pixels: Tolerance in pixels.
+    :type pixels: float
+
+    :rtype: float
+    """
+    return scale * _PIXEL_SIZE * pixels / _METERS_PER_DEGREE
+
+
+def scale_bucket(scale):
+    """
+    Groups scales into buckets which double in scale, so zooming a little
+    doesn't require new geometries.
+
+    :param scale: Scale denominator.
+    :type scale: float
+
+    :rtype: int
+    """
+    return int(math.floor(math.log(max(scale, 1.0), 2)))
+
+
+def bucket_tolerance(bucket, lod_config):
+    """
+    Returns the tolerance of a scale bucket.
+
+    :param bucket: The bucket, see scale_bucket().
+    :type bucket: int
+
+    :param lod_config: The lod section of the config.
+    :type lod_config: dict
+
+    :returns: tolerance in degrees, 0 for full detail
+    :rtype: float
+    """
+    scale = 2 ** bucket
+    if scale < lod_config.get('full_detail_below', 0):
+        return 0.0
+
+    return tolerance(scale, lod_config.get('pixels', 1.0))
+
+
+def tolerance_param(value):
+    """
+    Formats a tolerance as URL parameter.
+
+    :param value: Tolerance in degrees.
+    :type value: float
+
+    :rtype: str
+    """
+    return "{:.3g}".format(value)
+
+
+def simplify(geometries, tolerance, feedback=None):
+    """
+    Simplifies geometries with Douglas-Peucker.
+
+    :param geometries: Geometries by feature id.
+    :type geometries: dict
+
+    :param tolerance: Tolerance in the units of the geometries.
+    :type tolerance: float
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :returns: simplified geometries by feature id
+    :rtype: dict
+    """
+    simplified = {}
+    for count, (fid, geometry) in enumerate(geometries.items()):
+        if count % 1000 == 0 and feedback is not None and feedback.isCanceled():
+            raise exceptions.Canceled()
+        result = geometry.simplify(tolerance)
+        # Tiny features collapse, keep them as they are
+        simplified[fid] = geometry if result.isEmpty() else result
+
+    return simplified
+
+
+class GeometryLevels(object):
+    """Full detail geometries of a layer and their simplifications per scale bucket."""
+
+    def __init__(self, layer):
+        """
+        :param layer: The layer at full detail.
+        :type layer: QgsVectorLayer
+        """
+        self.full = {feature.id(): QgsGeometry(feature.geometry())
+                     for feature in layer.getFeatures()
+                     if feature.hasGeometry()}
+        self.levels = {}
+
+    def get(self, bucket, tolerance):
+        """
+        Returns the geometries of a bucket if they are already simplified.
+
+        :param bucket: The scale bucket.
+        :type bucket: int
+
+        :param tolerance: The bucket's tolerance, 0 for full detail.
+        :type tolerance: float
+
+        :returns: geometries by feature id, None if not simplified yet
+        :rtype: dict
+        """
+        if not tolerance:
+            return self.full
+
+        return self.levels.get(bucket)
+
+    def put(self, bucket, geometries):
+        """
+        Caches the simplified geometries of a bucket.
+
+        :param bucket: The scale bucket.
+        :type bucket: int
+
+        :param geometries: Simplified geometries by feature id.
+        :type geometries: dict
+        """
+        self.levels[bucket] = geometries
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from . import geojson, instrumentation
+from .tiling import feature_key
+
+
+def iter_pages(clnt, url, params, paging_config, feedback=None):
+    """
+    Yields the pages of a paged endpoint in order.
+
+    In 'offset' mode the next pages are requested concurrently with
+    limit/offset parameters, ahead of the page being consumed. In 'links'
+    mode the next link of each page is followed, with the next page
+    downloading while the current one is consumed. Either way paging stops
+    after max_pages pages.
+
+    :param clnt: The client to fetch with.
+    :type clnt: myfiber.core.client.Client
+
+    :param url: URL extension for request. Should begin with a slash.
+    :type url: str
+
+    :param params: HTTP GET parameters.
+    :type params: dict
+
+    :param paging_config: The paging section of the config.
+    :type paging_config: dict
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :rtype: generator of dict
+    """
+    max_pages = paging_config.get('max_pages', 10000)
+    if paging_config.get('mode') == 'links':
+        return _iter_link_pages(clnt, url, params or {}, max_pages, feedback)
+
+    return _iter_offset_pages(clnt,
+                              url,
+                              params or {},
+                              paging_config.get('page_size', 1000),
+                              paging_config.get('prefetch', 2),
+                              paging_config.get('limit_param', 'limit'),
+                              paging_config.get('offset_param', 'offset'),
+                              max_pages,
+                              feedback)
+
+
+def _iter_offset_pages(clnt, url, params, page_size, prefetch, limit_param, offset_param, max_pages, feedback):
+    """
+    Requests up to prefetch pages at once, until a page is empty.
+
+    A page with less than page_size features is either the last one or
+    the server caps the limit below page_size. Either way the pages
+    requested beyond it are discarded and paging continues right after it,
+    with its length as page size.
+
+    A server ignoring the offset returns the same features over and over,
+    so paging also stops at a page without new features, or with the same
+    first and last feature as the previous page.
+    """
+    pending = deque()
+    next_offset = 0
+    request = instrumentation.bind(clnt.request)
+    seen = set()
+    previous_ends = None
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        try:
+            for _ in range(max_pages):
+                while len(pending) < prefetch:
+                    page_params = dict(params)
+                    page_params[limit_param] = page_size
+                    page_params[offset_param] = next_offset
+                    pending.append((next_offset, executor.submit(request, url, page_params, feedback=feedback)))
+                    next_offset += page_size
+
+                offset, future = pending.popleft()
+                page = future.result()
+                features = page.get('features', [])
+                count = len(features)
+
+                if count:
+                    ends = (_page_key(features[0]), _page_key(features[-1]))
+                    keys = {feature_key(feature) for feature in features}
+                    if ends == previous_ends or (None not in keys and keys <= seen):
+                        instrumentation.log("{} repeats features at offset {}, it seems to ignore '{}'"
+                                            .format(url, offset, offset_param))
+                        return
+                    previous_ends = ends
+                    seen.update(keys)
+
+                yield page
+
+                if not count:
+                    return
+                if count < page_size:
+                    for _, future in pending:
+                        future.cancel()
+                    pending.clear()
+                    page_size = count
+                    next_offset = offset + count
+            instrumentation.log("Stopped paging {} after {} pages".format(url, max_pages))
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def _iter_link_pages(clnt, url, params, max_pages, feedback):
+    """Follows the next links, fetching one page ahead."""
+    request = instrumentation.bind(clnt.request)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(request, url, params, feedback=feedback)
+        page_count = 0
+        while future is not None:
+            page = future.result()
+            page_count += 1
+
+            future = None
+            next_link = _next_link(page)
+            if next_link and page_count >= max_pages:
+                instrumentation.log("Stopped paging {} after {} pages".format(url, max_pages))
+            elif next_link:
+                next_url, next_params = _split_link(clnt.base_url, next_link)
+                future = executor.submit(request, next_url, next_params, feedback=feedback)
+
+            yield page
+
+
+def _page_key(feature):
+    """Identifies a feature by its id, or by its content if it has none."""
+    key = feature_key(feature)
+    if key is None:
+        return geojson.dumps(feature, sort_keys=True)
+
+    return key
+
+
+def _next_link(page):
+    """Returns the next link of a page, as OGC API 'links' or a plain 'next' member."""
+    for link in page.get('links') or []:
+        if link.get('rel') == 'next':
+            return link.get('href')
+
+    return page.get('next')
+
+
+def _split_link(base_url, link):
+    """Splits an absolute next link into the URL extension and its parameters."""
+    parts = urlsplit(link)
+    path = parts.path
+    base_path = urlsplit(base_url).path
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path):]
+
+    return path, dict(parse_qsl(parts.query))
+
+
+class PagedCollection(object):
+    """
+    Pages of an endpoint with the interface of
+    :class:`myfiber.core.geojson.FeatureCollectionReader`.
+    """
+
+    def __init__(self, clnt, url, params=None, feedback=None):
+        """
+        :param clnt: The client to fetch with.
+        :type clnt: myfiber.core.client.Client
+
+        :param url: URL extension for request. Should begin with a slash.
+        :type url: str
+
+        :param params: HTTP GET parameters.
+        :type params: dict
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+        """
+        self.metadata = {}
+        self._clnt = clnt
+        self._url = url
+        self._params = params
+        self._feedback = feedback
+
+    def features(self):
+        """
+        Yields the features of all pages.
+
+        :rtype: generator of dict
+        """
+        return self._clnt.paginate(self._url, self._params, self._feedback, self.metadata)
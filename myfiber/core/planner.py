@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import heapq
+import math
+
+from . import tiling
+from .extent import format_bbox
+from .spatialcache import geometry_bbox
+
+_KM_PER_DEGREE = 111.32
+
+
+def plan(bboxes, request_cost_km2=25.0, max_request_km2=0):
+    """
+    Clusters bboxes into a near-minimal set of request bboxes.
+
+    Every request costs request_cost_km2 plus the area it covers, so two
+    clusters are merged if their union covers less additional area than a
+    request costs. Clusters are merged greedily, the cheapest merge first,
+    until no merge saves anything. Scattered small extents therefore share
+    requests, while extents far apart are still requested on their own.
+
+    :param bboxes: WGS84 bboxes in format of [minx, miny, maxx, maxy]
+    :type bboxes: list of list of float
+
+    :param request_cost_km2: Cost of a request, in square kilometers
+        downloaded needlessly.
+    :type request_cost_km2: float
+
+    :param max_request_km2: Largest request bbox a merge may create, 0 for
+        no limit. Single bboxes larger than that are kept as they are.
+    :type max_request_km2: float
+
+    :returns: request bbox and the indices of the bboxes it covers
+    :rtype: list of (list of float, list of int)
+    """
+    clusters = {}
+    heap = []
+
+    def push_merges(cluster_id):
+        bbox, _, area = clusters[cluster_id]
+        for other_id, (other, _, other_area) in clusters.items():
+            if other_id == cluster_id:
+                continue
+            union = _union(bbox, other)
+            union_area = area_km2(union)
+            saving = request_cost_km2 + area + other_area - union_area
+            if saving > 0 and (not max_request_km2 or union_area <= max_request_km2):
+                heapq.heappush(heap, (-saving, other_id, cluster_id))
+
+    for index, bbox in enumerate(bboxes):
+        clusters[index] = (list(bbox), [index], area_km2(bbox))
+        push_merges(index)
+
+    next_id = len(bboxes)
+    while heap:
+        _, first, second = heapq.heappop(heap)
+        if first not in clusters or second not in clusters:
+            # One of them was merged since
+            continue
+
+        first_bbox, first_members, _ = clusters.pop(first)
+        second_bbox, second_members, _ = clusters.pop(second)
+        union = _union(first_bbox, second_bbox)
+        clusters[next_id] = (union, first_members + second_members, area_km2(union))
+        push_merges(next_id)
+        next_id += 1
+
+    return [(bbox, sorted(members)) for bbox, members, _ in clusters.values()]
+
+
+def fetch(clnt, url, bboxes, planner_config=None, max_workers=4, feedback=None):
+    """
+    Downloads an endpoint for many bboxes with the requests of plan() and
+    distributes the features back to the bboxes.
+
+    A feature is assigned to every bbox of its request which its
+    geometry's bbox intersects. Features without geometry are assigned to
+    all bboxes of their request.
+
+    :param clnt: The client to fetch with.
+    :type clnt: myfiber.core.client.Client
+
+    :param url: URL extension for request. Should begin with a slash.
+    :type url: str
+
+    :param bboxes: WGS84 bboxes in format of [minx, miny, maxx, maxy]
+    :type bboxes: list of list of float
+
+    :param planner_config: The planner section of the config.
+    :type planner_config: dict
+
+    :param max_workers: Number of concurrent requests.
+    :type max_workers: int
+
+    :param feedback: Optional feedback object for progress and cancellation.
+    :type feedback: QgsFeedback
+
+    :returns: one FeatureCollection per bbox
+    :rtype: list of dict
+    """
+    planner_config = planner_config or {}
+    groups = plan(bboxes,
+                  planner_config.get('request_cost_km2', 25.0),
+                  planner_config.get('max_request_km2', 0))
+
+    members_by_param = {}
+    for request_bbox, members in groups:
+        # Nearby requests may round to the same parameter
+        members_by_param.setdefault(format_bbox(request_bbox), []).extend(members)
+
+    collections = [{'type': 'FeatureCollection', 'features': []} for _ in bboxes]
+    mergers = [tiling.FeatureMerger() for _ in bboxes]
+    params_list = [{'bbox': param} for param in members_by_param]
+
+    for params, response in tiling.iter_responses(clnt, url, params_list, max_workers, feedback):
+        members = members_by_param[params['bbox']]
+        for feature in response.get('features', []):
+            feature_bbox = geometry_bbox(feature.get('geometry'))
+            for index in members:
+                if feature_bbox is None or intersects(feature_bbox, bboxes[index]):
+                    collections[index]['features'].extend(mergers[index].merge([feature]))
+
+    return collections
+
+
+def area_km2(bbox):
+    """
+    Approximates the area of a WGS84 bbox.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :rtype: float
+    """
+    latitude = math.radians((bbox[1] + bbox[3]) / 2.0)
+    width = (bbox[2] - bbox[0]) * _KM_PER_DEGREE * math.cos(latitude)
+    height = (bbox[3] - bbox[1]) * _KM_PER_DEGREE
+
+    return max(0.0, width) * max(0.0, height)
+
+
+def intersects(bbox, other):
+    """
+    Checks whether two bboxes intersect, touching edges included.
+
+    :rtype: bool
+    """
+    return bbox[0] <= other[2] and bbox[2] >= other[0] and bbox[1] <= other[3] and bbox[3] >= other[1]
+
+
+def _union(bbox, other):
+    return [min(bbox[0], other[0]), min(bbox[1], other[1]),
+            max(bbox[2], other[2]), max(bbox[3], other[3])]
+
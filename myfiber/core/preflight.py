@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+from collections import namedtuple
+
+from .extent import format_bbox
+
+SINGLE = 'single'
+TILED = 'tiled'
+PAGED = 'paged'
+SUMMARY = 'summary'
+
+# Estimated size of a download. features and size are None if unknown,
+# source is 'head' or 'sample'.
+Estimate = namedtuple('Estimate', ['features', 'size', 'source'])
+
+
+def estimate(clnt, url, bbox, preflight_config, feedback=None):
+    """
+    Estimates the number of features and the size of a download.
+
+    A HEAD request is tried first, in case the API reports the count in a
+    header. Otherwise a small tile in the center of the bbox is downloaded,
+    with all its pages if paging is enabled, and its features are
+    extrapolated to the whole bbox.
+
+    :param clnt: The client to fetch with.
+    :type clnt: myfiber.core.client.Client
+
+    :param url: The endpoint, e.g. '/sites'.
+    :type url: str
+
+    :param bbox: WGS84 bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param preflight_config: The preflight section of the config.
+    :type preflight_config: dict
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :raises ValueError: if sample_fraction isn't between 0 and 1.
+
+    :rtype: Estimate
+    """
+    count_header = preflight_config.get('count_header')
+    if count_header:
+        headers = clnt.head(url, {'bbox': format_bbox(bbox)}, feedback=feedback)
+        if headers is not None and headers.get(count_header, '').isdigit():
+            size = headers.get('Content-Length')
+            return Estimate(int(headers[count_header]),
+                            int(size) if size and size.isdigit() else None,
+                            'head')
+
+    fraction = preflight_config.get('sample_fraction', 1 / 16.0)
+    if not fraction or not 0 < fraction <= 1:
+        raise ValueError("Invalid preflight sample_fraction '{}' in config.yml, expected a share between 0 and 1"
+                         .format(fraction))
+
+    sample = sample_bbox(bbox, fraction)
+    # A single page would cap the count at the page size
+    response = clnt.request_all(url, {'bbox': format_bbox(sample)}, feedback=feedback)
+    features = response.get('features', [])
+
+    return Estimate(int(len(features) / fraction),
+                    int(len(json.dumps(response)) / fraction),
+                    'sample')
+
+
+def sample_bbox(bbox, fraction):
+    """
+    Returns the bbox in the center of a bbox covering a fraction of its area.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param fraction: Share of the area, e.g. 1/16.
+    :type fraction: float
+
+    :rtype: list of float
+    """
+    scale = fraction ** 0.5
+    center_x = (bbox[0] + bbox[2]) / 2.0
+    center_y = (bbox[1] + bbox[3]) / 2.0
+    half_width = (bbox[2] - bbox[0]) * scale / 2.0
+    half_height = (bbox[3] - bbox[1]) * scale / 2.0
+
+    return [center_x - half_width, center_y - half_height, center_x + half_width, center_y + half_height]
+
+
+def choose_strategy(download, preflight_config, paging_enabled=False):
+    """
+    Picks how to load a download of the estimated size.
+
+    :param download: The estimate.
+    :type download: Estimate
+
+    :param preflight_config: The preflight section of the config.
+    :type preflight_config: dict
+
+    :param paging_enabled: Whether the API is configured for paging.
+        Without, downloads above paged_above are tiled.
+    :type paging_enabled: bool
+
+    :returns: SINGLE, TILED, PAGED or SUMMARY
+    :rtype: str
+    """
+    features = download.features or 0
+
+    if preflight_config.get('summary_params') and features > preflight_config.get('summary_above', 500000):
+        return SUMMARY
+    if paging_enabled and preflight_config.get('paged_above') and features > preflight_config['paged_above']:
+        return PAGED
+    if features > preflight_config.get('tiled_above', 20000):
+        return TILED
+
+    return SINGLE
+
+
+def needs_warning(download, preflight_config):
+    """
+    Checks whether a download is large enough to ask the user first.
+
+    :param download: The estimate.
+    :type download: Estimate
+
+    :param preflight_config: The preflight section of the config.
+    :type preflight_config: dict
+
+    :rtype: bool
+    """
+    warn_features = preflight_config.get('warn_above_features')
+    warn_mb = preflight_config.get('warn_above_mb')
+
+    return bool((warn_features and (download.features or 0) > warn_features)
+                or (warn_mb and (download.size or 0) > warn_mb * 1024 * 1024))
@@ -20,83 +20,258 @@ Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
  ***************************************************************************/
 """
 
-from qgis.core import (QgsPoint,
-                       QgsProject,
-                       QgsCoordinateTransform,
-                       QgsCoordinateReferenceSystem
-                       )
-
-from .client import Client
+from . import configmanager, formats, geojson, instrumentation, paging, preflight, snapping, spatialcache, tiling
+from .client import get_client
+from .extent import Extent, format_bbox
 
 
 class RequestBuilder():
-    def __init__(self, url, map_extent, map_epsg):
+    def __init__(self, url, map_extent, map_crs=None, params=None):
         """
         Builds the request from map parameters and user input
 
         :param url: The URL of the endpoint.
         :type url: str
 
-        :param map_extent: Raw map extent from mapCanvas().extent().toString()
-        :type map_extent: str
+        :param map_extent: Map extent, e.g. mapCanvas().extent(), or
+            (xmin, ymin, xmax, ymax) for headless use.
+        :type map_extent: QgsRectangle or tuple or Extent
+
+        :param map_crs: CRS of the extent, as object or authid like
+            'EPSG:3857'. Defaults to WGS84.
+        :type map_crs: QgsCoordinateReferenceSystem or str
 
-        :param map_epsg: CRS ID in format of '<Provider>: <Code>'
-        :type map_epsg: str
+        :param params: HTTP GET parameters added to every request, e.g. the
+            simplification tolerance of :mod:`myfiber.core.lod`.
+        :type params: dict
         """
         self.url = url
-        self.map_extent_raw = map_extent
-        self.map_epsg = map_epsg
+        self.params = params or {}
+        self.extent = Extent.from_value(map_extent, map_crs)
+        # The extent never changes, so it's transformed once
+        self._wgs_bbox = None
 
-    def build_request(self):
+    def build_request(self, feedback=None, stream=False, params=None, strategy=None, use_cache=True):
         """
         Builds the actual request.
 
+        When tiling is enabled in the config, the extent is split into a grid
+        and the tiles are fetched in parallel, see :mod:`myfiber.core.tiling`.
+        When the spatial cache is enabled, only the parts of the extent not
+        covered by earlier requests are fetched. When snapping is enabled,
+        the requested bboxes are expanded to web mercator tiles and the
+        features outside the extent are dropped, see
+        :mod:`myfiber.core.snapping`.
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :param stream: Return a collection whose features are parsed while
+            the response downloads, instead of the parsed response.
+        :type stream: bool
+
+        :param params: Additional HTTP GET parameters, on top of the
+            builder's. Responses filtered by them are not answered from the
+            spatial cache.
+        :type params: dict
+
+        :param strategy: Overrides the tiling and paging config, one of the
+            strategies of :mod:`myfiber.core.preflight`. 'summary' adds the
+            summary_params of the preflight config.
+        :type strategy: str
+
+        :param use_cache: Answer from the response and spatial caches, if
+            enabled. Without, the server's current state is fetched.
+        :type use_cache: bool
+
+        :returns response: API response GeoJSON object, or a collection with
+            features() and metadata when streaming.
+        :rtype: dict or myfiber.core.geojson.FeatureCollectionReader
+        """
+        clnt = get_client() if use_cache else get_client().uncached()
+        config = configmanager.read()
+        extra_params = dict(self.params, **(params or {}))
+        paged = clnt.paging.get('enabled')
+        if strategy is not None:
+            config.setdefault('tiling', {})['enabled'] = strategy == preflight.TILED
+            paged = strategy == preflight.PAGED
+            if strategy == preflight.SUMMARY:
+                extra_params = dict((config.get('preflight') or {}).get('summary_params') or {},
+                                    **extra_params)
+        tiling_config = config.get('tiling') or {}
+        snapped = (config.get('snapping') or {}).get('enabled')
+
+        if (use_cache and (config.get('spatial_cache') or {}).get('enabled') and not extra_params
+                and strategy != preflight.PAGED):
+            # The cache only answers with features intersecting the extent
+            snapped = False
+            response = self._request_spatial_cache(clnt, config, feedback)
+
+        elif tiling_config.get('enabled'):
+            tiles = self._request_bboxes(self._transform_extent(), config)
+            params_list = [dict(extra_params, bbox=self._stringify_bbox(tile)) for tile in tiles]
+
+            response = tiling.fetch_tiles(clnt,
+                                          self.url,
+                                          params_list,
+                                          max_workers=tiling_config['max_workers'],
+                                          feedback=feedback)
+
+        else:
+            params = dict(extra_params)
+
+            request_bbox = self._request_bboxes(self._transform_extent(), config)[0]
+            params['bbox'] = self._stringify_bbox(request_bbox)
+
+            if stream and paged:
+                collection = paging.PagedCollection(clnt, self.url, params, feedback)
+            elif stream:
+                collection = formats.read_collection(
+                    clnt.request(self.url, params, feedback=feedback, stream=True),
+                    (config.get('parsing') or {}).get('lazy_geometry', False))
+            else:
+                collection = None
+
+            if collection is not None:
+                if snapped:
+                    return snapping.ClippedCollection(collection, self._transform_extent())
+                return collection
+
+            if paged:
+                response = {}
+                response['features'] = list(clnt.paginate(self.url, params, feedback, response))
+            else:
+                response = clnt.request(self.url, params, feedback=feedback)
+
+        if snapped:
+            response = dict(response,
+                            features=list(snapping.clip(response.get('features', []), self._transform_extent())))
+
+        if stream:
+            return geojson.StaticCollection(response)
+
+        return response
+
+    def request_params(self):
+        """
+        Returns the HTTP GET parameters of the requests covering the extent,
+        as the tiling and snapping sections of the config split it, e.g. to
+        fetch the requests of several builders at once with
+        :meth:`myfiber.core.client.Client.iter_many`. Snapped responses
+        reach beyond the extent.
+
+        :rtype: list of dict
+        """
+        return [dict(self.params, bbox=self._stringify_bbox(bbox))
+                for bbox in self._request_bboxes(self._transform_extent(), configmanager.read())]
+
+    def bbox_param(self):
+        """
+        Returns the bbox URL parameter of the map extent.
+
+        :returns: Comma separated list in format of minx,miy,maxx,maxy
+        :rtype: str
+        """
+        return self._stringify_extent()
+
+    def _request_spatial_cache(self, clnt, config, feedback=None):
+        """
+        Answers the request from the spatial cache, after fetching the parts
+        of the extent which are not covered yet.
+
+        :param clnt: The client to fetch with.
+        :type clnt: myfiber.core.client.Client
+
+        :param config: The plugin config.
+        :type config: dict
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
         :returns response: API response GeoJSON object
         :rtype: dict
         """
-        clnt = Client()
-        params = dict()
+        spatial_config = config['spatial_cache']
+        tiling_config = config.get('tiling') or {}
+        cache = spatialcache.instance(spatial_config.get('max_features', 500000),
+                                      spatial_config.get('ttl', 600))
 
-        map_extent_string = self._stringify_extent()
-        params['bbox'] = map_extent_string
+        bbox = self._transform_extent()
+        remainder = [request_bbox for rect in cache.uncovered(self.url, bbox)
+                     for request_bbox in self._request_bboxes(rect, config)]
 
-        response = clnt.request(self.url, params)
+        # Snapped parts of the remainder may share tiles
+        bbox_params = sorted(set(self._stringify_bbox(rect) for rect in remainder))
+        params_list = [{'bbox': bbox_param} for bbox_param in bbox_params]
+        for params, response in tiling.iter_responses(clnt,
+                                                      self.url,
+                                                      params_list,
+                                                      max_workers=tiling_config.get('max_workers', 4),
+                                                      feedback=feedback):
+            # Record the coverage as requested, i.e. with rounded coordinates
+            cache.add(self.url, [float(coord) for coord in params['bbox'].split(',')], response)
 
-        return response
+        return cache.query(self.url, bbox)
+
+    def _request_bboxes(self, bbox, config):
+        """
+        Splits a WGS84 bbox into the bboxes to request, as configured by
+        the tiling and snapping sections of the config.
+
+        :param bbox: bbox in format of [minx, miny, maxx, maxy]
+        :type bbox: list of float
+
+        :param config: The plugin config.
+        :type config: dict
+
+        :returns: bboxes covering bbox
+        :rtype: list of list of float
+        """
+        tiling_config = config.get('tiling') or {}
+        snapping_config = config.get('snapping') or {}
+
+        if snapping_config.get('enabled'):
+            zoom = snapping_config.get('zoom', 14)
+            if tiling_config.get('enabled'):
+                return snapping.cells(bbox, zoom, tiling_config['tile_size'])
+            return [snapping.snap_bbox(bbox, zoom)]
+
+        if tiling_config.get('enabled'):
+            return tiling.split_bbox(bbox, tiling_config['tile_size'])
+
+        return [bbox]
 
     def _stringify_extent(self):
         """
-        Transforms the raw map extent string to the bbox URL parameter.
+        Transforms the map extent to the bbox URL parameter.
 
         :returns: Comma separated list in format of minx,miy,maxx,maxy
-        :rtype: list
+        :rtype: str
         """
-        # Get QgsPoints in map CRS
-        extent_points_string = [point.strip() for point in self.map_extent_raw.split(':')]
-        extent_points_string_list = [point.split(',') for point in extent_points_string]
-        extent_points = [QgsPoint(*[float(coord) for coord in coords]) for coords in extent_points_string_list]
+        return self._stringify_bbox(self._transform_extent())
 
-        crs_wgs = QgsCoordinateReferenceSystem(4326)
-        crs_map = QgsCoordinateReferenceSystem(self.map_epsg)
-        xform = QgsCoordinateTransform(crs_map, crs_wgs, QgsProject.instance())
+    def _transform_extent(self):
+        """
+        Transforms the map extent to WGS84 coordinates.
 
-        coords_list = []
-        # Transforms point in place
-        for point in extent_points:
-            point.transform(xform)
-            coords_list.extend([point.x(), point.y()])
+        :returns: bbox in format of [minx, miny, maxx, maxy]
+        :rtype: list of float
+        """
+        if self._wgs_bbox is None:
+            with instrumentation.phase('crs_transform'):
+                self._wgs_bbox = self.extent.to_wgs84().bbox()
 
-        return ','.join([self._format_float(f) for f in coords_list])
+        return list(self._wgs_bbox)
 
-    def _format_float(self, f):
+    def _stringify_bbox(self, bbox):
         """
-        Formats a float to 6 digits.
+        Formats a WGS84 bbox as the bbox URL parameter, quantized outwards
+        to 6 decimals, see :func:`myfiber.core.extent.format_bbox`.
 
-        :param f: float to be converted
-        :type f: float
+        :param bbox: bbox in format of [minx, miny, maxx, maxy]
+        :type bbox: list of float
 
-        :returns: formatted float
+        :returns: Comma separated list in format of minx,miy,maxx,maxy
         :rtype: str
         """
-
-        return ("{}".format(round(float(f), 6)).rstrip("0").rstrip("."))
\ No newline at end of file
+        return format_bbox(bbox)
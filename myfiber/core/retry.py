@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from . import exceptions
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a failed request is retried.
+
+    The policy doesn't sleep itself: callers ask for the delay of the next
+    attempt and wait in whatever way suits them, e.g. time.sleep() in a
+    worker thread or asyncio.sleep() in an event loop.
+    """
+
+    def __init__(self,
+                 statuses=(429, 502, 503, 504),
+                 exception_types=(requests.exceptions.ConnectionError,),
+                 max_retries=5,
+                 backoff_base=0.5,
+                 backoff_max=30,
+                 timeout=60,
+                 budget_ratio=0.2,
+                 budget_max=10):
+        """
+        :param statuses: HTTP status codes which are retried.
+        :type statuses: tuple of int
+
+        :param exception_types: Exceptions of the transport which are retried.
+        :type exception_types: tuple of type
+
+        :param max_retries: Retries per request.
+        :type max_retries: int
+
+        :param backoff_base: Upper bound of the first delay, in seconds.
+            It doubles with every retry.
+        :type backoff_base: float
+
+        :param backoff_max: Cap of the delay between two attempts, in seconds.
+        :type backoff_max: float
+
+        :param timeout: Timeout across all attempts of a request, in seconds.
+        :type timeout: float
+
+        :param budget_ratio: Retries earned per request, per host.
+        :type budget_ratio: float
+
+        :param budget_max: Retries a host's budget can hold.
+        :type budget_max: float
+        """
+        self.statuses = tuple(statuses)
+        self.exception_types = tuple(exception_types)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+
+    @classmethod
+    def from_config(cls, retry_config, timeout=60):
+        """
+        Creates the policy from the retry section of the config.
+
+        :param retry_config: The retry section of the config.
+        :type retry_config: dict
+
+        :param timeout: Timeout across all attempts, if the config has none.
+        :type timeout: float
+
+        :rtype: RetryPolicy
+        """
+        kwargs = {key: retry_config[key]
+                  for key in ('statuses', 'max_retries', 'backoff_base', 'backoff_max',
+                              'timeout', 'budget_ratio', 'budget_max')
+                  if retry_config.get(key) is not None}
+        kwargs.setdefault('timeout', timeout)
+        if retry_config.get('exceptions'):
+            kwargs['exception_types'] = tuple(getattr(requests.exceptions, name)
+                                              for name in retry_config['exceptions'])
+
+        return cls(**kwargs)
+
+    def start(self, host):
+        """
+        Starts tracking the attempts of a new request.
+
+        :param host: Host of the request, which owns the retry budget.
+        :type host: str
+
+        :rtype: RetryState
+        """
+        budget = _budget_for(host, self.budget_ratio, self.budget_max)
+        budget.deposit()
+
+        return RetryState(self, budget)
+
+    def backoff(self, retry_number):
+        """
+        Capped exponential backoff with full jitter.
+
+        :param retry_number: The number of the retry, starting at 1.
+        :type retry_number: int
+
+        :rtype: float
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (retry_number - 1)))
+
+
+class RetryState(object):
+    """Attempts of a single request."""
+
+    def __init__(self, policy, budget):
+        self.policy = policy
+        self.budget = budget
+        self.retries = 0
+        self.started = time.time()
+
+    def retry_status(self, status_code):
+        """
+        Checks whether a response status is retried by the policy.
+
+        :param status_code: HTTP status code.
+        :type status_code: int
+
+        :rtype: bool
+        """
+        return status_code in self.policy.statuses
+
+    def retry_exception(self, exception):
+        """
+        Checks whether a transport exception is retried by the policy.
+
+        :param exception: The raised exception.
+        :type exception: Exception
+
+        :rtype: bool
+        """
+        return isinstance(exception, self.policy.exception_types)
+
+    def next_delay(self, response=None):
+        """
+        Returns the delay before the next attempt and counts the retry.
+
+        A Retry-After header of the response takes precedence over the
+        backoff.
+
+        :param response: The retriable response, if any.
+        :type response: requests.Response
+
+        :raises Timeout: if the next attempt would exceed the timeout.
+
+        :returns: seconds to wait, or None if the request must not be retried
+            because the retries or the host's budget are used up.
+        :rtype: float
+        """
+        if self.retries >= self.policy.max_retries:
+            return None
+
+        delay = None
+        if response is not None:
+            delay = _retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = self.policy.backoff(self.retries + 1)
+
+        if time.time() - self.started + delay > self.policy.timeout:
+            raise exceptions.Timeout()
+
+        if not self.budget.withdraw():
+            return None
+
+        self.retries += 1
+
+        return delay
+
+
+class RetryBudget(object):
+    """
+    Token bucket limiting the retries to a host, shared by all callers.
+
+    Every request earns a fraction of a retry, every retry spends a whole
+    one. When many parallel requests fail at once, only a few of them are
+    retried instead of all of them hammering the host again.
+    """
+
+    def __init__(self, ratio=0.2, maximum=10):
+        """
+        :param ratio: Retries earned per request.
+        :type ratio: float
+
+        :param maximum: Retries the budget can hold.
+        :type maximum: float
+        """
+        self.ratio = ratio
+        self.maximum = maximum
+        self.tokens = maximum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Earns the retries of a request."""
+        with self._lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        Spends a retry.
+
+        :returns: False if the budget is used up.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _budget_for(host, ratio, maximum):
+    """Returns the retry budget of a host."""
+    with _budgets_lock:
+        if host not in _budgets:
+            _budgets[host] = RetryBudget(ratio, maximum)
+
+        return _budgets[host]
+
+
+def _retry_after(value):
+    """
+    Parses a Retry-After header, given in seconds or as HTTP date.
+
+    :rtype: float or None
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+from .spatialcache import geometry_bbox
+
+# Latitude limit of web mercator
+_MAX_LAT = 85.0511287798
+
+# Tile coordinates this close to a tile edge count as on it
+_EDGE_TOLERANCE = 1e-9
+
+
+def tile_range(bbox, zoom):
+    """
+    Returns the web mercator tiles covering a WGS84 bbox.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param zoom: Zoom level of the tile grid.
+    :type zoom: int
+
+    :returns: first and last column and row, rows counted from the north
+    :rtype: tuple of int
+    """
+    count = 2 ** zoom
+    minx, miny, maxx, maxy = bbox
+
+    first_col = int(math.floor(_column(minx, count) + _EDGE_TOLERANCE))
+    last_col = int(math.ceil(_column(maxx, count) - _EDGE_TOLERANCE)) - 1
+    first_row = int(math.floor(_row(maxy, count) + _EDGE_TOLERANCE))
+    last_row = int(math.ceil(_row(miny, count) - _EDGE_TOLERANCE)) - 1
+
+    def clamp(index):
+        return min(count - 1, max(0, index))
+
+    return (clamp(first_col), clamp(first_row),
+            clamp(max(first_col, last_col)), clamp(max(first_row, last_row)))
+
+
+def tile_bbox(col, row, zoom):
+    """
+    Returns the WGS84 bbox of a web mercator tile.
+
+    :param col: Column of the tile.
+    :type col: int
+
+    :param row: Row of the tile, counted from the north.
+    :type row: int
+
+    :param zoom: Zoom level of the tile grid.
+    :type zoom: int
+
+    :returns: bbox in format of [minx, miny, maxx, maxy]
+    :rtype: list of float
+    """
+    count = 2 ** zoom
+
+    return [col * 360.0 / count - 180,
+            _latitude(row + 1, count),
+            (col + 1) * 360.0 / count - 180,
+            _latitude(row, count)]
+
+
+def snap_bbox(bbox, zoom):
+    """
+    Expands a WGS84 bbox to the edges of the web mercator tiles covering it.
+
+    Every extent within the same tiles snaps to the same bbox, so nearby
+    views request the same URL.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param zoom: Zoom level of the tile grid.
+    :type zoom: int
+
+    :rtype: list of float
+    """
+    first_col, first_row, last_col, last_row = tile_range(bbox, zoom)
+    north_west = tile_bbox(first_col, first_row, zoom)
+    south_east = tile_bbox(last_col, last_row, zoom)
+
+    return [north_west[0], south_east[1], south_east[2], north_west[3]]
+
+
+def tiles(bbox, zoom):
+    """
+    Lists the web mercator tiles covering a WGS84 bbox.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param zoom: Zoom level of the tile grid.
+    :type zoom: int
+
+    :returns: bbox of each tile
+    :rtype: list of list of float
+    """
+    first_col, first_row, last_col, last_row = tile_range(bbox, zoom)
+
+    return [tile_bbox(col, row, zoom)
+            for row in range(first_row, last_row + 1)
+            for col in range(first_col, last_col + 1)]
+
+
+def cells(bbox, zoom, tile_size):
+    """
+    Splits a WGS84 bbox into cells of whole web mercator tiles, which are
+    at most tile_size degrees wide and high.
+
+    The cells are blocks of the tile grid, cut to the tiles covering bbox,
+    so the inner cells of nearby views are the same.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param zoom: Zoom level of the tile grid.
+    :type zoom: int
+
+    :param tile_size: Maximum edge length of a cell in degrees.
+    :type tile_size: float
+
+    :raises ValueError: if tile_size isn't positive.
+
+    :returns: bbox of each cell, row by row from the north
+    :rtype: list of list of float
+    """
+    if not tile_size or tile_size <= 0:
+        raise ValueError("Invalid tiling tile_size '{}' in config.yml, expected a positive number of degrees"
+                         .format(tile_size))
+
+    # Tiles are never higher than wide in degrees, so square blocks fit
+    block = max(1, int(tile_size * 2 ** zoom / 360.0))
+    first_col, first_row, last_col, last_row = tile_range(bbox, zoom)
+
+    result = []
+    for block_row in range(first_row // block, last_row // block + 1):
+        top = max(first_row, block_row * block)
+        bottom = min(last_row, (block_row + 1) * block - 1)
+        for block_col in range(first_col // block, last_col // block + 1):
+            left = max(first_col, block_col * block)
+            right = min(last_col, (block_col + 1) * block - 1)
+            north_west = tile_bbox(left, top, zoom)
+            south_east = tile_bbox(right, bottom, zoom)
+            result.append([north_west[0], south_east[1], south_east[2], north_west[3]])
+
+    return result
+
+
+def clip(features, bbox):
+    """
+    Drops the features which don't intersect a bbox. Features without
+    geometry are kept.
+
+    :param features: GeoJSON features.
+    :type features: iterable of dict
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :rtype: generator of dict
+    """
+    minx, miny, maxx, maxy = bbox
+    for feature in features:
+        bounds = geometry_bbox(feature.get('geometry'))
+        if (bounds is None
+                or (bounds[0] <= maxx and bounds[2] >= minx and bounds[1] <= maxy and bounds[3] >= miny)):
+            yield feature
+
+
+class ClippedCollection(object):
+    """
+    A collection restricted to the features intersecting a bbox, with the
+    interface of :class:`myfiber.core.geojson.FeatureCollectionReader`.
+    """
+
+    def __init__(self, collection, bbox):
+        """
+        :param collection: The snapped collection.
+        :type collection: myfiber.core.geojson.FeatureCollectionReader or StaticCollection
+
+        :param bbox: The requested bbox, in format of [minx, miny, maxx, maxy]
+        :type bbox: list of float
+        """
+        self._collection = collection
+        self._bbox = bbox
+
+    @property
+    def metadata(self):
+        return self._collection.metadata
+
+    def features(self):
+        """
+        Yields the features intersecting the bbox.
+
+        :rtype: generator of dict
+        """
+        return clip(self._collection.features(), self._bbox)
+
+
+def _column(lon, count):
+    return (lon + 180.0) / 360.0 * count
+
+
+def _row(lat, count):
+    lat = math.radians(max(-_MAX_LAT, min(_MAX_LAT, lat)))
+
+    return (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * count
+
+
+def _latitude(row, count):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2.0 * row / count))))
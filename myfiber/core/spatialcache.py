@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import threading
+import time
+
+from qgis.core import (QgsFeature,
+                       QgsGeometry,
+                       QgsRectangle,
+                       QgsSpatialIndex
+                       )
+
+from . import geojson
+from .tiling import feature_key
+
+# Remainders thinner than this (in degrees) are rounding artefacts of the
+# 6 decimal bbox parameter and are not fetched.
+_EPSILON = 1e-6
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def instance(max_features=500000, ttl=600):
+    """
+    Returns the process wide spatial cache, creating it on first use.
+
+    :param max_features: Number of cached features per endpoint, before the
+        endpoint's cache is reset.
+    :type max_features: int
+
+    :param ttl: Seconds a fetched extent counts as covered.
+    :type ttl: int
+
+    :rtype: SpatialCache
+    """
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = SpatialCache(max_features, ttl)
+
+    return _instance
+
+
+class SpatialCache(object):
+    """
+    Keeps the features of previous responses per endpoint, together with the
+    WGS84 bboxes they were requested for.
+
+    An extent that is fully covered by earlier requests is answered from
+    memory. Otherwise only the uncovered remainder has to be fetched.
+    """
+
+    def __init__(self, max_features=500000, ttl=600):
+        """
+        :param max_features: Number of cached features per endpoint, before the
+            endpoint's cache is reset.
+        :type max_features: int
+
+        :param ttl: Seconds a fetched extent counts as covered.
+        :type ttl: int
+        """
+        self.max_features = max_features
+        self.ttl = ttl
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def uncovered(self, url, bbox):
+        """
+        Returns the parts of bbox which are not covered by cached responses.
+
+        :param url: The endpoint, e.g. '/sites'.
+        :type url: str
+
+        :param bbox: bbox in format of [minx, miny, maxx, maxy]
+        :type bbox: list of float
+
+        :returns: list of uncovered bboxes, empty if bbox is fully covered
+        :rtype: list of tuple
+        """
+        with self._lock:
+            endpoint = self._endpoints.get(url)
+            if endpoint is None or len(endpoint.features) > self.max_features:
+                # Start over, the whole bbox is fetched again
+                self._endpoints[url] = _EndpointCache()
+                return [tuple(bbox)]
+
+            endpoint.expire(self.ttl)
+            return subtract_bboxes(bbox, [covered for covered, _, _ in endpoint.coverage])
+
+    def add(self, url, bbox, response):
+        """
+        Adds a response and marks its bbox as covered.
+
+        :param url: The endpoint, e.g. '/sites'.
+        :type url: str
+
+        :param bbox: bbox the response was requested for.
+        :type bbox: list of float
+
+        :param response: GeoJSON FeatureCollection.
+        :type response: dict
+        """
+        with self._lock:
+            endpoint = self._endpoints.get(url)
+            if endpoint is None:
+                endpoint = self._endpoints[url] = _EndpointCache()
+
+            endpoint.add(bbox, response)
+
+    def query(self, url, bbox):
+        """
+        Builds a FeatureCollection from cached features intersecting bbox.
+
+        :param url: The endpoint, e.g. '/sites'.
+        :type url: str
+
+        :param bbox: bbox in format of [minx, miny, maxx, maxy]
+        :type bbox: list of float
+
+        :rtype: dict
+        """
+        with self._lock:
+            return self._endpoints[url].query(bbox)
+
+    def clear(self):
+        """Drops all cached features."""
+        with self._lock:
+            self._endpoints.clear()
+
+
+class _EndpointCache(object):
+    """
+    Features and covered bboxes of a single endpoint.
+
+    Every feature remembers the last fetch that returned it. Features are
+    dropped once that fetch expired, or when a later fetch of a bbox
+    containing them didn't return them, i.e. they were deleted on the
+    server. Features without geometry belong to the bbox of their fetch.
+    """
+
+    def __init__(self):
+        self.metadata = {}
+        # (bbox, time, fetch number) of the fetches within the TTL
+        self.coverage = []
+        self.features = {}
+        self.bounds = {}
+        self.ids = {}
+        self.keys = {}
+        self.unlocated = {}
+        self.fetched_by = {}
+        self.fetch_bboxes = {}
+        self.index = QgsSpatialIndex()
+        self._next_id = 0
+        self._next_fetch = 0
+
+    def expire(self, ttl):
+        now = time.time()
+        self.coverage = [entry for entry in self.coverage if now - entry[1] < ttl]
+
+        live = {fetch for _, _, fetch in self.coverage}
+        for fid in [fid for fid, fetch in self.fetched_by.items() if fetch not in live]:
+            self._remove(fid)
+        self.fetch_bboxes = {fetch: bbox for fetch, bbox in self.fetch_bboxes.items() if fetch in live}
+
+    def add(self, bbox, response):
+        bbox = tuple(bbox)
+        fetch = self._next_fetch
+        self._next_fetch += 1
+        self.metadata = {key: value for key, value in response.items() if key != 'features'}
+        self.coverage.append((bbox, time.time(), fetch))
+        self.fetch_bboxes[fetch] = bbox
+
+        returned = set()
+        for feature in response.get('features', []):
+            key = feature_key(feature)
+            if key is None:
+                key = geojson.dumps(feature, sort_keys=True)
+
+            fid = self.ids.get(key)
+            if fid is None:
+                fid = self.ids[key] = self._next_id
+                self.keys[fid] = key
+                self._next_id += 1
+            elif fid in self.bounds:
+                # Replace the old version of the feature in the index
+                self.index.deleteFeature(_index_feature(fid, self.bounds.pop(fid)))
+
+            self.features[fid] = feature
+            self.fetched_by[fid] = fetch
+            self.unlocated.pop(fid, None)
+            returned.add(fid)
+
+            feature_bounds = geometry_bbox(feature.get('geometry'))
+            if feature_bounds is None:
+                self.unlocated[fid] = feature
+            else:
+                self.bounds[fid] = feature_bounds
+                self.index.insertFeature(_index_feature(fid, feature_bounds))
+
+        # Only features entirely within the bbox were certainly requested
+        deleted = [fid for fid in self.index.intersects(QgsRectangle(*bbox))
+                   if fid not in returned and _contains(bbox, self.bounds[fid])]
+        deleted.extend(fid for fid in self.unlocated
+                       if fid not in returned and _contains(bbox, self._fetch_bbox(fid)))
+        for fid in deleted:
+            self._remove(fid)
+
+    def query(self, bbox):
+        collection = dict(self.metadata)
+        fids = self.index.intersects(QgsRectangle(*bbox))
+        collection['features'] = [self.features[fid] for fid in sorted(fids)]
+        collection['features'].extend(feature for fid, feature in self.unlocated.items()
+                                      if _intersects(bbox, self._fetch_bbox(fid)))
+
+        return collection
+
+    def _fetch_bbox(self, fid):
+        """Returns the bbox of the fetch which returned a feature last."""
+        return self.fetch_bboxes[self.fetched_by[fid]]
+
+    def _remove(self, fid):
+        self.features.pop(fid, None)
+        self.unlocated.pop(fid, None)
+        self.fetched_by.pop(fid, None)
+        self.ids.pop(self.keys.pop(fid), None)
+        if fid in self.bounds:
+            self.index.deleteFeature(_index_feature(fid, self.bounds.pop(fid)))
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[2] >= inner[2] and outer[3] >= inner[3])
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _index_feature(fid, bounds):
+    """Creates the feature stub QgsSpatialIndex expects, from a bbox."""
+    feature = QgsFeature(fid)
+    feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(*bounds)))
+
+    return feature
+
+
+def geometry_bbox(geometry):
+    """
+    Computes the bbox of a GeoJSON geometry.
+
+    :param geometry: GeoJSON geometry.
+    :type geometry: dict
+
+    :returns: bbox in format of (minx, miny, maxx, maxy), None for empty geometries
+    :rtype: tuple
+    """
+    if not geometry:
+        return None
+
+    if isinstance(geometry, geojson.RawGeometry):
+        return geometry.bbox()
+
+    if geometry.get('type') == 'GeometryCollection':
+        parts = [geometry_bbox(part) for part in geometry.get('geometries', [])]
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return None
+        return (min(part[0] for part in parts), min(part[1] for part in parts),
+                max(part[2] for part in parts), max(part[3] for part in parts))
+
+    xs = []
+    ys = []
+    stack = [geometry.get('coordinates')]
+    while stack:
+        coords = stack.pop()
+        if not coords:
+            continue
+        if isinstance(coords[0], (int, float)):
+            xs.append(coords[0])
+            ys.append(coords[1])
+        else:
+            stack.extend(coords)
+
+    if not xs:
+        return None
+
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def subtract_bboxes(bbox, others):
+    """
+    Subtracts several bboxes from a bbox.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param others: bboxes to subtract.
+    :type others: list of tuple
+
+    :returns: non-overlapping bboxes covering the remainder
+    :rtype: list of tuple
+    """
+    remainder = [tuple(bbox)]
+    for other in others:
+        remainder = [part for rect in remainder for part in _difference(rect, other)]
+        if not remainder:
+            break
+
+    return [rect for rect in remainder
+            if rect[2] - rect[0] > _EPSILON and rect[3] - rect[1] > _EPSILON]
+
+
+def _difference(rect, other):
+    """Returns up to four bboxes covering rect minus other."""
+    minx, miny, maxx, maxy = rect
+    ominx, ominy, omaxx, omaxy = other
+
+    if ominx >= maxx or omaxx <= minx or ominy >= maxy or omaxy <= miny:
+        return [rect]
+
+    parts = []
+    # Full width bands below and above, then the left and right middle parts
+    if ominy > miny:
+        parts.append((minx, miny, maxx, ominy))
+    if omaxy < maxy:
+        parts.append((minx, omaxy, maxx, maxy))
+    band_miny = max(miny, ominy)
+    band_maxy = min(maxy, omaxy)
+    if ominx > minx:
+        parts.append((minx, band_miny, ominx, band_maxy))
+    if omaxx < maxx:
+        parts.append((omaxx, band_miny, maxx, band_maxy))
+
+    return parts
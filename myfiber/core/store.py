@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os.path
+import sqlite3
+import threading
+from contextlib import closing
+from itertools import islice
+
+from osgeo import ogr, osr
+
+from qgis.core import QgsApplication, QgsVectorLayer
+
+from . import exceptions, geojson, instrumentation, layers
+from .tiling import feature_key
+
+ID_FIELD = 'myfiber_id'
+
+_OGR_FIELD_TYPES = {'bool': ogr.OFTInteger,
+                    'int': ogr.OFTInteger64,
+                    'float': ogr.OFTReal,
+                    'str': ogr.OFTString}
+
+# Python types of the values a field type holds, to widen it with layers.property_type
+_FIELD_VALUE_TYPES = {'bool': {bool},
+                      'int': {int},
+                      'float': {float},
+                      'str': {str}}
+
+# Plain table next to the features, GeoPackage readers ignore it
+_SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS myfiber_sync (
+    endpoint TEXT NOT NULL,
+    extent TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (endpoint, extent)
+)
+"""
+
+# Writers of the same GeoPackage have to take turns
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def default_dir():
+    """
+    Returns the store location in the active QGIS profile.
+
+    :rtype: str
+    """
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'myfiber', 'store')
+
+
+class GeoPackageStore(object):
+    """
+    Persistent GeoPackage with the downloaded features of one endpoint.
+
+    New downloads are upserted by feature id, so loading an endpoint again
+    updates the stored features instead of duplicating them. The table has
+    a spatial index, which QGIS uses for rendering.
+
+    The geometry column is generic and field types are widened when later
+    downloads bring other values, e.g. int -> float -> str, so the first
+    batch doesn't decide what can be stored.
+    """
+
+    def __init__(self, path, table):
+        """
+        :param path: Path to the GeoPackage.
+        :type path: str
+
+        :param table: Name of the table in the GeoPackage.
+        :type table: str
+        """
+        self.path = path
+        self.table = table
+
+        with _locks_lock:
+            self._lock = _locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    @classmethod
+    def for_endpoint(cls, url, directory=None):
+        """
+        Returns the store of an endpoint, e.g. '/sites' -> sites.gpkg.
+
+        :param url: The endpoint.
+        :type url: str
+
+        :param directory: Directory of the GeoPackages. Defaults to the QGIS profile dir.
+        :type directory: str
+
+        :rtype: GeoPackageStore
+        """
+        table = url.strip('/').replace('/', '_')
+
+        return cls(os.path.join(directory or default_dir(), table + '.gpkg'), table)
+
+    @property
+    def uri(self):
+        """
+        The OGR data source of the store's table.
+
+        :rtype: str
+        """
+        return "{}|layername={}".format(self.path, self.table)
+
+    def layer(self, name):
+        """
+        Creates a layer pointing at the store.
+
+        :param name: The layer name.
+        :type name: str
+
+        :rtype: QgsVectorLayer
+        """
+        return QgsVectorLayer(self.uri, name, 'ogr')
+
+    def upsert(self, collection, batch_size=1000, feedback=None, deleted_property=None):
+        """
+        Inserts or replaces the features of a collection by their id, one
+        transaction per batch.
+
+        :param collection: The features to store.
+        :type collection: myfiber.core.geojson.FeatureCollectionReader or StaticCollection
+
+        :param batch_size: Number of features written per transaction.
+        :type batch_size: int
+
+        :param feedback: Optional feedback object to check for cancellation.
+        :type feedback: QgsFeedback
+
+        :param deleted_property: Property flagging features which were deleted
+            on the server. Flagged features are removed from the store.
+        :type deleted_property: str
+
+        :raises StoreError: if the GeoPackage can't be written.
+
+        :returns: number of written features
+        :rtype: int
+        """
+        features = collection.features()
+        count = 0
+
+        with self._lock:
+            data_source = self._open()
+            ogr_layer = data_source.GetLayerByName(self.table)
+
+            with instrumentation.phase('parse'):
+                batch = list(islice(features, batch_size))
+            while batch:
+                if ogr_layer is None:
+                    ogr_layer = self._create_table(data_source)
+                self._add_fields(ogr_layer, batch)
+
+                # An id repeated within the batch, e.g. on overlapping pages,
+                # would violate the unique index. The last one wins.
+                unique = {_store_key(feature): feature for feature in batch}
+
+                with instrumentation.phase('store_write'):
+                    data_source.StartTransaction()
+                    try:
+                        self._delete(data_source, list(unique))
+                        for feature in unique.values():
+                            if deleted_property and (feature.get('properties') or {}).get(deleted_property):
+                                continue
+                            self._insert(ogr_layer, feature)
+                    except Exception:
+                        data_source.RollbackTransaction()
+                        raise
+                    data_source.CommitTransaction()
+
+                count += len(unique)
+                instrumentation.count('features', len(batch))
+                if feedback is not None and feedback.isCanceled():
+                    raise exceptions.Canceled()
+                with instrumentation.phase('parse'):
+                    batch = list(islice(features, batch_size))
+
+            # Closes the GeoPackage
+            data_source = None
+
+        return count
+
+    def create_table(self):
+        """
+        Creates the GeoPackage and its empty table, if they don't exist yet.
+
+        :raises StoreError: if the GeoPackage can't be written.
+        """
+        with self._lock:
+            data_source = self._open()
+            if data_source.GetLayerByName(self.table) is None:
+                self._create_table(data_source)
+            data_source = None
+
+    def delete(self, keys):
+        """
+        Deletes features by id.
+
+        :param keys: The feature ids.
+        :type keys: list
+
+        :raises StoreError: if the GeoPackage can't be written.
+        """
+        with self._lock:
+            data_source = self._open()
+            if data_source.GetLayerByName(self.table) is not None:
+                data_source.StartTransaction()
+                self._delete(data_source, [str(key) for key in keys])
+                data_source.CommitTransaction()
+            data_source = None
+
+    def last_sync(self, extent):
+        """
+        Returns when an extent was last synced.
+
+        :param extent: The bbox URL parameter of the extent.
+        :type extent: str
+
+        :returns: ISO 8601 timestamp, None if the extent was never synced.
+        :rtype: str
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with self._lock, closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            conn.execute(_SYNC_SCHEMA)
+            row = conn.execute("SELECT synced_at FROM myfiber_sync WHERE endpoint = ? AND extent = ?",
+                               (self.table, extent)).fetchone()
+
+        return row[0] if row else None
+
+    def set_last_sync(self, extent, timestamp):
+        """
+        Records when an extent was synced.
+
+        :param extent: The bbox URL parameter of the extent.
+        :type extent: str
+
+        :param timestamp: ISO 8601 timestamp.
+        :type timestamp: str
+        """
+        with self._lock, closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            with conn:
+                conn.execute(_SYNC_SCHEMA)
+                conn.execute("INSERT OR REPLACE INTO myfiber_sync (endpoint, extent, synced_at) VALUES (?, ?, ?)",
+                             (self.table, extent, timestamp))
+
+    def _open(self):
+        """Opens the GeoPackage for writing, creating it if needed."""
+        if os.path.exists(self.path):
+            data_source = ogr.Open(self.path, 1)
+        else:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            data_source = ogr.GetDriverByName('GPKG').CreateDataSource(self.path)
+
+        if data_source is None:
+            raise exceptions.StoreError("Can't open {} for writing".format(self.path))
+
+        return data_source
+
+    def _create_table(self, data_source):
+        """Creates the table with a generic geometry column."""
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+
+        ogr_layer = data_source.CreateLayer(self.table,
+                                            srs,
+                                            ogr.wkbUnknown,
+                                            ['SPATIAL_INDEX=YES', 'FID=fid', 'GEOMETRY_NAME=geom'])
+        if ogr_layer is None:
+            raise exceptions.StoreError("Can't create table {} in {}".format(self.table, self.path))
+
+        ogr_layer.CreateField(ogr.FieldDefn(ID_FIELD, ogr.OFTString))
+        data_source.ExecuteSQL('CREATE UNIQUE INDEX "{0}_{1}" ON "{0}" ("{1}")'.format(self.table, ID_FIELD))
+
+        return ogr_layer
+
+    def _add_fields(self, ogr_layer, features):
+        """
+        Adds fields for properties the table doesn't know yet and widens the
+        fields whose type can't hold the new values.
+        """
+        definition = ogr_layer.GetLayerDefn()
+        existing = {}
+        for i in range(definition.GetFieldCount()):
+            field = definition.GetFieldDefn(i)
+            existing[field.GetName()] = _property_type(field)
+
+        for name, property_type in layers.infer_property_types(features, []).items():
+            if name not in existing:
+                ogr_layer.CreateField(_field(name, property_type))
+                continue
+
+            current = existing[name]
+            if name == ID_FIELD or current is None:
+                continue
+            widened = layers.property_type(_FIELD_VALUE_TYPES[current] | _FIELD_VALUE_TYPES[property_type])
+            if widened != current:
+                index = ogr_layer.GetLayerDefn().GetFieldIndex(name)
+                if ogr_layer.AlterFieldDefn(index, _field(name, widened), ogr.ALTER_TYPE_FLAG) != 0:
+                    raise exceptions.StoreError("Can't change the type of field {} in {}".format(name, self.path))
+
+    def _delete(self, data_source, keys):
+        """Deletes the rows with the given ids, in chunks of 500."""
+        for start in range(0, len(keys), 500):
+            quoted = ','.join("'{}'".format(key.replace("'", "''")) for key in keys[start:start + 500])
+            data_source.ExecuteSQL('DELETE FROM "{}" WHERE "{}" IN ({})'.format(self.table, ID_FIELD, quoted))
+
+    def _insert(self, ogr_layer, feature):
+        """Writes a GeoJSON feature to the table."""
+        definition = ogr_layer.GetLayerDefn()
+        ogr_feature = ogr.Feature(definition)
+        ogr_feature.SetField(ID_FIELD, _store_key(feature))
+
+        for name, value in (feature.get('properties') or {}).items():
+            if value is None or definition.GetFieldIndex(name) < 0:
+                continue
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            ogr_feature.SetField(name, value)
+
+        geometry = feature.get('geometry')
+        geometry_type = ogr_layer.GetGeomType()
+        if geometry and geometry_type != ogr.wkbNone:
+            ogr_geometry = ogr.CreateGeometryFromJson(geojson.dumps(geometry))
+            if ogr_geometry is not None and geometry_type != ogr.wkbUnknown:
+                # Tables of older versions have the type of their first features
+                ogr_geometry = ogr.ForceTo(ogr_geometry, geometry_type)
+            if ogr_geometry is not None:
+                ogr_feature.SetGeometry(ogr_geometry)
+
+        if ogr_layer.CreateFeature(ogr_feature) != 0:
+            raise exceptions.StoreError("Can't write feature {} to {}".format(_store_key(feature), self.path))
+
+
+def _field(name, property_type):
+    """Creates the definition of a field holding a property type."""
+    field = ogr.FieldDefn(name, _OGR_FIELD_TYPES[property_type])
+    if property_type == 'bool':
+        field.SetSubType(ogr.OFSTBoolean)
+
+    return field
+
+
+def _property_type(field):
+    """
+    Returns the property type of a field definition, None if the type is
+    none of the ones the store creates.
+    """
+    if field.GetType() == ogr.OFTInteger and field.GetSubType() == ogr.OFSTBoolean:
+        return 'bool'
+    for property_type, field_type in _OGR_FIELD_TYPES.items():
+        if property_type != 'bool' and field.GetType() == field_type:
+            return property_type
+
+    return None
+
+
+def _store_key(feature):
+    """
+    Returns the id a feature is stored under. Features without an id are
+    identified by a hash of their content.
+    """
+    key = feature_key(feature)
+    if key is None:
+        return hashlib.sha1(geojson.dumps(feature, sort_keys=True).encode('utf-8')).hexdigest()
+
+    return str(key)
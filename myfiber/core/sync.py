@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from datetime import datetime, timedelta, timezone
+
+
+def sync(builder, store, sync_config, feedback=None):
+    """
+    Applies the changes of an extent since its last sync to the store.
+
+    The first sync of an extent is a full download. Later ones only request
+    the features modified since, if the API supports a modified-since
+    parameter. Features flagged as deleted are removed from the store.
+    The caches are bypassed: a cached response would predate the recorded
+    sync time, and the changes in between would never be fetched.
+
+    :param builder: Request builder for the endpoint and extent.
+    :type builder: myfiber.core.request.RequestBuilder
+
+    :param store: The endpoint's store.
+    :type store: myfiber.core.store.GeoPackageStore
+
+    :param sync_config: The sync section of the config.
+    :type sync_config: dict
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :returns: the downloaded collection, exhausted
+    :rtype: myfiber.core.geojson.FeatureCollectionReader
+    """
+    extent = builder.bbox_param()
+    since = store.last_sync(extent)
+    param = sync_config.get('modified_since_param')
+
+    # Overlap the windows a little, in case the clocks differ
+    started = datetime.now(timezone.utc) - timedelta(seconds=sync_config.get('overlap', 60))
+
+    params = {param: since} if since and param else None
+    collection = builder.build_request(feedback, stream=True, params=params, use_cache=False)
+    store.upsert(collection,
+                 feedback=feedback,
+                 deleted_property=sync_config.get('deleted_property'))
+
+    store.set_last_sync(extent, started.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+    return collection
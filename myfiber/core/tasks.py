@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5.QtCore import QCoreApplication, pyqtSignal
+
+from qgis.core import QgsTask, QgsFeedback, QgsFields, QgsWkbTypes
+
+from . import configmanager, exceptions, geojson, instrumentation, layers, lod, preflight, snapping, sync
+from .client import get_client
+from .request import RequestBuilder
+from .store import GeoPackageStore
+from .tiling import FeatureMerger, feature_key
+
+
+class FetchTask(QgsTask):
+    """
+    Downloads an endpoint and builds the vector layer in a background thread.
+
+    The layer is moved to the main thread before the task finishes, so the
+    connected slots can add it to the project right away.
+
+    With preflight enabled, the size of the download is estimated first to
+    pick the loading strategy. Oversized downloads stop after the estimate,
+    finish with needs_confirmation set and emit confirmationNeeded; restart
+    them with the task's strategy once the user agreed.
+    """
+
+    layerReady = pyqtSignal(object)
+    errorOccurred = pyqtSignal(object)
+    confirmationNeeded = pyqtSignal(object)
+
+    def __init__(self, builder, sync=False, strategy=None):
+        """
+        :param builder: Request builder for the endpoint and extent.
+        :type builder: myfiber.core.request.RequestBuilder
+
+        :param sync: Only download the changes since the extent's last sync.
+            Implies the GeoPackage store.
+        :type sync: bool
+
+        :param strategy: Loading strategy of :mod:`myfiber.core.preflight`.
+            Skips the preflight if given.
+        :type strategy: str
+        """
+        QgsTask.__init__(self,
+                         "myfiber: downloading {}".format(builder.url),
+                         QgsTask.CanCancel)
+        self.builder = builder
+        self.sync = sync
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+        self.strategy = strategy
+        self.estimate = None
+        self.needs_confirmation = False
+        self.layer = None
+        self.exception = None
+        # Timing breakdown of the load, see myfiber.core.instrumentation
+        self.trace = instrumentation.Trace(builder.url)
+
+    def run(self):
+        """Performs request, parse and layer build. Runs in a worker thread."""
+        with instrumentation.activate(self.trace):
+            return self._run()
+
+    def _run(self):
+        try:
+            with instrumentation.phase('config'):
+                config = configmanager.read()
+
+            preflight_config = config.get('preflight') or {}
+            if self.strategy is None and not self.sync and preflight_config.get('enabled'):
+                with instrumentation.phase('preflight'):
+                    self.estimate = preflight.estimate(get_client(),
+                                                       self.builder.url,
+                                                       self.builder.extent.to_wgs84().bbox(),
+                                                       preflight_config,
+                                                       self.feedback)
+                self.strategy = preflight.choose_strategy(self.estimate,
+                                                          preflight_config,
+                                                          (config.get('paging') or {}).get('enabled', False))
+                if self.strategy != preflight.SUMMARY and preflight.needs_warning(self.estimate, preflight_config):
+                    # Not a failure, the task is done until the user decides
+                    self.needs_confirmation = True
+                    return True
+
+            # Features are written while the response downloads. Filtered,
+            # e.g. simplified, downloads must not overwrite the stored ones.
+            if self.sync or ((config.get('store') or {}).get('enabled') and not self.builder.params):
+                layer = self._store(config)
+            else:
+                collection = self.builder.build_request(self.feedback, stream=True, strategy=self.strategy)
+                if (config.get('columnar') or {}).get('enabled'):
+                    # Imported on demand, it needs NumPy
+                    from . import columnarprovider
+                    layer = columnarprovider.build_layer(collection, feedback=self.feedback)
+                else:
+                    layer = layers.build_memory_layer(collection, feedback=self.feedback)
+            layer.moveToThread(QCoreApplication.instance().thread())
+            self.layer = layer
+            self.setProgress(100)
+
+        except exceptions.Canceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return True
+
+    def _store(self, config):
+        """
+        Upserts the features into the endpoint's GeoPackage.
+
+        :param config: The plugin config.
+        :type config: dict
+
+        :returns: layer pointing at the GeoPackage
+        :rtype: QgsVectorLayer
+        """
+        store = GeoPackageStore.for_endpoint(self.builder.url,
+                                             (config.get('store') or {}).get('path'))
+        if self.sync:
+            collection = sync.sync(self.builder, store, config.get('sync') or {}, self.feedback)
+        else:
+            collection = self.builder.build_request(self.feedback, stream=True, strategy=self.strategy)
+            store.upsert(collection, feedback=self.feedback)
+
+        title = collection.metadata.get('title', '')
+        layer = store.layer(title)
+        if not layer.isValid():
+            # Nothing was ever stored for this endpoint
+            layer = layers.build_memory_layer(geojson.StaticCollection({}), title)
+
+        return layer
+
+    def cancel(self):
+        """Cancels the task and aborts any pending request or retry."""
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+    def finished(self, result):
+        """Emits the results. Runs in the main thread."""
+        if self.needs_confirmation:
+            self.confirmationNeeded.emit(self)
+        elif result:
+            self.layerReady.emit(self.layer)
+        elif self.exception is not None:
+            self.errorOccurred.emit(self.exception)
+
+
+class LiveFetchTask(QgsTask):
+    """
+    Downloads the newly exposed parts of the canvas for a layer following
+    it, see :class:`myfiber.gui.livemode.LiveMode`.
+
+    Without a layer yet, the task builds it like FetchTask. Otherwise it
+    converts the new features to the layer's fields in the background.
+    Several bboxes, e.g. the strips exposed by a diagonal pan, are fetched
+    concurrently.
+    """
+
+    featuresReady = pyqtSignal(object)
+    errorOccurred = pyqtSignal(object)
+
+    def __init__(self, url, bboxes, layer=None, known_ids=()):
+        """
+        :param url: The URL of the endpoint.
+        :type url: str
+
+        :param bboxes: The WGS84 bboxes to download.
+        :type bboxes: list of list of float
+
+        :param layer: The layer following the canvas, None for the first download.
+        :type layer: QgsVectorLayer
+
+        :param known_ids: Ids of the features which the layer already has.
+        :type known_ids: set
+        """
+        QgsTask.__init__(self,
+                         "myfiber: updating {}".format(url),
+                         QgsTask.CanCancel)
+        self.url = url
+        self.bboxes = bboxes
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+        self.known_ids = frozenset(known_ids)
+
+        # Snapshot of the layer, which may change while the task runs
+        self.fields = QgsFields(layer.fields()) if layer is not None else None
+        self.multi = layer is not None and QgsWkbTypes.isMultiType(layer.wkbType())
+
+        self.layer = None
+        self.features = []
+        self.qgs_features = []
+        self.keys = []
+        self.exception = None
+
+    def run(self):
+        """Downloads and converts the features. Runs in a worker thread."""
+        try:
+            merger = FeatureMerger()
+            merger.seen_ids.update(self.known_ids)
+            metadata = {}
+            if len(self.bboxes) == 1:
+                collection = RequestBuilder(self.url, self.bboxes[0]).build_request(self.feedback, stream=True)
+                self.features.extend(merger.merge(collection.features()))
+                metadata.update(collection.metadata)
+            else:
+                self._fetch_concurrently(merger, metadata)
+            self.keys = [feature_key(feature) for feature in self.features]
+
+            if self.fields is None:
+                layer = layers.build_memory_layer(geojson.StaticCollection(dict(metadata, features=self.features)),
+                                                  feedback=self.feedback)
+                layer.moveToThread(QCoreApplication.instance().thread())
+                self.layer = layer
+            else:
+                for field in layers.infer_fields(self.features, self.fields.names()):
+                    self.fields.append(field)
+                self.qgs_features = layers.to_qgs_features(self.features, self.fields, self.multi)
+
+        except exceptions.Canceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+
+        return True
+
+    def cancel(self):
+        """Cancels the task and aborts any pending request or retry."""
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+    def _fetch_concurrently(self, merger, metadata):
+        """Requests all bboxes at once, keeping the features within them."""
+        jobs = []
+        clip_bboxes = []
+        for bbox in self.bboxes:
+            for params in RequestBuilder(self.url, bbox).request_params():
+                jobs.append((self.url, params))
+                clip_bboxes.append(bbox)
+
+        snapped = (configmanager.read().get('snapping') or {}).get('enabled')
+        for index, response in get_client().iter_many(jobs, feedback=self.feedback):
+            features = response.get('features', [])
+            if snapped:
+                features = snapping.clip(features, clip_bboxes[index])
+            self.features.extend(merger.merge(features))
+            metadata.update((key, value) for key, value in response.items() if key != 'features')
+
+    def finished(self, result):
+        """Emits the results. Runs in the main thread."""
+        if result:
+            self.featuresReady.emit(self)
+        elif self.exception is not None:
+            self.errorOccurred.emit(self.exception)
+
+
+class SimplifyTask(QgsTask):
+    """
+    Simplifies the geometries of a layer for a scale bucket in a background
+    thread, see :class:`myfiber.gui.lodmode.LevelOfDetail`.
+    """
+
+    simplified = pyqtSignal(object)
+
+    def __init__(self, levels, bucket, tolerance):
+        """
+        :param levels: The full detail geometries of the layer.
+        :type levels: myfiber.core.lod.GeometryLevels
+
+        :param bucket: The scale bucket to simplify for.
+        :type bucket: int
+
+        :param tolerance: The bucket's tolerance in degrees.
+        :type tolerance: float
+        """
+        QgsTask.__init__(self,
+                         "myfiber: simplifying geometries",
+                         QgsTask.CanCancel)
+        self.levels = levels
+        self.bucket = bucket
+        self.tolerance = tolerance
+        self.feedback = QgsFeedback()
+        self.geometries = None
+
+    def run(self):
+        """Simplifies the geometries. Runs in a worker thread."""
+        try:
+            self.geometries = lod.simplify(self.levels.full, self.tolerance, self.feedback)
+        except exceptions.Canceled:
+            return False
+
+        return True
+
+    def cancel(self):
+        """Cancels the task."""
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+    def finished(self, result):
+        """Emits the results. Runs in the main thread."""
+        if result:
+            self.simplified.emit(self)
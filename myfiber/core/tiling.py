@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import math
+
+from . import exceptions
+
+
+def split_bbox(bbox, tile_size):
+    """
+    Splits a bbox into a grid of tiles of at most tile_size degrees.
+
+    :param bbox: bbox in format of [minx, miny, maxx, maxy]
+    :type bbox: list of float
+
+    :param tile_size: Maximum edge length of a tile in degrees.
+    :type tile_size: float
+
+    :raises ValueError: if tile_size isn't positive.
+
+    :returns: tiles in format of (minx, miny, maxx, maxy), row by row
+    :rtype: list of tuple
+    """
+    if not tile_size or tile_size <= 0:
+        raise ValueError("Invalid tiling tile_size '{}' in config.yml, expected a positive number of degrees"
+                         .format(tile_size))
+
+    minx, miny, maxx, maxy = bbox
+    cols = max(1, int(math.ceil((maxx - minx) / tile_size)))
+    rows = max(1, int(math.ceil((maxy - miny) / tile_size)))
+    step_x = (maxx - minx) / cols
+    step_y = (maxy - miny) / rows
+
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            # Snap the outer edges to the bbox, so no float gaps appear
+            tiles.append((minx + col * step_x,
+                          miny + row * step_y,
+                          maxx if col == cols - 1 else minx + (col + 1) * step_x,
+                          maxy if row == rows - 1 else miny + (row + 1) * step_y))
+
+    return tiles
+
+
+def fetch_tiles(clnt, url, params_list, max_workers=4, feedback=None):
+    """
+    Fetches all tiles in parallel and merges them into one FeatureCollection.
+
+    :param clnt: Client whose session is shared by all workers.
+    :type clnt: myfiber.core.client.Client
+
+    :param url: URL extension for request. Should begin with a slash.
+    :type url: str
+
+    :param params_list: HTTP GET parameters, one dict per tile.
+    :type params_list: list of dict
+
+    :param max_workers: Number of concurrent requests.
+    :type max_workers: int
+
+    :param feedback: Optional feedback object for progress and cancellation.
+    :type feedback: QgsFeedback
+
+    :returns: merged GeoJSON FeatureCollection
+    :rtype: dict
+    """
+    collection = None
+    features = []
+    merger = FeatureMerger()
+
+    for _, response in iter_responses(clnt, url, params_list, max_workers, feedback):
+        if collection is None:
+            collection = {key: value for key, value in response.items() if key != 'features'}
+            collection['features'] = features
+        features.extend(merger.merge(response.get('features', [])))
+
+    return collection
+
+
+def iter_responses(clnt, url, params_list, max_workers=4, feedback=None):
+    """
+    Fetches requests in parallel and yields the params and responses in
+    completion order.
+
+    Only a window of max_workers requests is in flight at any time and every
+    response is released once it was consumed, so the tiles are never all
+    held in memory at once. The requests go through the client's transport,
+    see :meth:`myfiber.core.client.Client.iter_many`.
+
+    :param clnt: Client whose session is shared by all workers.
+    :type clnt: myfiber.core.client.Client
+
+    :param url: URL extension for request. Should begin with a slash.
+    :type url: str
+
+    :param params_list: HTTP GET parameters, one dict per request.
+    :type params_list: list of dict
+
+    :param max_workers: Number of concurrent requests.
+    :type max_workers: int
+
+    :param feedback: Optional feedback object for progress and cancellation.
+    :type feedback: QgsFeedback
+
+    :rtype: generator of (dict, dict)
+    """
+    total = len(params_list)
+    jobs = [(url, params) for params in params_list]
+
+    for done_count, (index, response) in enumerate(clnt.iter_many(jobs, max_workers, feedback), 1):
+        if feedback is not None:
+            if feedback.isCanceled():
+                raise exceptions.Canceled()
+            feedback.setProgress(100.0 * done_count / total)
+        yield params_list[index], response
+        del response
+
+
+class FeatureMerger(object):
+    """De-duplicates features by their id across several responses."""
+
+    def __init__(self):
+        self.seen_ids = set()
+
+    def merge(self, features):
+        """
+        Yields the features whose id was not seen before.
+
+        Features without an id can't be matched and are always yielded.
+
+        :param features: GeoJSON features.
+        :type features: iterable of dict
+
+        :rtype: generator of dict
+        """
+        for feature in features:
+            feature_id = feature_key(feature)
+            if feature_id is not None:
+                if feature_id in self.seen_ids:
+                    continue
+                self.seen_ids.add(feature_id)
+            yield feature
+
+
+def feature_key(feature):
+    """
+    Returns the identifier of a GeoJSON feature.
+
+    :param feature: GeoJSON feature.
+    :type feature: dict
+
+    :returns: the feature's id, falling back to its 'id' property
+    :rtype: str or int or None
+    """
+    feature_id = feature.get('id')
+    if feature_id is None:
+        feature_id = (feature.get('properties') or {}).get('id')
+
+    return feature_id
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import asyncio
+import functools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import exceptions, instrumentation
+
+_DONE = object()
+
+
+def fetch_many(clnt, jobs, max_concurrency=4, feedback=None, use_async=True):
+    """
+    Fetches several requests concurrently and yields the responses in
+    completion order.
+
+    With aiohttp installed, all requests run on one asyncio event loop.
+    Otherwise, or when the client pages its requests, a bounded thread
+    pool is used. Either way at most max_concurrency requests are in
+    flight and responses are released once they were consumed.
+
+    :param clnt: The client whose config, cache and retry policy are used.
+    :type clnt: myfiber.core.client.Client
+
+    :param jobs: URL extension and HTTP GET parameters per request.
+    :type jobs: list of (str, dict)
+
+    :param max_concurrency: Number of concurrent requests.
+    :type max_concurrency: int
+
+    :param feedback: Optional feedback object to check for cancellation.
+    :type feedback: QgsFeedback
+
+    :param use_async: Use the asyncio transport, if aiohttp is available.
+    :type use_async: bool
+
+    :returns: index of the job and its response
+    :rtype: generator of (int, dict)
+    """
+    if use_async and aiohttp is not None and not clnt.paging.get('enabled'):
+        return _iter_async(clnt, jobs, max_concurrency, feedback)
+
+    return _iter_threaded(clnt, jobs, max_concurrency, feedback)
+
+
+def _iter_threaded(clnt, jobs, max_concurrency, feedback):
+    """Runs the requests on a thread pool, keeping a window of max_concurrency."""
+    pending_jobs = iter(enumerate(jobs))
+    pending = set()
+    request_all = instrumentation.bind(clnt.request_all)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        try:
+            while True:
+                while len(pending) < max_concurrency:
+                    index, job = next(pending_jobs, (None, None))
+                    if job is None:
+                        break
+                    future = executor.submit(request_all, job[0], job[1], feedback=feedback)
+                    future.index = index
+                    pending.add(future)
+
+                if not pending:
+                    return
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.index, future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _iter_async(clnt, jobs, max_concurrency, feedback):
+    """
+    Runs the requests on an event loop in a helper thread and hands the
+    responses over through a bounded queue.
+    """
+    results = queue.Queue(maxsize=max_concurrency)
+    stop = threading.Event()
+
+    loop_thread = threading.Thread(target=instrumentation.bind(_run_loop),
+                                   args=(clnt, jobs, max_concurrency, feedback, results, stop),
+                                   daemon=True)
+    loop_thread.start()
+
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            index, result = item
+            if isinstance(result, Exception):
+                raise result
+            yield index, result
+    finally:
+        stop.set()
+        # Unblock the loop if it waits for queue space
+        while loop_thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _run_loop(clnt, jobs, max_concurrency, feedback, results, stop):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_fetch_all(clnt, jobs, max_concurrency, feedback, results, stop))
+    except Exception as e:
+        # e.g. the session couldn't be created, the consumer must not take
+        # the missing responses for a complete result
+        results.put((None, e))
+    finally:
+        loop.close()
+        results.put(_DONE)
+
+
+async def _fetch_all(clnt, jobs, max_concurrency, feedback, results, stop):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    failed = asyncio.Event()
+    loop = asyncio.get_event_loop()
+
+    async def fetch(index, url, params):
+        async with semaphore:
+            if stop.is_set() or failed.is_set():
+                return
+            try:
+                result = await _fetch(session, clnt, url, params, feedback, stop)
+            except Exception as e:
+                result = e
+            # Blocks while the consumer is behind, without blocking the loop
+            await loop.run_in_executor(None, _put, results, (index, result), stop)
+            if isinstance(result, Exception):
+                failed.set()
+
+    # The client's Accept-Encoding lists what urllib3 decodes, e.g. br or
+    # zstd, aiohttp advertises what it decodes itself
+    headers = {name: value for name, value in clnt.requests_kwargs['headers'].items()
+               if name.lower() != 'accept-encoding'}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        pending = {asyncio.ensure_future(fetch(index, url, params)) for index, (url, params) in enumerate(jobs)}
+        while pending:
+            _, pending = await asyncio.wait(pending, timeout=0.1)
+            # Don't wait for downloads nobody consumes anymore
+            if failed.is_set():
+                await _cancel(pending)
+                return
+            try:
+                _check_stopped(feedback, stop)
+            except exceptions.Canceled:
+                await _cancel(pending)
+                raise
+
+
+async def _fetch(session, clnt, url, params, feedback, stop):
+    """
+    Performs a single GET with the client's cache and retry policy.
+
+    The requests share one thread, so they are reported to the
+    instrumentation without phase timings. The SQLite cache is accessed
+    from the default executor, so it doesn't block the loop.
+    """
+    loop = asyncio.get_event_loop()
+    instrumentation.before_request(url, params)
+    started = time.time()
+    path = clnt._generate_auth_url(url, params)
+    authed_url = clnt.base_url + path
+    cache_key = clnt._cache_key(path)
+
+    cached = None
+    if clnt.cache is not None:
+        cached = await loop.run_in_executor(None, clnt.cache.get, cache_key)
+        if cached is not None and clnt.cache.is_fresh(cached, url):
+            _report(path, started, 200, cached=True, size=len(cached.body))
+            return clnt._from_cache(cached)
+
+    headers = clnt._conditional_headers(cached) if cached is not None else None
+    attempts = clnt.retry_policy.start(urlsplit(clnt.base_url).netloc)
+
+    while True:
+        _check_stopped(feedback, stop)
+
+        try:
+            async with session.get(authed_url, headers=headers) as response:
+                delay = None
+                if attempts.retry_status(response.status):
+                    delay = attempts.next_delay(response)
+
+                if delay is None:
+                    # Errors while the body downloads are retried as well
+                    body = await response.read()
+                    status = response.status
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    content_type = response.headers.get('Content-Type')
+                else:
+                    instrumentation.log('Server responded {}. Retrying for the {}th time.'.format(response.status,
+                                                                                                attempts.retries))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            equivalent = _requests_exception(e)
+            if not attempts.retry_exception(equivalent):
+                if isinstance(equivalent, requests.exceptions.Timeout):
+                    raise exceptions.Timeout()
+                raise
+            delay = attempts.next_delay()
+            if delay is None:
+                raise
+            instrumentation.log('Connection failed: {}. Retrying for the {}th time.'.format(e, attempts.retries))
+
+        if delay is None:
+            break
+        await _sleep(delay, feedback, stop)
+
+    if status == 304 and cached is not None:
+        await loop.run_in_executor(None, clnt.cache.touch, cache_key)
+        _report(path, started, 304, attempts.retries, cached=True, size=len(cached.body))
+        return clnt._from_cache(cached)
+
+    instrumentation.count('bytes_decoded', len(body))
+    _report(path, started, status, attempts.retries, size=len(body))
+
+    if status != 200:
+        try:
+            message = json.loads(body)['msg']
+        except (ValueError, KeyError, TypeError):
+            message = body[:200].decode('utf-8', 'replace')
+        raise exceptions.ApiError(status, message)
+
+    if clnt.cache is not None:
+        await loop.run_in_executor(None, functools.partial(clnt.cache.put, cache_key, body, etag=etag,
+                                                           last_modified=last_modified,
+                                                           content_type=content_type))
+
+    return json.loads(body)
+
+
+def _requests_exception(exception):
+    """
+    Translates an aiohttp exception to its requests counterpart, which the
+    exception types of the retry policy are given as.
+    """
+    if isinstance(exception, asyncio.TimeoutError):
+        return requests.exceptions.ReadTimeout(str(exception))
+    elif isinstance(exception, aiohttp.ClientPayloadError):
+        return requests.exceptions.ChunkedEncodingError(str(exception))
+    elif isinstance(exception, aiohttp.ClientConnectionError):
+        return requests.exceptions.ConnectionError(str(exception))
+
+    return exception
+
+
+async def _cancel(tasks):
+    """Cancels tasks and waits until they are done."""
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def _sleep(seconds, feedback, stop):
+    """Sleeps in small steps, so stopping or a canceled feedback interrupts the pause."""
+    deadline = time.time() + seconds
+    while True:
+        _check_stopped(feedback, stop)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(remaining, 0.1))
+
+
+def _check_stopped(feedback, stop):
+    if stop.is_set() or (feedback is not None and feedback.isCanceled()):
+        raise exceptions.Canceled()
+
+
+def _put(results, item, stop):
+    """Waits for space in the queue, unless the consumer stopped."""
+    while True:
+        try:
+            results.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                return
+
+
+def _report(path, started, status, retries=0, cached=False, size=None):
+    """Hands a finished request to the instrumentation."""
+    instrumentation.after_request({'url': path,
+                                   'status': status,
+                                   'seconds': time.time() - started,
+                                   'retries': retries,
+                                   'cached': cached,
+                                   'bytes': size})
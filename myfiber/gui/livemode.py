@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5.QtCore import QObject, QTimer
+
+from qgis.core import QgsApplication, QgsProject
+
+from myfiber.core import configmanager, layers, tasks
+from myfiber.core.extent import Extent
+from myfiber.core.spatialcache import subtract_bboxes
+
+
+class LiveMode(QObject):
+    """
+    Keeps layers of endpoints in sync with the map canvas.
+
+    After the canvas stopped moving for a moment, the parts of the view
+    which no layer download covered yet are fetched in a background task
+    and appended to the layer. Downloads of areas which scrolled out of
+    view are canceled. They stay pending until their task actually ended,
+    so no second download builds the layer meanwhile.
+    """
+
+    def __init__(self, iface, parent=None):
+        """
+        :param iface: A QGIS interface instance.
+        :type iface: QgisInterface
+        """
+        QObject.__init__(self, parent)
+        self._canvas = iface.mapCanvas()
+        self._push_error = None
+        self._endpoints = {}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.refresh)
+
+        self._canvas.extentsChanged.connect(self._schedule)
+        QgsProject.instance().layerWillBeRemoved.connect(self._layer_removed)
+
+    def follow(self, url, error_slot=None):
+        """
+        Loads an endpoint for the current view and keeps it following the canvas.
+
+        :param url: The URL of the endpoint.
+        :type url: str
+
+        :param error_slot: Called with exceptions raised by the downloads.
+        :type error_slot: callable
+        """
+        self._push_error = error_slot
+        if url not in self._endpoints:
+            self._endpoints[url] = _Endpoint()
+        self.refresh()
+
+    def stop(self):
+        """Stops following the canvas and cancels all downloads."""
+        self._timer.stop()
+        for endpoint in self._endpoints.values():
+            for task, _ in endpoint.pending:
+                task.cancel()
+        self._endpoints.clear()
+
+    def unload(self):
+        """Disconnects from the canvas and the project."""
+        self.stop()
+        self._canvas.extentsChanged.disconnect(self._schedule)
+        QgsProject.instance().layerWillBeRemoved.disconnect(self._layer_removed)
+
+    def refresh(self):
+        """Downloads the uncovered parts of the view for every endpoint."""
+        if not self._endpoints:
+            return
+
+        view = Extent.from_value(self._canvas.extent(),
+                                 self._canvas.mapSettings().destinationCrs()).to_wgs84().bbox()
+
+        for url, endpoint in self._endpoints.items():
+            for task, bboxes in endpoint.pending:
+                if not task.isCanceled() and not any(_intersects(bbox, view) for bbox in bboxes):
+                    # Scrolled out of view before it finished
+                    task.cancel()
+
+            requested = endpoint.coverage + [bbox for task, bboxes in endpoint.pending if not task.isCanceled()
+                                             for bbox in bboxes]
+            remainder = [list(rect) for rect in subtract_bboxes(view, requested)]
+            if not remainder or (endpoint.layer is None and endpoint.pending):
+                continue
+
+            task = tasks.LiveFetchTask(url, remainder, endpoint.layer, endpoint.ids)
+            endpoint.pending.append((task, remainder))
+            task.featuresReady.connect(lambda task, endpoint=endpoint: self._add_features(endpoint, task))
+            task.errorOccurred.connect(self._report_error)
+            task.taskCompleted.connect(lambda endpoint=endpoint, task=task: self._forget(endpoint, task))
+            task.taskTerminated.connect(lambda endpoint=endpoint, task=task: self._ended(endpoint, task))
+            QgsApplication.taskManager().addTask(task)
+
+    def _schedule(self):
+        """Restarts the debounce timer, the canvas is still moving."""
+        if self._endpoints:
+            self._timer.start((configmanager.read().get('live') or {}).get('debounce_ms', 500))
+
+    def _add_features(self, endpoint, task):
+        """
+        Appends the downloaded features to the endpoint's layer.
+
+        :param endpoint: The endpoint state.
+        :type endpoint: _Endpoint
+
+        :param task: The finished task.
+        :type task: myfiber.core.tasks.LiveFetchTask
+        """
+        self._forget(endpoint, task)
+        if endpoint not in self._endpoints.values():
+            return
+        endpoint.coverage.extend(task.bboxes)
+
+        if task.layer is not None:
+            endpoint.layer = task.layer
+            QgsProject.instance().addMapLayer(task.layer)
+            endpoint.ids.update(key for key in task.keys if key is not None)
+            return
+
+        layer = endpoint.layer
+        new_fields = [field for field in task.fields if layer.fields().indexOf(field.name()) < 0]
+        if new_fields:
+            layer.dataProvider().addAttributes(new_fields)
+            layer.updateFields()
+
+        if any(key in endpoint.ids for key in task.keys if key is not None):
+            # Another download delivered some of the features meanwhile
+            features = [feature for feature, key in zip(task.features, task.keys)
+                        if key is None or key not in endpoint.ids]
+            qgs_features = layers.to_qgs_features(features, layer.fields(), task.multi) if features else []
+        elif task.fields.names() != layer.fields().names():
+            # Fields were added by another download in a different order
+            qgs_features = [_remap(qgs_feature, task.fields, layer.fields()) for qgs_feature in task.qgs_features]
+        else:
+            qgs_features = task.qgs_features
+
+        if qgs_features:
+            layer.dataProvider().addFeatures(qgs_features)
+            layer.updateExtents()
+            layer.triggerRepaint()
+        endpoint.ids.update(key for key in task.keys if key is not None)
+
+    def _forget(self, endpoint, task):
+        """Drops a finished or canceled task from the pending downloads."""
+        endpoint.pending = [(pending, bboxes) for pending, bboxes in endpoint.pending if pending is not task]
+
+    def _ended(self, endpoint, task):
+        """
+        Drops a canceled or failed task. A first download which was canceled
+        held back the next one, which is scheduled now.
+        """
+        self._forget(endpoint, task)
+        if task.isCanceled() and endpoint.layer is None and endpoint in self._endpoints.values():
+            self._schedule()
+
+    def _report_error(self, e):
+        """Hands a download error to the error slot."""
+        if self._push_error is not None:
+            self._push_error(e)
+
+    def _layer_removed(self, layer_id):
+        """Stops following the canvas for removed layers."""
+        for url, endpoint in list(self._endpoints.items()):
+            if endpoint.layer is not None and endpoint.layer.id() == layer_id:
+                for task, _ in endpoint.pending:
+                    task.cancel()
+                del self._endpoints[url]
+
+
+class _Endpoint(object):
+    """Layer and downloaded areas of an endpoint following the canvas."""
+
+    def __init__(self):
+        self.layer = None
+        self.coverage = []
+        self.pending = []
+        self.ids = set()
+
+
+def _intersects(bbox, other):
+    return bbox[0] < other[2] and bbox[2] > other[0] and bbox[1] < other[3] and bbox[3] > other[1]
+
+
+def _remap(qgs_feature, source_fields, fields):
+    """Reorders the attributes of a feature to another set of fields."""
+    values = dict(zip(source_fields.names(), qgs_feature.attributes()))
+    qgs_feature.setFields(fields, True)
+    for name, value in values.items():
+        qgs_feature.setAttribute(name, value)
+
+    return qgs_feature
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from PyQt5.QtCore import QObject, QTimer
+
+from qgis.core import QgsApplication, QgsProject, QgsWkbTypes
+
+from myfiber.core import configmanager, lod, request, tasks
+
+
+class LevelOfDetail(QObject):
+    """
+    Swaps the geometries of endpoint layers for the map scale.
+
+    Scales are grouped into buckets, see :func:`myfiber.core.lod.scale_bucket`.
+    If the API simplifies on request, a layer is downloaded again with the
+    tolerance of the new bucket and replaces the old one. Otherwise the full
+    detail geometries are kept and simplified locally, once per bucket, in a
+    background task.
+    """
+
+    def __init__(self, iface, parent=None):
+        """
+        :param iface: A QGIS interface instance.
+        :type iface: QgisInterface
+        """
+        QObject.__init__(self, parent)
+        self._canvas = iface.mapCanvas()
+        self._push_error = None
+        self._layers = {}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.refresh)
+
+        self._canvas.scaleChanged.connect(self._schedule)
+        QgsProject.instance().layerWillBeRemoved.connect(self._layer_removed)
+
+    def params(self, url):
+        """
+        Returns the simplification parameter to download an endpoint at the
+        current scale.
+
+        :param url: The URL of the endpoint.
+        :type url: str
+
+        :returns: HTTP GET parameters, None for full detail or if the API
+            doesn't simplify
+        :rtype: dict
+        """
+        lod_config = self._config(url)
+        if lod_config is None or not lod_config.get('simplify_param'):
+            return None
+
+        tolerance = lod.bucket_tolerance(self._bucket(), lod_config)
+        if not tolerance:
+            return None
+
+        return {lod_config['simplify_param']: lod.tolerance_param(tolerance)}
+
+    def manage(self, layer, builder, error_slot=None, strategy=None):
+        """
+        Keeps the geometries of a downloaded layer in line with the map scale.
+
+        Locally, only memory layers are simplified, the GeoPackage store
+        keeps its full detail geometries.
+
+        :param layer: The layer on the map.
+        :type layer: QgsVectorLayer
+
+        :param builder: The request builder the layer was downloaded with.
+        :type builder: myfiber.core.request.RequestBuilder
+
+        :param error_slot: Called with exceptions raised by the downloads.
+        :type error_slot: callable
+
+        :param strategy: The loading strategy the layer was downloaded with,
+            see :mod:`myfiber.core.preflight`.
+        :type strategy: str
+        """
+        lod_config = self._config(builder.url)
+        if lod_config is None or layer.geometryType() not in (QgsWkbTypes.LineGeometry,
+                                                              QgsWkbTypes.PolygonGeometry):
+            return
+
+        self._push_error = error_slot
+        if lod_config.get('simplify_param'):
+            self._layers[layer.id()] = _Managed(layer, builder, strategy=strategy)
+        elif layer.providerType() == 'memory':
+            managed = _Managed(layer, builder, lod.GeometryLevels(layer), strategy)
+            self._layers[layer.id()] = managed
+            self._simplify(managed, self._bucket(), lod_config)
+
+    def stop(self):
+        """Releases all layers and cancels pending work."""
+        self._timer.stop()
+        for managed in self._layers.values():
+            if managed.task is not None:
+                managed.task.cancel()
+        self._layers.clear()
+
+    def unload(self):
+        """Disconnects from the canvas and the project."""
+        self.stop()
+        self._canvas.scaleChanged.disconnect(self._schedule)
+        QgsProject.instance().layerWillBeRemoved.disconnect(self._layer_removed)
+
+    def refresh(self):
+        """Updates every layer whose geometries don't match the scale anymore."""
+        bucket = self._bucket()
+        for managed in list(self._layers.values()):
+            lod_config = self._config(managed.builder.url)
+            if lod_config is None:
+                continue
+
+            if managed.levels is not None:
+                self._simplify(managed, bucket, lod_config)
+                continue
+
+            params = self.params(managed.builder.url) or {}
+            if params != managed.builder.params:
+                self._download(managed, params)
+
+    def _schedule(self):
+        """Restarts the debounce timer, the canvas is still zooming."""
+        if self._layers:
+            self._timer.start((configmanager.read().get('lod') or {}).get('debounce_ms', 500))
+
+    def _simplify(self, managed, bucket, lod_config):
+        """
+        Applies the geometries of a bucket, simplifying them first if needed.
+
+        :param managed: The layer state.
+        :type managed: _Managed
+
+        :param bucket: The scale bucket.
+        :type bucket: int
+
+        :param lod_config: The lod section of the config.
+        :type lod_config: dict
+        """
+        if managed.bucket == bucket:
+            return
+        if managed.task is not None:
+            managed.task.cancel()
+            managed.task = None
+
+        tolerance = lod.bucket_tolerance(bucket, lod_config)
+        geometries = managed.levels.get(bucket, tolerance)
+        if geometries is not None:
+            self._apply(managed, bucket, geometries)
+            return
+
+        task = tasks.SimplifyTask(managed.levels, bucket, tolerance)
+        managed.task = task
+        task.simplified.connect(lambda task: self._simplified(managed, task))
+        QgsApplication.taskManager().addTask(task)
+
+    def _simplified(self, managed, task):
+        """Caches the geometries of a finished task and applies them."""
+        managed.levels.put(task.bucket, task.geometries)
+        if managed.task is task:
+            managed.task = None
+            self._apply(managed, task.bucket, task.geometries)
+
+    def _apply(self, managed, bucket, geometries):
+        """Replaces the geometries of a layer, unless it was edited or removed meanwhile."""
+        layer = managed.layer
+        if layer.id() not in self._layers or layer.isEditable():
+            return
+
+        layer.dataProvider().changeGeometryValues(geometries)
+        layer.triggerRepaint()
+        managed.bucket = bucket
+
+    def _download(self, managed, params, strategy=None):
+        """
+        Downloads the layer's extent again with other simplification params.
+
+        :param managed: The layer state.
+        :type managed: _Managed
+
+        :param params: The simplification params, empty for full detail.
+        :type params: dict
+
+        :param strategy: Loading strategy, defaults to the layer's.
+        :type strategy: str
+        """
+        if managed.task is not None:
+            managed.task.cancel()
+
+        builder = request.RequestBuilder(managed.builder.url, managed.builder.extent, params=params)
+        task = tasks.FetchTask(builder, strategy=strategy or managed.strategy)
+        managed.task = task
+        task.layerReady.connect(lambda layer: self._swap(managed, task, layer))
+        task.errorOccurred.connect(self._report_error)
+        # The extent was downloaded before, so an oversized level goes ahead
+        # with the estimate's strategy instead of asking again
+        task.confirmationNeeded.connect(lambda task: self._download(managed, params, task.strategy))
+        QgsApplication.taskManager().addTask(task)
+
+    def _swap(self, managed, task, layer):
+        """
+        Replaces a layer by its download at another level of detail, with
+        the old layer's name, style and position in the layer tree.
+
+        :param managed: The layer state.
+        :type managed: _Managed
+
+        :param task: The finished download.
+        :type task: myfiber.core.tasks.FetchTask
+
+        :param layer: The downloaded layer.
+        :type layer: QgsVectorLayer
+        """
+        old = managed.layer
+        if managed.task is not task or old.id() not in self._layers:
+            return
+        managed.task = None
+
+        layer.setName(old.name())
+        layer.setRenderer(old.renderer().clone())
+
+        del self._layers[old.id()]
+        managed.layer = layer
+        managed.builder = task.builder
+        self._layers[layer.id()] = managed
+
+        project = QgsProject.instance()
+        node = project.layerTreeRoot().findLayer(old.id())
+        if node is None:
+            project.addMapLayer(layer)
+        else:
+            parent = node.parent()
+            project.addMapLayer(layer, False)
+            parent.insertLayer(parent.children().index(node), layer)
+        project.removeMapLayer(old.id())
+
+    def _report_error(self, e):
+        """Hands a download error to the error slot."""
+        if self._push_error is not None:
+            self._push_error(e)
+
+    def _layer_removed(self, layer_id):
+        """Releases removed layers."""
+        managed = self._layers.pop(layer_id, None)
+        if managed is not None and managed.task is not None:
+            managed.task.cancel()
+
+    def _bucket(self):
+        return lod.scale_bucket(self._canvas.scale())
+
+    def _config(self, url):
+        """Returns the lod section of the config if it applies to an endpoint."""
+        lod_config = configmanager.read().get('lod') or {}
+        if not lod_config.get('enabled') or url not in (lod_config.get('endpoints') or []):
+            return None
+
+        return lod_config
+
+
+class _Managed(object):
+    """A layer following the map scale."""
+
+    def __init__(self, layer, builder, levels=None, strategy=None):
+        self.layer = layer
+        self.builder = builder
+        self.strategy = strategy
+        # Full detail and simplified geometries, if simplified locally
+        self.levels = levels
+        self.bucket = None
+        self.task = None
@@ -21,20 +21,27 @@ Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
 """
 
 import os.path
-import json
+import time
 
 from PyQt5.QtWidgets import (QAction,
                              QDialog,
+                             QMessageBox,
                              QRadioButton
                              )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon, QPixmap
 
-from qgis.core import QgsVectorLayer, QgsProject
+from qgis.core import QgsApplication, QgsProject
 
 from myfiber import ICON_DIR
 from myfiber.gui import myfiberDialogUI
-from myfiber.core import request, configmanager, exceptions
+from myfiber.gui.livemode import LiveMode
+from myfiber.gui.lodmode import LevelOfDetail
+from myfiber.core import request, configmanager, exceptions, instrumentation, preflight, tasks
+
+_STRATEGY_NAMES = {preflight.SINGLE: 'in one request',
+                   preflight.TILED: 'tile by tile',
+                   preflight.PAGED: 'page by page'}
 
 
 class myfiberDialogMain(QDialog):
@@ -54,6 +61,9 @@ class myfiberDialogMain(QDialog):
         self.ui.setupUi(self)
 
         self._iface = iface
+        self._tasks = []
+        self._live = LiveMode(iface, self)
+        self._lod = LevelOfDetail(iface, self)
 
         # Programmtically invoke logo
         logo = QPixmap(os.path.join(ICON_DIR, "logo-correlate.svg"))
@@ -76,6 +86,9 @@ class myfiberDialogMain(QDialog):
         # API key text line
         self.ui.key_text.textChanged.connect(self._keywriter)
 
+        # Multi-select of APIs
+        self.ui.multi_check.toggled.connect(self._toggle_multi)
+
     def initGui(self):
         """Gets called when QGIS UI starts up"""
         self.action = QAction(QIcon(os.path.join(ICON_DIR, 'icon_plugin.svg')),
@@ -90,6 +103,10 @@ class myfiberDialogMain(QDialog):
 
     def unload(self):
         """Gets called when plugin is deactivated"""
+        for task in list(self._tasks):
+            task.cancel()
+        self._live.unload()
+        self._lod.unload()
         self._iface.removePluginMenu('&' + self.plugin_name, self.action)
         self._iface.removeToolBarIcon(self.action)
 
@@ -97,39 +114,174 @@ class myfiberDialogMain(QDialog):
         """When you click the plugin icon"""
         self.show()
         result = self.exec_()
-        # If OK is clicked, it queries the API
+        # If OK is clicked, it queries the API in a background task
         if result:
             try:
-                # Iterate through all widgets in api_group container and get only the checked radio button
+                # Iterate through all widgets in api_group container and get only the checked radio buttons.
+                # Each API gets its own task, the task manager runs them concurrently.
                 for widget in self.ui.api_group.children(): # api_group is the name of the Qt group
                     if isinstance(widget, QRadioButton):
                         if widget.isChecked():
                             # Get map extent
-                            extent_raw = self._iface.mapCanvas().extent().toString()
-                            map_epsg = self._iface.mapCanvas().mapSettings().destinationCrs().authid()
+                            map_extent = self._iface.mapCanvas().extent()
+                            map_crs = self._iface.mapCanvas().mapSettings().destinationCrs()
 
-                            # Perform request
+                            # Perform request off the GUI thread
                             url = self.CONFIG['apis'][widget.objectName()]
-                            response = request.RequestBuilder(url, extent_raw, map_epsg).build_request()
-
-                            # Add layer to map
-                            layer = QgsVectorLayer(json.dumps(response), response['title'], "ogr")
-                            QgsProject.instance().addMapLayer(layer)
-
-            except exceptions.Timeout:
-                self._iface.messageBar().pushCritical('Time out',
-                                                      'The connection exceeded the '
-                                                      'timeout limit of 60 seconds')
-
-            except exceptions.ApiError as e:
-                self._iface.messageBar().pushCritical("{}: ".format(type(e)),
-                                                      "{}".format(str(e)))
+                            if self.ui.live_check.isChecked():
+                                self._live.follow(url, self._push_error)
+                                continue
+                            sync = self.ui.sync_check.isChecked()
+                            # Simplified on the server for the current scale, if configured
+                            params = None if sync else self._lod.params(url)
+                            builder = request.RequestBuilder(url, map_extent, map_crs, params)
+                            self._start_task(tasks.FetchTask(builder, sync=sync))
 
             except Exception:
                 raise
             finally:
                 self.close()
 
+    def _start_task(self, task):
+        """
+        Connects the task's signals and hands it to the QGIS task manager.
+
+        :param task: The task to run.
+        :type task: QgsTask
+        """
+        # Keep a reference, otherwise the task gets garbage collected
+        self._tasks.append(task)
+        task.layerReady.connect(lambda layer: self._loaded(task, layer))
+        task.errorOccurred.connect(self._push_error)
+        task.errorOccurred.connect(lambda e: self._report(task.trace))
+        task.confirmationNeeded.connect(self._confirm_download)
+        task.taskCompleted.connect(lambda: self._tasks.remove(task))
+        task.taskTerminated.connect(lambda: self._tasks.remove(task))
+
+        QgsApplication.taskManager().addTask(task)
+
+    def _loaded(self, task, layer):
+        """
+        Adds the layer of a finished task to the map and hands it to the
+        level of detail, unless it was synced.
+
+        :param task: The finished task.
+        :type task: myfiber.core.tasks.FetchTask
+
+        :param layer: The layer built by the task.
+        :type layer: QgsVectorLayer
+        """
+        layer = self._add_layer(layer, task.trace)
+        if not task.sync:
+            self._lod.manage(layer, task.builder, self._push_error, task.strategy)
+
+    def _add_layer(self, layer, trace=None):
+        """
+        Adds a downloaded layer to the map. Layers of the GeoPackage store
+        which are already loaded are refreshed instead.
+
+        :param layer: The layer built by the task.
+        :type layer: QgsVectorLayer
+
+        :param trace: Timings of the task, completed with the render time.
+        :type trace: myfiber.core.instrumentation.Trace
+
+        :returns: the layer on the map
+        :rtype: QgsVectorLayer
+        """
+        if trace is not None:
+            self._report_after_render(trace)
+
+        for existing in QgsProject.instance().mapLayers().values():
+            if existing.providerType() == 'ogr' and existing.source() == layer.source():
+                existing.reload()
+                existing.triggerRepaint()
+                return existing
+
+        QgsProject.instance().addMapLayer(layer)
+
+        return layer
+
+    def _report_after_render(self, trace):
+        """
+        Reports a trace once the canvas finished rendering.
+
+        :param trace: Timings of the task.
+        :type trace: myfiber.core.instrumentation.Trace
+        """
+        canvas = self._iface.mapCanvas()
+        started = time.perf_counter()
+
+        def rendered():
+            canvas.mapCanvasRefreshed.disconnect(rendered)
+            trace.add_time('render', time.perf_counter() - started)
+            self._report(trace)
+
+        canvas.mapCanvasRefreshed.connect(rendered)
+
+    def _report(self, trace):
+        """
+        Logs the timing breakdown of a task, if enabled in the config.
+
+        :param trace: Timings of the task.
+        :type trace: myfiber.core.instrumentation.Trace
+        """
+        trace.finish()
+        instrumentation.report(trace, configmanager.read().get('instrumentation') or {})
+
+    def _confirm_download(self, task):
+        """
+        Asks whether an oversized download should go ahead, and restarts it
+        with the strategy picked by the preflight.
+
+        :param task: The task which stopped after the preflight.
+        :type task: myfiber.core.tasks.FetchTask
+        """
+        size = ''
+        if task.estimate.size:
+            size = ", about {:.0f} MB".format(task.estimate.size / 1024.0 / 1024.0)
+        answer = QMessageBox.question(self,
+                                      'Large download',
+                                      "{} will return about {} features{}. "
+                                      "Download them {}?".format(task.builder.url,
+                                                                 task.estimate.features,
+                                                                 size,
+                                                                 _STRATEGY_NAMES[task.strategy]),
+                                      QMessageBox.Yes | QMessageBox.No,
+                                      QMessageBox.No)
+        if answer == QMessageBox.Yes:
+            self._start_task(tasks.FetchTask(task.builder, sync=task.sync, strategy=task.strategy))
+
+    def _push_error(self, e):
+        """
+        Reports an exception raised in a task to the message bar.
+
+        :param e: The exception.
+        :type e: Exception
+        """
+        if isinstance(e, exceptions.Timeout):
+            self._iface.messageBar().pushCritical('Time out',
+                                                  'The connection exceeded the '
+                                                  'timeout limit of 60 seconds')
+        else:
+            self._iface.messageBar().pushCritical("{}: ".format(type(e)),
+                                                  "{}".format(str(e)))
+
+    def _toggle_multi(self, checked):
+        """
+        Lets several API radio buttons be checked at once.
+
+        :param checked: Whether multi-select is enabled.
+        :type checked: bool
+        """
+        if not checked:
+            # Keep only the first checked API
+            checked_buttons = [button for button in self.ui.api_group_2.buttons() if button.isChecked()]
+            for button in checked_buttons[1:]:
+                button.setChecked(False)
+
+        self.ui.api_group_2.setExclusive(not checked)
+
     def _keywriter(self):
         """
         Writes key to text file when api key text field changes.
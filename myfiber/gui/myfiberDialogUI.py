@@ -12,7 +12,7 @@ class Ui_Dialog(object):
     def setupUi(self, Dialog):
         Dialog.setObjectName("Dialog")
         Dialog.setWindowModality(QtCore.Qt.WindowModal)
-        Dialog.resize(337, 305)
+        Dialog.resize(337, 410)
         self.verticalLayout = QtWidgets.QVBoxLayout(Dialog)
         self.verticalLayout.setObjectName("verticalLayout")
         self.header_pic = QtWidgets.QLabel(Dialog)
@@ -47,6 +47,20 @@ class Ui_Dialog(object):
         self.api_group_2.addButton(self.regions_radio)
         self.verticalLayout_3.addWidget(self.regions_radio)
         self.verticalLayout.addWidget(self.api_group)
+        self.options_group = QtWidgets.QGroupBox(Dialog)
+        self.options_group.setObjectName("options_group")
+        self.verticalLayout_4 = QtWidgets.QVBoxLayout(self.options_group)
+        self.verticalLayout_4.setObjectName("verticalLayout_4")
+        self.multi_check = QtWidgets.QCheckBox(self.options_group)
+        self.multi_check.setObjectName("multi_check")
+        self.verticalLayout_4.addWidget(self.multi_check)
+        self.sync_check = QtWidgets.QCheckBox(self.options_group)
+        self.sync_check.setObjectName("sync_check")
+        self.verticalLayout_4.addWidget(self.sync_check)
+        self.live_check = QtWidgets.QCheckBox(self.options_group)
+        self.live_check.setObjectName("live_check")
+        self.verticalLayout_4.addWidget(self.live_check)
+        self.verticalLayout.addWidget(self.options_group)
         self.buttonBox = QtWidgets.QDialogButtonBox(Dialog)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.Cancel|QtWidgets.QDialogButtonBox.Ok)
@@ -66,4 +80,11 @@ class Ui_Dialog(object):
         self.sites_radio.setText(_translate("Dialog", "Query sites"))
         self.locations_radio.setText(_translate("Dialog", "Query locations"))
         self.regions_radio.setText(_translate("Dialog", "Query regions"))
+        self.options_group.setTitle(_translate("Dialog", "Options"))
+        self.multi_check.setToolTip(_translate("Dialog", "Select several APIs, which are downloaded at the same time"))
+        self.multi_check.setText(_translate("Dialog", "Query several APIs at once"))
+        self.sync_check.setToolTip(_translate("Dialog", "Only download features changed since the last download of the same extent"))
+        self.sync_check.setText(_translate("Dialog", "Only download changes since last sync"))
+        self.live_check.setToolTip(_translate("Dialog", "Keep the layers updated while panning and zooming the map"))
+        self.live_check.setText(_translate("Dialog", "Follow the map canvas"))
 
@@ -20,7 +20,11 @@ Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
  ***************************************************************************/
 """
 
+from qgis.core import QgsApplication
+
+from .core import configmanager
 from .gui import myfiberDialog
+from .processing.provider import MyfiberProvider
 
 
 class myfiber():
@@ -36,11 +40,26 @@ class myfiber():
         :type iface: QgsInterface
         """
         self.dialog = myfiberDialog.myfiberDialogMain(iface)
+        self.provider = None
+
+    def initProcessing(self):
+        """Registers the Processing algorithms, also when QGIS runs without GUI."""
+        if self.provider is None:
+            self.provider = MyfiberProvider()
+            QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
 
+        self.initProcessing()
+        if (configmanager.read().get('columnar') or {}).get('enabled'):
+            # Imported on demand, it needs NumPy
+            from .core import columnarprovider
+            columnarprovider.register()
         self.dialog.initGui()
         
     def unload(self):
-        self.dialog.unload()
\ No newline at end of file
+        self.dialog.unload()
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
\ No newline at end of file
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.core import (QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsFeature,
+                       QgsFeatureSink,
+                       QgsFields,
+                       QgsGeometry,
+                       QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingMultiStepFeedback,
+                       QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingUtils,
+                       QgsSpatialIndex,
+                       QgsWkbTypes
+                       )
+
+from myfiber.core import configmanager, crs, exceptions, layers, planner, tiling
+from myfiber.core.client import get_client
+from myfiber.core.extent import format_bbox
+
+
+class DownloadAlgorithm(QgsProcessingAlgorithm):
+    """
+    Downloads an endpoint for every feature of an input layer.
+
+    The bboxes of the input features are clustered into few requests, see
+    :func:`myfiber.core.planner.plan`, which run concurrently through the
+    client. Every downloaded feature is then written once per input
+    feature it intersects, with the input feature's attributes.
+    """
+
+    INPUT = 'INPUT'
+    PARALLELISM = 'PARALLELISM'
+    OUTPUT = 'OUTPUT'
+
+    def __init__(self, url):
+        """
+        :param url: The URL of the endpoint.
+        :type url: str
+        """
+        QgsProcessingAlgorithm.__init__(self)
+        self._url = url
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT,
+                                                              'Input layer',
+                                                              [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterNumber(self.PARALLELISM,
+                                                       'Concurrent downloads',
+                                                       defaultValue=4,
+                                                       minValue=1))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self._url.strip('/').capitalize()))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+        parallelism = self.parameterAsInt(parameters, self.PARALLELISM, context)
+        multi_feedback = QgsProcessingMultiStepFeedback(3, feedback)
+
+        # Input geometries in WGS84, the CRS of the API
+        transform = QgsCoordinateTransform(source.sourceCrs(),
+                                           QgsCoordinateReferenceSystem(crs.WGS84),
+                                           context.transformContext())
+        index = QgsSpatialIndex()
+        inputs = {}
+        geometries = {}
+        bboxes = []
+        step = 100.0 / source.featureCount() if source.featureCount() else 0
+        for count, feature in enumerate(source.getFeatures(), 1):
+            if multi_feedback.isCanceled():
+                return {}
+            multi_feedback.setProgress(count * step)
+            if not feature.hasGeometry():
+                continue
+            geometry = QgsGeometry(feature.geometry())
+            geometry.transform(transform)
+            feature.setGeometry(geometry)
+            inputs[feature.id()] = feature
+            geometries[feature.id()] = geometry
+            index.addFeature(feature)
+            rect = geometry.boundingBox()
+            bboxes.append([rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()])
+
+        planner_config = configmanager.read().get('planner') or {}
+        groups = planner.plan(bboxes,
+                              planner_config.get('request_cost_km2', 25.0),
+                              planner_config.get('max_request_km2', 0))
+        feedback.pushInfo("{} input features, {} requests".format(len(inputs), len(groups)))
+
+        multi_feedback.setCurrentStep(1)
+        features = []
+        merger = tiling.FeatureMerger()
+        params_list = [{'bbox': format_bbox(bbox)} for bbox, _ in groups]
+        try:
+            for _, response in tiling.iter_responses(get_client(), self._url, params_list, parallelism, multi_feedback):
+                features.extend(merger.merge(response.get('features', [])))
+        except exceptions.Canceled:
+            return {}
+        except (exceptions.ApiError, exceptions.Timeout) as e:
+            raise QgsProcessingException("{}: {}".format(self._url, e))
+
+        multi_feedback.setCurrentStep(2)
+        downloaded_fields = QgsFields()
+        for field in layers.infer_fields(features, []):
+            downloaded_fields.append(field)
+        fields = QgsProcessingUtils.combineFields(downloaded_fields, source.fields())
+        wkb_type = QgsWkbTypes.parseType(layers.layer_type(features))
+
+        sink, dest_id = self.parameterAsSink(parameters,
+                                             self.OUTPUT,
+                                             context,
+                                             fields,
+                                             wkb_type,
+                                             QgsCoordinateReferenceSystem(crs.WGS84))
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        # Prepared lazily, only inputs with candidates need one
+        engines = {}
+        qgs_features = layers.to_qgs_features(features, downloaded_fields, QgsWkbTypes.isMultiType(wkb_type))
+        for count, qgs_feature in enumerate(qgs_features, 1):
+            if multi_feedback.isCanceled():
+                break
+            multi_feedback.setProgress(100.0 * count / len(qgs_features))
+
+            geometry = qgs_feature.geometry()
+            for fid in index.intersects(geometry.boundingBox()):
+                if fid not in engines:
+                    engines[fid] = QgsGeometry.createGeometryEngine(geometries[fid].constGet())
+                    engines[fid].prepareGeometry()
+                if not engines[fid].intersects(geometry.constGet()):
+                    continue
+
+                output = QgsFeature(fields)
+                output.setGeometry(geometry)
+                output.setAttributes(qgs_feature.attributes() + inputs[fid].attributes())
+                sink.addFeature(output, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
+
+    def name(self):
+        return 'download_' + self._url.strip('/').replace('/', '_')
+
+    def displayName(self):
+        return 'Download {} per feature'.format(self._url)
+
+    def shortHelpString(self):
+        return ("Downloads {} for the extent of every input polygon. Nearby extents share "
+                "requests. Each downloaded feature is written once per input feature it "
+                "intersects, together with that feature's attributes.".format(self._url))
+
+    def createInstance(self):
+        return DownloadAlgorithm(self._url)
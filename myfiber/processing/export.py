@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os.path
+
+from qgis.core import (QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingException,
+                       QgsProcessingMultiStepFeedback,
+                       QgsProcessingOutputNumber,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterFolderDestination,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterString
+                       )
+
+from myfiber.core import configmanager, exceptions, export
+
+
+class ExportAlgorithm(QgsProcessingAlgorithm):
+    """
+    Downloads endpoints for a list of extents or the extents of polygons
+    and streams them to one file per endpoint, see :func:`myfiber.core.export.export`.
+    """
+
+    ENDPOINTS = 'ENDPOINTS'
+    EXTENTS = 'EXTENTS'
+    REGIONS = 'REGIONS'
+    FORMAT = 'FORMAT'
+    PARALLELISM = 'PARALLELISM'
+    OUTPUT = 'OUTPUT'
+    FEATURES = 'FEATURES'
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterEnum(self.ENDPOINTS,
+                                                     'Endpoints',
+                                                     options=self._endpoints(),
+                                                     allowMultiple=True))
+        self.addParameter(QgsProcessingParameterString(self.EXTENTS,
+                                                       'Extents in EPSG:4326 (xmin,ymin,xmax,ymax; ...)',
+                                                       multiLine=True,
+                                                       optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.REGIONS,
+                                                              'Regions',
+                                                              [QgsProcessing.TypeVectorPolygon],
+                                                              optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.FORMAT,
+                                                     'Output format',
+                                                     options=list(export.FORMATS),
+                                                     defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.PARALLELISM,
+                                                       'Concurrent downloads',
+                                                       defaultValue=4,
+                                                       minValue=1))
+        self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT, 'Output folder'))
+        self.addOutput(QgsProcessingOutputNumber(self.FEATURES, 'Written features'))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        endpoints = self._endpoints()
+        urls = [endpoints[index] for index in self.parameterAsEnums(parameters, self.ENDPOINTS, context)]
+        output_format = export.FORMATS[self.parameterAsEnum(parameters, self.FORMAT, context)]
+        parallelism = self.parameterAsInt(parameters, self.PARALLELISM, context)
+        directory = self.parameterAsString(parameters, self.OUTPUT, context)
+
+        try:
+            extents = export.parse_extents(self.parameterAsString(parameters, self.EXTENTS, context))
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        regions = self.parameterAsSource(parameters, self.REGIONS, context)
+        if regions is not None:
+            extents.extend(export.region_extents(regions.getFeatures(), regions.sourceCrs()))
+        if not extents:
+            raise QgsProcessingException("No extents, enter some or choose a regions layer")
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        multi_feedback = QgsProcessingMultiStepFeedback(len(urls), feedback)
+        count = 0
+        for step, url in enumerate(urls):
+            multi_feedback.setCurrentStep(step)
+            path = export.output_path(directory, url, output_format)
+            try:
+                written = export.export(url, extents, path, output_format, parallelism, multi_feedback)
+            except exceptions.Canceled:
+                break
+            except (exceptions.ApiError, exceptions.Timeout, exceptions.StoreError) as e:
+                raise QgsProcessingException("{}: {}".format(url, e))
+            feedback.pushInfo("{} features of {} written to {}".format(written, url, path))
+            count += written
+
+        return {self.OUTPUT: directory, self.FEATURES: count}
+
+    def _endpoints(self):
+        """The endpoints of the apis section of the config."""
+        return list((configmanager.read().get('apis') or {}).values())
+
+    def name(self):
+        return 'export'
+
+    def displayName(self):
+        return 'Export endpoints by extents'
+
+    def shortHelpString(self):
+        return ("Downloads the selected endpoints for a list of extents and/or the extents of "
+                "the regions' polygons and writes one file per endpoint to the output folder. "
+                "Features of overlapping extents are written once.")
+
+    def createInstance(self):
+        return ExportAlgorithm()
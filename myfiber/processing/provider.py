@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os.path
+
+from PyQt5.QtGui import QIcon
+
+from qgis.core import QgsProcessingProvider
+
+from myfiber import ICON_DIR
+from myfiber.core import configmanager
+from myfiber.processing.download import DownloadAlgorithm
+from myfiber.processing.export import ExportAlgorithm
+
+
+class MyfiberProvider(QgsProcessingProvider):
+    """
+    Processing provider with the myfiber algorithms: the export and a
+    download per feature algorithm for every endpoint in the apis section
+    of the config.
+    """
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(ExportAlgorithm())
+        for url in sorted(set((configmanager.read().get('apis') or {}).values())):
+            self.addAlgorithm(DownloadAlgorithm(url))
+
+    def id(self):
+        return 'myfiber'
+
+    def name(self):
+        return 'myfiber'
+
+    def icon(self):
+        return QIcon(os.path.join(ICON_DIR, 'icon_plugin.svg'))
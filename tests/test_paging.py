@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ noegig
+                                 A QGIS plugin
+Downloads GeoJSONs from the APIs at https://api.noegig.at/v1.2/doc#/.
+                              -------------------
+        begin                : 2018-11-22
+        copyright            : (C) 2018 by corRelate GmbH
+        email                : hello@correlate.at
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import unittest
+from unittest import mock
+
+from myfiber.core import paging
+
+
+class _OffsetServer(object):
+    """Client stand-in serving total features in pages of at most cap."""
+
+    def __init__(self, total, cap=1000, ignore_offset=False):
+        self.total = total
+        self.cap = cap
+        self.ignore_offset = ignore_offset
+        self.requests = 0
+
+    def request(self, url, params, feedback=None):
+        self.requests += 1
+        offset = 0 if self.ignore_offset else params['offset']
+        end = min(offset + min(params['limit'], self.cap), self.total)
+
+        return {'type': 'FeatureCollection',
+                'features': [{'type': 'Feature', 'id': i, 'geometry': None, 'properties': {}}
+                             for i in range(offset, end)]}
+
+
+def _ids(server, **paging_config):
+    pages = paging.iter_pages(server, '/sites', {}, dict({'page_size': 100, 'prefetch': 3}, **paging_config))
+
+    return [feature['id'] for page in pages for feature in page['features']]
+
+
+@mock.patch.object(paging.instrumentation, 'log')
+class OffsetPagingTest(unittest.TestCase):
+
+    def test_pages_until_empty_page(self, log):
+        self.assertEqual(_ids(_OffsetServer(250)), list(range(250)))
+        log.assert_not_called()
+
+    def test_server_capping_the_limit(self, log):
+        self.assertEqual(_ids(_OffsetServer(250, cap=40)), list(range(250)))
+
+    def test_server_ignoring_the_offset(self, log):
+        server = _OffsetServer(250, ignore_offset=True)
+
+        self.assertEqual(_ids(server), list(range(100)))
+        self.assertLessEqual(server.requests, 4)
+        log.assert_called_once()
+
+    def test_max_pages(self, log):
+        self.assertEqual(_ids(_OffsetServer(1000), max_pages=3), list(range(300)))
+        log.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()